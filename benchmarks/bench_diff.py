@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: v1.3.0 set-based compare_snapshots vs dirpoll.diff.
+
+Snapshots are synthesized in memory (100 entries per directory) at
+10k, 100k and 1M entries, with 0%, 1% and 50% of the mtimes changed.
+The new snapshot never shares chunks with the old one, as after a full
+(non-incremental) scan.
+
+  python3 benchmarks/bench_diff.py [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll.diff import compare, iter_changes
+from dirpoll.snapshot import DirChunk, Snapshot
+
+PER_DIR = 100
+
+
+def legacy_compare(old, new):
+    """
+    The original compare_snapshots of v1.3.0.
+    """
+    added   = set(new) - set(old)
+    removed = set(old) - set(new)
+    modified= {k for k in (set(old) & set(new)) if old[k] != new[k]}
+    return added, removed, modified
+
+
+def make_pair(n, rate, rnd):
+    names = tuple(f"file{i}.dat" for i in range(PER_DIR))
+    isdir = bytes(PER_DIR)
+    old, new = Snapshot(), Snapshot()
+    for d in range(n // PER_DIR):
+        rel_dir = f"d{d % 100}/s{d}/"
+        mtime = array('q', (10**18 + i for i in range(PER_DIR)))
+        size = array('q', bytes(8 * PER_DIR))
+        ino = array('Q', range(d * PER_DIR, (d + 1) * PER_DIR))
+        changed = array('q', mtime)
+        if rate:
+            for i in range(PER_DIR):
+                if rnd.random() < rate:
+                    changed[i] += 10**9
+        old.add_chunk("/base", rel_dir, DirChunk(names, isdir, mtime, size, ino, array('q', mtime)))
+        new.add_chunk("/base", rel_dir, DirChunk(names, isdir, changed, array('q', size),
+                                                 array('Q', ino), array('q', mtime)))
+    return old, new
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    args = ap.parse_args()
+    rnd = random.Random(0)
+
+    print(f"{'entries':>8} {'change':>6} {'legacy':>10} {'compare':>10} {'1st event':>10}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        for rate in (0.0, 0.01, 0.5):
+            old, new = make_pair(n, rate, rnd)
+            dold, dnew = old.to_dict(), new.to_dict()
+            t_old, (_, _, m_old) = timed(lambda: legacy_compare(dold, dnew))
+            t_new, (_, _, m_new) = timed(lambda: compare(old, new))
+            assert len(m_old) == len(m_new)
+            # time to learn whether anything changed at all
+            t_any, _ = timed(lambda: next(iter_changes(old, new), None))
+            print(f"{n:8d} {rate:6.0%} {t_old * 1000:8.1f}ms {t_new * 1000:8.1f}ms "
+                  f"{t_any * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: per-entry fnmatch filtering vs dirpoll.filters.PathFilter.
+
+  python3 benchmarks/bench_filters.py [--names N] [--patterns N]
+"""
+
+import argparse
+import fnmatch
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll.filters import compile_filter
+from treegen import make_patterns
+
+
+def legacy_match(name, includes, excludes):
+    """
+    The original _filter_match of v1.3.0.
+    """
+    if includes and not any(fnmatch.fnmatch(name, pat) for pat in includes):
+        return False
+    if excludes and any(fnmatch.fnmatch(name, pat) for pat in excludes):
+        return False
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--names", type=int, default=200000)
+    ap.add_argument("--patterns", type=int, default=40)
+    args = ap.parse_args()
+
+    rnd = random.Random(0)
+    names = [f"d{rnd.randrange(100)}/s{rnd.randrange(100)}/file{i}.{rnd.choice(['c', 'log', 'dat', 'ext3'])}"
+             for i in range(args.names)]
+    excludes = make_patterns(args.patterns)
+
+    t0 = time.perf_counter()
+    old = [legacy_match(n, [], excludes) for n in names]
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    match = compile_filter([], excludes).match
+    new = [match(n) for n in names]
+    t_new = time.perf_counter() - t0
+
+    assert old == new, "filters disagree"
+    print(f"{args.names} names x {args.patterns} exclude patterns")
+    print(f"fnmatch loop   {args.names / t_old:12.0f} names/s")
+    print(f"compiled       {args.names / t_new:12.0f} names/s  speedup x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
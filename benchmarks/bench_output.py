@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: time the scan loop spends emitting N events.
+
+  • sync     – one logging.info() per event (v1.3.0),
+  • pipeline – EventPipeline.submit() with a LogSink; the writer thread
+               time until everything is on disk is reported separately.
+
+Logs go to a file (and to /dev/null as a stand-in for stdout).
+
+  python3 benchmarks/bench_output.py [--events 200000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll.diff import ADDED
+from dirpoll.output import EventPipeline, LogSink
+
+
+def format_event(kind, base, rel, src=None):
+    typ = "DIR" if rel.endswith("/") else "FILE"
+    return f"[{base}] +Added   {typ}: {rel.rstrip('/')}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--events", type=int, default=200000)
+    args = ap.parse_args()
+    events = [(ADDED, "/base", f"d{i % 100}/file{i}.dat") for i in range(args.events)]
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as null:
+        logger = logging.getLogger("bench")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        fmt = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+        for h in (logging.StreamHandler(null), logging.FileHandler(os.path.join(tmp, "log"))):
+            h.setFormatter(fmt)
+            logger.addHandler(h)
+
+        t0 = time.perf_counter()
+        for kind, base, rel in events:
+            typ = "DIR" if rel.endswith("/") else "FILE"
+            logger.info(f"[{base}] +Added   {typ}: {rel.rstrip('/')}")
+        t_sync = time.perf_counter() - t0
+
+        pipe = EventPipeline([LogSink(format_event, logger)], maxsize=len(events))
+        t0 = time.perf_counter()
+        pipe.submit(events)
+        t_submit = time.perf_counter() - t0
+        pipe.close()
+        t_total = time.perf_counter() - t0
+
+    print(f"{args.events} events")
+    print(f"  sync logging.info     {t_sync * 1000:8.1f} ms in the scan loop")
+    print(f"  pipeline submit       {t_submit * 1000:8.1f} ms in the scan loop "
+          f"({t_total * 1000:.1f} ms until written)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: ParallelScanner scaling at 1, 2, 4 and 8 workers.
+
+Cold-cache numbers need root (writes /proc/sys/vm/drop_caches before
+each run); without it only warm-cache numbers are printed.
+
+  python3 benchmarks/bench_parallel.py [--dirs N] [--files N] [--root DIR]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll import scanner
+from dirpoll.parallel import ParallelScanner
+from treegen import make_flat_tree
+
+
+def drop_caches():
+    """
+    Flush the page/dentry/inode caches. Returns False when not permitted.
+    """
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as fh:
+            fh.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def run(root, workers_list, cold):
+    reference = scanner.scan([root], True, False).to_dict()
+    for workers in workers_list:
+        with ParallelScanner(workers) as ps:
+            if cold and not drop_caches():
+                print("cold cache: not permitted (needs root), skipped")
+                return
+            if not cold:
+                ps.scan([root], True, False)   # warm-up
+            t0 = time.perf_counter()
+            snap = ps.scan([root], True, False)
+            dt = time.perf_counter() - t0
+        assert snap.to_dict() == reference, "snapshots differ"
+        print(f"{'cold' if cold else 'warm'} workers={workers}  {dt * 1000:8.1f} ms  "
+              f"{len(snap) / dt:10.0f} entries/s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--dirs", type=int, default=2000)
+    ap.add_argument("--files", type=int, default=100000)
+    ap.add_argument("--root", help="scan an existing tree instead of a synthetic one")
+    args = ap.parse_args()
+    workers_list = (1, 2, 4, 8)
+
+    if args.root:
+        for cold in (True, False):
+            run(args.root, workers_list, cold)
+        return
+    with tempfile.TemporaryDirectory(prefix="dirpoll-bench-") as tmp:
+        make_flat_tree(Path(tmp), args.dirs, args.files)
+        for cold in (True, False):
+            run(tmp, workers_list, cold)
+
+
+if __name__ == "__main__":
+    main()
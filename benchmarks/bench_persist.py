@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: save/load time of the dirpoll.persist state file.
+
+Snapshots are synthesized in memory (100 entries per directory, every
+name distinct) at 10k, 100k and 1M entries. For reference, the v1.3.0
+dict form is round-tripped through pickle.
+
+  python3 benchmarks/bench_persist.py [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll import persist
+from dirpoll.snapshot import DirChunk, Snapshot
+
+PER_DIR = 100
+
+
+def make_snapshot(n):
+    snap = Snapshot()
+    for d in range(n // PER_DIR):
+        rel_dir = f"d{d % 100}/s{d}/"
+        names = tuple(f"file{d}_{i}.dat" for i in range(PER_DIR))
+        mtime = array('q', (10**18 + i for i in range(PER_DIR)))
+        size = array('q', range(PER_DIR))
+        ino = array('Q', range(d * PER_DIR, (d + 1) * PER_DIR))
+        snap.add_chunk("/base", rel_dir, DirChunk(names, bytes(PER_DIR), mtime, size,
+                                                  ino, array('q', mtime)))
+    return snap
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    args = ap.parse_args()
+    settings = persist.settings_of(["/base"], True, False, [], [])
+
+    print(f"{'entries':>8} {'size':>8} {'save':>9} {'load':>9} {'pickle load':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.bin")
+        pkl = os.path.join(tmp, "state.pkl")
+        for n in (int(x) for x in args.sizes.split(",")):
+            snap = make_snapshot(n)
+            t_save, _ = timed(lambda: persist.save(path, snap, settings))
+            t_load, (loaded, _, _) = timed(lambda: persist.load(path, settings))
+            assert len(loaded) == n
+            with open(pkl, "wb") as fh:
+                pickle.dump(snap.to_dict(), fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+            def load_pickle():
+                with open(pkl, "rb") as fh:
+                    return pickle.load(fh)
+            t_pkl, _ = timed(load_pickle)
+            mib = os.path.getsize(path) / 2**20
+            print(f"{n:8d} {mib:6.1f}MB {t_save * 1000:7.1f}ms {t_load * 1000:7.1f}ms "
+                  f"{t_pkl * 1000:10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: os.walk/Path scan (v1.3.0) vs dirpoll.scanner (os.scandir).
+
+Builds a synthetic tree in a temporary directory, checks that both
+implementations return the same snapshot and prints entries/second.
+
+  python3 benchmarks/bench_scan.py [--dirs N] [--files N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll import scanner
+from treegen import best_of, make_flat_tree
+
+
+def legacy_scan(bases, recursive, include_hidden):
+    """
+    The original os.walk + Path.stat implementation of scan_dirs
+    (without filters), kept here as the reference.
+    """
+    snapshot = {}
+    for base in bases:
+        base = base.resolve()
+        if recursive:
+            for root, dirs, files in os.walk(base):
+                if not include_hidden:
+                    dirs[:]  = [d for d in dirs  if not d.startswith('.')]
+                    files[:] = [f for f in files if not f.startswith('.')]
+                for d in dirs:
+                    full = Path(root) / d
+                    rel = full.relative_to(base).as_posix() + '/'
+                    snapshot[f"{base}|{rel}"] = full.stat().st_mtime
+                for f in files:
+                    full = Path(root) / f
+                    rel = full.relative_to(base).as_posix()
+                    snapshot[f"{base}|{rel}"] = full.stat().st_mtime
+        else:
+            for child in base.iterdir():
+                name = child.name
+                if not include_hidden and name.startswith('.'):
+                    continue
+                rel = name + ('/' if child.is_dir() else '')
+                snapshot[f"{base}|{rel}"] = child.stat().st_mtime
+    return snapshot
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--dirs", type=int, default=1000)
+    ap.add_argument("--files", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dirpoll-bench-") as tmp:
+        root = Path(tmp)
+        make_flat_tree(root, args.dirs, args.files)
+        bases = [root]
+        for recursive in (True, False):
+            for hidden in (False, True):
+                t_old, old = best_of(lambda: legacy_scan(bases, recursive, hidden), args.repeat)
+                t_new, new = best_of(lambda: scanner.scan(bases, recursive, hidden), args.repeat)
+                assert old == new.to_dict(), "snapshots differ"
+                n = len(new)
+                print(f"recursive={recursive!s:5} hidden={hidden!s:5} entries={n:7d}  "
+                      f"legacy {n / t_old:10.0f}/s  scandir {n / t_new:10.0f}/s  "
+                      f"speedup x{t_old / t_new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: fixed-interval incremental polling vs AdaptiveScheduler.
+
+One file of a 64-subtree tree is rewritten every `--period` seconds for
+`--seconds` seconds; the rest of the tree stays quiet. Reported: stat
+calls (directories checked + files re-stated) and the mean latency
+between a write and the poll that reports it.
+
+  python3 benchmarks/bench_schedule.py [--files 20000] [--seconds 10]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from treegen import make_flat_tree
+from dirpoll.backends import PollingBackend
+from dirpoll.diff import iter_changes
+from dirpoll.incremental import IncrementalScanner
+from dirpoll.schedule import AdaptiveScheduler
+
+
+def run(backend, inc, hot, seconds, period):
+    prev = backend.baseline()
+    stats = 0
+    latencies = []
+    written = None
+    next_write = time.monotonic()
+    next_poll = time.monotonic() + backend.timeout()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        now = time.monotonic()
+        if now >= next_write:
+            with open(hot, 'a') as fh:
+                fh.write('x')
+            if written is None:
+                written = now
+            next_write = now + period
+        if now < next_poll:
+            time.sleep(max(0.0, min(next_poll, next_write) - now))
+            continue
+        snap = backend.poll([])
+        next_poll = time.monotonic() + backend.timeout()
+        stats += inc.stats['dirs_checked'] + inc.stats['files_restat']
+        if snap is not None:
+            if written is not None and next(iter_changes(prev, snap), None):
+                latencies.append(time.monotonic() - written)
+                written = None
+            prev = snap
+    return stats, sum(latencies) / max(1, len(latencies))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--files", type=int, default=20000)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--period", type=float, default=0.5)
+    ap.add_argument("--interval", type=float, default=1.0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_flat_tree(root, 64, args.files)
+        hot = str(root / "d00" / "sub00000" / "f1.dat")
+
+        inc = IncrementalScanner([root], True, False)
+        fixed = PollingBackend(inc.scan, args.interval, inc=inc)
+        s_fixed, l_fixed = run(fixed, inc, hot, args.seconds, args.period)
+
+        inc = IncrementalScanner([root], True, False)
+        adaptive = AdaptiveScheduler(inc, args.interval, min_interval=0.1, max_interval=30.0)
+        s_adapt, l_adapt = run(adaptive, inc, hot, args.seconds, args.period)
+
+    print(f"{'':10} {'stat calls':>11} {'hot latency':>12}")
+    print(f"{'fixed':10} {s_fixed:11d} {l_fixed * 1000:10.0f}ms")
+    print(f"{'adaptive':10} {s_adapt:11d} {l_adapt * 1000:10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: peak RSS of two live snapshots (as in monitor_loop),
+v1.3.0 "base|rel" dict vs compact dirpoll.snapshot.Snapshot.
+
+Each variant runs in its own subprocess so peak RSS is not shared.
+
+  python3 benchmarks/bench_snapshot.py [--dirs N] [--files N] [--root DIR]
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, root):
+    from dirpoll import scanner
+    from bench_scan import legacy_scan
+    before = peak_rss_mb()
+    if mode == "legacy":
+        old = legacy_scan([Path(root)], True, True)
+        new = legacy_scan([Path(root)], True, True)
+    else:
+        old = scanner.scan([root], True, True)
+        new = scanner.scan([root], True, True)
+    print(f"{mode:8} entries={len(new):8d}  peak RSS {peak_rss_mb():8.1f} MiB  "
+          f"(interpreter baseline {before:.1f} MiB)")
+    del old
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--dirs", type=int, default=5000)
+    ap.add_argument("--files", type=int, default=1000000)
+    ap.add_argument("--root", help="measure an existing tree instead of a synthetic one")
+    ap.add_argument("--unique", action="store_true",
+                    help="distinct file names in every directory")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.root)
+        return
+
+    def run(root):
+        for mode in ("legacy", "compact"):
+            subprocess.run([sys.executable, __file__, "--child", mode, "--root", root],
+                           check=True, cwd=str(HERE))
+
+    if args.root:
+        run(args.root)
+        return
+    from treegen import make_flat_tree
+    with tempfile.TemporaryDirectory(prefix="dirpoll-bench-") as tmp:
+        make_flat_tree(Path(tmp), args.dirs, args.files, args.unique)
+        run(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: scan, filters, diff and event emission on synthetic trees.
+
+Builds a reproducible tree (treegen.make_tree) in a temporary directory,
+then measures separately:
+
+  scan      full scans (dirpoll.watcher.scan, i.e. scan_dirs): entries/s
+  filter    filter_match over every path with N generated patterns
+  ticks     per workload (idle, create, delete, rename, touch storms),
+            `--ticks` rounds of: mutate, then one monitor tick split
+            into scan (backend poll), diff (compare + rename pairing)
+            and emit (pipeline submit + the writer's formatting/writes);
+            latency percentiles per phase and for the whole tick
+  syscalls  os.scandir / os.stat / os.lstat calls of one full scan and
+            one idle tick (counted in a separate, untimed pass)
+  memory    tracemalloc peak of a full scan, process peak RSS
+
+and prints one JSON document (or writes it with --output). With
+--baseline, the run is compared with an earlier JSON and the exit
+status is 1 if a throughput or p50 latency regressed by more than
+--tolerance.
+
+  python3 benchmarks/bench_suite.py [--depth N] [--fanout N] [--files N]
+          [--hidden F] [--mutations N] [--ticks N] [--patterns N]
+          [--incremental] [--workers N] [--seed N]
+          [--output FILE] [--baseline FILE] [--tolerance F]
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dirpoll
+from dirpoll.backends import open_backend
+from dirpoll.filters import compile_filter
+from dirpoll.output import EventPipeline, JsonLinesSink, LogSink, format_event
+from dirpoll.watcher import changes, filter_match, scan
+from treegen import WORKLOADS, Workload, best_of, make_patterns, make_tree
+
+
+def percentiles(samples):
+    """
+    p50/p90/p99/max of `samples` (seconds), in milliseconds.
+    """
+    s = sorted(samples)
+    if not s:
+        return {}
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {'p50_ms': pick(0.5) * 1e3, 'p90_ms': pick(0.9) * 1e3,
+            'p99_ms': pick(0.99) * 1e3, 'max_ms': s[-1] * 1e3}
+
+
+class SyscallCounter:
+    """
+    Count the calls of os.scandir/stat/lstat (and the DirEntry.stat()
+    calls of the scandir iterators) while active.
+    """
+
+    def __init__(self):
+        self.counts = {'scandir': 0, 'stat': 0, 'lstat': 0, 'entry_stat': 0}
+
+    def __enter__(self):
+        self._saved = os.scandir, os.stat, os.lstat
+        real_scandir, real_stat, real_lstat = self._saved
+        counts = self.counts
+
+        class Entry:
+            __slots__ = ('_e',)
+
+            def __init__(self, e):
+                self._e = e
+
+            def __getattr__(self, name):
+                return getattr(self._e, name)
+
+            def stat(self, *, follow_symlinks=True):
+                counts['entry_stat'] += 1
+                return self._e.stat(follow_symlinks=follow_symlinks)
+
+            def is_dir(self, *, follow_symlinks=True):
+                return self._e.is_dir(follow_symlinks=follow_symlinks)
+
+        class Scandir:
+            def __init__(self, it):
+                self._it = it
+
+            def __iter__(self):
+                return (Entry(e) for e in self._it)
+
+            def __next__(self):
+                return Entry(next(self._it))
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self._it.close()
+
+            def close(self):
+                self._it.close()
+
+        def scandir(*args, **kw):
+            counts['scandir'] += 1
+            return Scandir(real_scandir(*args, **kw))
+
+        def stat(*args, **kw):
+            counts['stat'] += 1
+            return real_stat(*args, **kw)
+
+        def lstat(*args, **kw):
+            counts['lstat'] += 1
+            return real_lstat(*args, **kw)
+
+        os.scandir, os.stat, os.lstat = scandir, stat, lstat
+        return self
+
+    def __exit__(self, *exc):
+        os.scandir, os.stat, os.lstat = self._saved
+
+
+def _null_logger():
+    logger = logging.getLogger("dirpoll.bench.events")
+    logger.handlers[:] = [logging.StreamHandler(io.StringIO())]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def bench_scan(root, args):
+    t, snap = best_of(lambda: scan([root], True, False), args.repeat)
+    t_h, snap_h = best_of(lambda: scan([root], True, True), args.repeat)
+    return {'entries': len(snap), 'seconds': t, 'entries_per_s': len(snap) / t,
+            'entries_hidden': len(snap_h), 'entries_per_s_hidden': len(snap_h) / t_h}
+
+
+def bench_filter(root, args):
+    rels = [rel for base, rel, _ in scan([root], True, True).items()]
+    pats = make_patterns(args.patterns)
+    flt = compile_filter(pats, ['*.tmp', '*/cache/*'])
+    t_compiled, kept = best_of(lambda: sum(map(flt.match, rels)), args.repeat)
+    # filter_match() as the front-ends call it: cached compile + match per call
+    t_call, _ = best_of(lambda: sum(filter_match(r, pats, ['*.tmp']) for r in rels), 1)
+    return {'patterns': len(pats), 'paths': len(rels), 'matched': kept,
+            'paths_per_s': len(rels) / t_compiled,
+            'paths_per_s_filter_match': len(rels) / t_call}
+
+
+def bench_ticks(root, dirs, files, args):
+    engine = {'backend': 'polling', 'incremental': args.incremental,
+              'workers': args.workers, 'restat_files': None}
+    backend = open_backend([root], True, False, None, None, 0, engine)
+    pipeline_log = _null_logger()
+    jsonl = os.path.join(os.path.dirname(root), 'events.jsonl')
+    log_sink, json_sink = LogSink(format_event, pipeline_log), JsonLinesSink(jsonl)
+    pipeline = EventPipeline([], maxsize=10 ** 7)   # queueing cost only
+    results = {}
+    try:
+        old = backend.baseline()
+        for kind in ('idle',) + WORKLOADS:
+            work = None if kind == 'idle' else Workload(kind, root, dirs, files,
+                                                        args.mutations, args.seed)
+            phases = {'scan': [], 'diff': [], 'emit_submit': [], 'emit_write': [], 'tick': []}
+            n_events = 0
+            for _ in range(args.ticks):
+                if work is not None:
+                    work.apply()
+                t0 = time.perf_counter()
+                new = backend.poll([])
+                t1 = time.perf_counter()
+                events = changes(old, new)
+                t2 = time.perf_counter()
+                pipeline.submit([e.as_tuple() for e in events])
+                t3 = time.perf_counter()
+                batch = [(e.time, e.kind, e.base, e.rel, e.src) for e in events]
+                log_sink.write(batch)
+                json_sink.write(batch)
+                t4 = time.perf_counter()
+                phases['scan'].append(t1 - t0)
+                phases['diff'].append(t2 - t1)
+                phases['emit_submit'].append(t3 - t2)
+                phases['emit_write'].append(t4 - t3)
+                phases['tick'].append(t3 - t0)
+                n_events += len(events)
+                old = new
+            if work is not None:
+                dirs, files = work.dirs, work.files
+            entry = {name: percentiles(samples) for name, samples in phases.items()}
+            entry['events'] = n_events
+            entry['entries_per_s'] = len(old) * len(phases['scan']) / sum(phases['scan'])
+            results[kind] = entry
+    finally:
+        pipeline.close()
+        json_sink.close()
+        backend.close()
+    return results
+
+
+def bench_syscalls(root, args):
+    with SyscallCounter() as full:
+        scan([root], True, False)
+    engine = {'backend': 'polling', 'incremental': args.incremental, 'workers': 1}
+    backend = open_backend([root], True, False, None, None, 0, engine)
+    try:
+        backend.baseline()
+        with SyscallCounter() as idle:
+            backend.poll([])
+    finally:
+        backend.close()
+    return {'full_scan': full.counts, 'idle_tick': idle.counts}
+
+
+def bench_memory(root):
+    tracemalloc.start()
+    snap = scan([root], True, False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    out = {'entries': len(snap), 'scan_peak_bytes': peak,
+           'scan_peak_bytes_per_entry': peak / max(1, len(snap))}
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out['process_peak_rss_bytes'] = rss if sys.platform == 'darwin' else rss * 1024
+    except ImportError:
+        pass
+    return out
+
+
+def regressions(current, baseline, tolerance):
+    """
+    Metrics of `current` worse than `baseline` by more than `tolerance`
+    (throughputs lower, p50 latencies higher).
+    """
+    found = []
+
+    def walk(cur, base, path):
+        for key, value in cur.items():
+            ref = base.get(key) if isinstance(base, dict) else None
+            if isinstance(value, dict):
+                walk(value, ref or {}, path + [key])
+            elif isinstance(value, (int, float)) and isinstance(ref, (int, float)) and ref > 0:
+                name = '.'.join(path + [key])
+                if key.endswith('_per_s') and value < ref * (1 - tolerance):
+                    found.append((name, ref, value))
+                elif key == 'p50_ms' and ref >= 0.5 and value > ref * (1 + tolerance):
+                    found.append((name, ref, value))
+
+    walk(current, baseline, [])
+    return found
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--fanout", type=int, default=8)
+    ap.add_argument("--files", type=int, default=50, help="files per directory")
+    ap.add_argument("--hidden", type=float, default=0.05, help="hidden entry ratio")
+    ap.add_argument("--mutations", type=int, default=1000, help="entries changed per tick")
+    ap.add_argument("--ticks", type=int, default=5, help="ticks per workload")
+    ap.add_argument("--patterns", type=int, default=30)
+    ap.add_argument("--incremental", action="store_true")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", help="write the JSON here instead of stdout")
+    ap.add_argument("--baseline", help="earlier JSON output to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dirpoll-bench-") as tmp:
+        root = os.path.join(tmp, 'tree')
+        os.mkdir(root)
+        t0 = time.perf_counter()
+        dirs, files = make_tree(root, args.depth, args.fanout, args.files,
+                                args.hidden, args.seed)
+        build = time.perf_counter() - t0
+        report = {
+            'meta': {
+                'dirpoll': dirpoll.__version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'params': {k: v for k, v in vars(args).items()
+                           if k not in ('output', 'baseline')},
+            },
+            'tree': {'dirs': len(dirs) + 1, 'files': len(files), 'build_seconds': build},
+            'scan': bench_scan(root, args),
+            'filter': bench_filter(root, args),
+            'syscalls': bench_syscalls(root, args),
+            'memory': bench_memory(root),
+        }
+        # last: the workloads change the tree
+        report['ticks'] = bench_ticks(root, dirs, files, args)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if baseline.get('meta', {}).get('params') != report['meta']['params']:
+            print("warning: baseline was run with different parameters", file=sys.stderr)
+        worse = regressions(report, baseline, args.tolerance)
+        for name, ref, value in worse:
+            print(f"regression: {name}: {ref:.4g} -> {value:.4g}", file=sys.stderr)
+        sys.exit(1 if worse else 0)
+
+
+if __name__ == "__main__":
+    main()
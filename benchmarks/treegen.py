@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic trees and mutation workloads for the benchmarks.
+
+make_tree() builds a reproducible tree (same seed, same tree):
+
+  depth     levels of directories below the root
+  fanout    subdirectories per directory
+  files     files per directory
+  hidden    fraction of hidden ('.'-prefixed) files and directories
+
+so a tree holds sum(fanout**k for k in 0..depth) directories and
+`files` times as many files.
+
+Workload applies one scripted storm to it; each call of apply() changes
+`count` entries with a fresh random choice:
+
+  create  new files in random directories
+  delete  random existing files
+  rename  random files renamed within their directory, plus a few
+          directories renamed as a whole
+  touch   random files get a new mtime (content and size unchanged)
+
+Shared with the single-purpose benchmarks: make_flat_tree() (a fixed
+number of directories two levels deep), make_patterns() and best_of().
+"""
+
+import os
+import random
+import time
+
+WORKLOADS = ('create', 'delete', 'rename', 'touch')
+
+_EXTS = ('.dat', '.log', '.csv', '.txt', '.json')
+
+
+def make_tree(root, depth=3, fanout=8, files=50, hidden=0.05, seed=0):
+    """
+    Create the tree under `root` (an existing directory). Returns the
+    lists of (directories, files) created, as absolute paths.
+    """
+    rng = random.Random(seed)
+    dirs, paths = [], []
+    level = [root]
+    for d in range(depth + 1):
+        for parent in level:
+            for j in range(files):
+                name = f"f{j}{_EXTS[j % len(_EXTS)]}"
+                if rng.random() < hidden:
+                    name = '.' + name
+                path = os.path.join(parent, name)
+                with open(path, 'wb') as fh:
+                    fh.write(b'x' * rng.randrange(0, 256))
+                paths.append(path)
+        if d == depth:
+            break
+        nxt = []
+        for parent in level:
+            for k in range(fanout):
+                name = f"d{d}_{k}"
+                if rng.random() < hidden:
+                    name = '.' + name
+                path = os.path.join(parent, name)
+                os.mkdir(path)
+                nxt.append(path)
+        dirs.extend(nxt)
+        level = nxt
+    return dirs, paths
+
+
+def make_flat_tree(root, n_dirs, n_files, unique=False):
+    """
+    Create `n_dirs` directories (two levels deep) holding `n_files`
+    files in total, with ~5% hidden entries. With `unique` every file
+    name is distinct across the tree (no sharing of name strings).
+    """
+    per_dir = max(1, n_files // n_dirs)
+    for i in range(n_dirs):
+        d = root / f"d{i % 32:02d}" / f"sub{i:05d}"
+        d.mkdir(parents=True, exist_ok=True)
+        for j in range(per_dir):
+            name = f".h{j}" if j % 20 == 0 else f"f{j}.dat"
+            if unique:
+                name = f"{name}.{i}"
+            (d / name).touch()
+
+
+def best_of(fn, repeat):
+    best = result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def make_patterns(n):
+    """
+    A realistic mix: suffixes, directory prefixes and a few real globs.
+    """
+    pats = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            pats.append(f"*.ext{i}")
+        elif kind == 1:
+            pats.append(f"build{i}/*")
+        elif kind == 2:
+            pats.append(f"*/cache{i}/*")
+        else:
+            pats.append(f"tmp{i}_??.[ch]")
+    return pats
+
+
+class Workload:
+    """
+    A mutation storm over a tree made by make_tree().
+    """
+
+    def __init__(self, kind, root, dirs, files, count, seed=0):
+        if kind not in WORKLOADS:
+            raise ValueError(f"unknown workload {kind!r}")
+        self.kind = kind
+        self.root = root
+        self.dirs = list(dirs)
+        self.files = list(files)
+        self.count = count
+        self.rng = random.Random(seed)
+        self._serial = 0
+
+    def apply(self):
+        """
+        Apply one round; returns the number of entries changed.
+        """
+        return getattr(self, '_' + self.kind)(min(self.count, max(1, len(self.files))))
+
+    def _create(self, n):
+        pool = self.dirs or [self.root]
+        for _ in range(n):
+            self._serial += 1
+            path = os.path.join(self.rng.choice(pool), f"new{self._serial}.dat")
+            with open(path, 'wb') as fh:
+                fh.write(b'new')
+            self.files.append(path)
+        return n
+
+    def _delete(self, n):
+        for i in self._pick(n):
+            os.unlink(self.files[i])
+        self._drop_picked()
+        return n
+
+    def _rename(self, n):
+        moved_dirs = 0
+        if self.dirs and n >= 100:
+            # a few whole leaf directories: one event each
+            for _ in range(max(1, n // 100)):
+                src = self.rng.choice(self.dirs)
+                if any(d != src and d.startswith(src + os.sep) for d in self.dirs):
+                    continue
+                self._serial += 1
+                dst = f"{src}.r{self._serial}"
+                os.rename(src, dst)
+                self._move_prefix(src, dst)
+                moved_dirs += 1
+        for i in self._pick(n - moved_dirs):
+            self._serial += 1
+            old = self.files[i]
+            new = f"{old}.r{self._serial}"
+            os.rename(old, new)
+            self.files[i] = new
+        return n
+
+    def _touch(self, n):
+        for i in self._pick(n):
+            path = self.files[i]
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        return n
+
+    # ----------------------------------------------------------------
+    def _pick(self, n):
+        self._picked = self.rng.sample(range(len(self.files)), min(n, len(self.files)))
+        return self._picked
+
+    def _drop_picked(self):
+        for i in sorted(self._picked, reverse=True):
+            self.files[i] = self.files[-1]
+            self.files.pop()
+
+    def _move_prefix(self, src, dst):
+        prefix = src + os.sep
+        self.dirs = [dst if d == src else dst + d[len(src):] if d.startswith(prefix) else d
+                     for d in self.dirs]
+        self.files = [dst + f[len(src):] if f.startswith(prefix) else f for f in self.files]
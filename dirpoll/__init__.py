@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+dirpoll – shared engine of the Directory Polling Monitor.
+
+The interactive front-ends (main_eng.py, main_ita.py) delegate the
+filesystem work to the modules of this package; other programs use
+dirpoll.Watcher (dirpoll.watcher), which yields typed Event objects:
+
+  • scanner      – os.scandir-based snapshot walker
+  • incremental  – dir-mtime pruning rescans with a persistent tree index
+  • parallel     – thread-pool scanning with work stealing across subtrees
+  • filters      – precompiled include/exclude globs and subtree pruning
+  • snapshot     – compact per-directory snapshot columns
+  • diff         – lazy, linear-time snapshot diff and inode rename pairing
+  • backends     – polling / inotify backend selection
+  • inotify      – ctypes inotify bindings with reconciliation polls
+  • persist      – checksummed, mmap-loaded on-disk snapshot index
+  • output       – asynchronous batched event writer (log, JSON Lines)
+  • schedule     – adaptive per-subtree polling intervals
+  • hashing      – opt-in blake2b content check of modified files
+  • watcher      – importable Watcher API: Event generator / async iterator
+  • aio          – asyncio watch(): loop-side waits, scans in an executor
+  • cli          – headless command line / config file, stop signals
+  • metrics      – per-tick timing histograms, Prometheus endpoint
+  • debounce     – per-path event merging until writes have settled
+  • partial      – bounded-work scans resumed across ticks for huge trees
+  • shard        – multi-process scanning: supervised, rebalanced workers
+  • journal      – sequence-numbered event journal, replay from a cursor
+  • control      – local socket for live reconfiguration
+
+Standard library only.
+"""
+
+__version__ = "1.3.0"
+
+# the library API (dirpoll.watcher) is imported on first use, so that
+# `import dirpoll` stays cheap
+_LAZY = {
+    'Watcher': 'dirpoll.watcher', 'Event': 'dirpoll.watcher', 'scan': 'dirpoll.watcher',
+    'watch': 'dirpoll.aio', 'scan_pool': 'dirpoll.aio',
+    'ADDED': 'dirpoll.diff', 'REMOVED': 'dirpoll.diff', 'MODIFIED': 'dirpoll.diff',
+    'RENAMED': 'dirpoll.diff',
+    'JournalReader': 'dirpoll.journal', 'Cursor': 'dirpoll.journal',
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module 'dirpoll' has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(module), name)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio front of the Watcher.
+
+    from dirpoll.aio import watch, scan_pool
+
+    async for event in watch(['/srv/data'], interval=2, recursive=True):
+        ...
+
+    pool = scan_pool(4)       # shared by any number of watchers
+    async for event in watch(['/srv/a'], executor=pool): ...
+
+The waiting is done by the event loop itself: backend descriptors
+(inotify, Watcher.stop()) are watched with loop.add_reader() and the
+interval with a timer, so no thread is parked between scans. Only the
+work runs in the executor: opening the backend and the baseline scan,
+every scan and diff (Watcher.step()), and the final state save. A pool
+of N threads therefore bounds how many watchers scan at the same time,
+not how many can exist, and the loop never waits for a scan whatever
+the size of the tree.
+
+Cancelling the consuming task (or leaving the `async for`) stops the
+generator cleanly: a scan already running in the executor is allowed to
+finish, since it cannot be interrupted, and then the watcher is closed
+in the executor (saving its state file, if any).
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from dirpoll.watcher import Watcher
+
+
+def scan_pool(workers=4):
+    """
+    Thread pool for the scans of several watchers.
+    """
+    return ThreadPoolExecutor(workers, thread_name_prefix="dirpoll-scan")
+
+
+async def watch(paths, interval=5.0, recursive=False, include_hidden=False,
+                include=(), exclude=(), engine=None, executor=None):
+    """
+    Async generator of the Events of a new Watcher (same arguments),
+    closed when the iteration ends. Scans run in `executor` (the loop's
+    default executor if None).
+    """
+    watcher = Watcher(paths, interval, recursive, include_hidden, include, exclude, engine)
+    async for event in events(watcher, executor, close=True):
+        yield event
+
+
+async def events(watcher, executor=None, close=False):
+    """
+    Async generator of the Events of `watcher`, until watcher.stop() or
+    cancellation; with close=True the watcher is closed at the end.
+    """
+    loop = asyncio.get_running_loop()
+    pending = None
+    try:
+        # shielded: cancelling the task must not cancel `pending`, which
+        # the finally clause waits for
+        pending = loop.run_in_executor(executor, watcher.open)
+        batch = await asyncio.shield(pending)
+        pending = None
+        while True:
+            for event in batch:
+                yield event
+            if watcher._stopped or watcher._closed:
+                for event in watcher.flush():
+                    yield event
+                break
+            ready = await _wait(loop, watcher)
+            pending = loop.run_in_executor(executor, watcher.step, ready)
+            batch = await asyncio.shield(pending)
+            pending = None
+    finally:
+        if pending is not None:
+            # the scan cannot be interrupted: let it finish before closing
+            await asyncio.wait([pending])
+        if close:
+            await loop.run_in_executor(executor, watcher.close)
+
+
+async def _wait(loop, watcher):
+    """
+    Wait, on the loop, until a scan is due or a watcher descriptor is
+    readable; return the readable descriptors.
+    """
+    fds = watcher.fds()
+    timeout = watcher.timeout()
+    if not fds:
+        await asyncio.sleep(timeout)
+        return []
+    woken = loop.create_future()
+    ready = []
+
+    def on_ready(fd):
+        ready.append(fd)
+        loop.remove_reader(fd)
+        if not woken.done():
+            woken.set_result(None)
+
+    for fd in fds:
+        loop.add_reader(fd, on_ready, fd)
+    try:
+        await asyncio.wait([woken], timeout=timeout)
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+        if not woken.done():
+            woken.cancel()
+    return ready
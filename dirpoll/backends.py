@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable change-detection backends.
+
+A backend hides how new snapshots are obtained from the monitor loop:
+
+  fds()          – file descriptors to add to the loop's select()
+  timeout()      – seconds the loop may wait before calling poll()
+  baseline()     – first Snapshot
+  poll(ready)    – new Snapshot, or None if there is nothing to report
+  close()        – release threads, descriptors, ...
+  dir_meta()     – per-directory (mtime_ns, inode) to persist, or None
+  reconfigure(bases, match, prune, policy, snapshot, refilter, relist)
+                 – switch to new bases and filters between two polls;
+                   returns the Snapshot to diff the next poll against
+
+Both backends produce Snapshots, so the diff and the logged
+added/removed/modified events are identical whichever one is used.
+(dirpoll.shard's ShardedBackend, whose worker processes diff their own
+shards, offers poll_events(ready) instead of poll().)
+
+  • PollingBackend – rescans every `interval` seconds (any platform, any
+                     filesystem); uses the sequential, parallel or
+                     incremental scanner per engine options.
+  • AdaptiveScheduler – dirpoll.schedule, polling with per-subtree
+                     intervals between min_interval and max_interval.
+  • InotifyBackend – dirpoll.inotify, Linux only; picked by 'auto' unless
+                     a base lives on a network filesystem.
+  • PartialBackend – dirpoll.partial, polling a bounded slice of the tree
+                     per tick; it also offers poll_region(), which returns
+                     only the regions that changed.
+"""
+
+import logging
+import os
+
+from dirpoll import scanner
+from dirpoll.incremental import IncrementalScanner
+from dirpoll.parallel import ParallelScanner
+from dirpoll.schedule import AdaptiveScheduler
+
+log = logging.getLogger("dirpoll")
+
+# filesystems where inotify does not see changes made by other hosts
+NETWORK_FS = frozenset((
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'afs', 'ceph', 'glusterfs',
+    'lustre', 'davfs', 'fuse.sshfs', 'fuse.rclone', 'fuse.s3fs', 'gpfs',
+))
+
+
+class PollingBackend:
+    """
+    Periodic full (or incremental) rescans.
+    """
+    name = 'polling'
+
+    def __init__(self, scan, interval, close=None, reason='', inc=None, rebind=None,
+                 bases=()):
+        self._scan = scan
+        self.interval = interval
+        self._close = close
+        self.reason = reason
+        self.inc = inc
+        self._rebind = rebind   # (bases, match, prune, policy) -> scan, without `inc`
+        self.bases = [scanner.resolve_base(b) for b in bases]
+
+    def fds(self):
+        return []
+
+    def timeout(self):
+        return self.interval
+
+    def baseline(self):
+        return self._scan()
+
+    def poll(self, ready):
+        return self._scan()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+    def dir_meta(self):
+        return None if self.inc is None else self.inc.dir_meta()
+
+    def reconfigure(self, bases, match, prune, policy, snapshot, refilter=True, relist=False):
+        """
+        Switch to new bases and filters: `snapshot` (the last scan) is
+        filtered in memory and the added bases are scanned on their own.
+        """
+        if self.inc is not None:
+            return self.inc.reconfigure(bases, match, prune, policy, snapshot, refilter, relist)
+        bases = [scanner.resolve_base(b) for b in bases]
+        added = [b for b in bases if b not in self.bases]
+        self._scan = self._rebind(bases, match, prune, policy)
+        self.bases = bases
+        if refilter or relist:
+            snap = snapshot.filtered(match, prune, set(bases))
+        else:
+            snap = snapshot.filtered(bases=set(bases))
+        if added:
+            snap.update(self._rebind(added, match, prune, policy)())
+        return snap
+
+
+def fs_type(path):
+    """
+    Filesystem type of `path` from /proc/self/mounts (longest mount
+    point prefix), or None if it cannot be determined.
+    """
+    try:
+        with open('/proc/self/mounts', encoding='utf-8', errors='replace') as fh:
+            mounts = [line.split() for line in fh]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, best_len = None, -1
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        mnt = fields[1].replace('\\040', ' ').replace('\\011', '\t').replace('\\134', '\\')
+        if (path == mnt or path.startswith(mnt.rstrip('/') + '/')) and len(mnt) > best_len:
+            best, best_len = fields[2], len(mnt)
+    return best
+
+
+def open_backend(paths, recursive, include_hidden, match, prune, interval, engine=None,
+                 seed=None, timings=None):
+    """
+    Build the backend selected by `engine` (a dict of engine options):
+      backend       – 'auto' (default), 'polling' or 'inotify'
+      incremental   – dir-mtime pruning rescans (polling)
+      restat_files  – files re-stated per tick (incremental)
+      workers       – parallel scan threads (full-rescan polling only:
+                      a warning is logged when another engine is used)
+      reconcile     – seconds between inotify reconciliation scans
+      adaptive      – per-subtree adaptive intervals (polling, implies
+                      incremental), bounded by min_interval/max_interval
+      max_entries   – partial scans: entries listed per tick, and/or
+      max_ms          milliseconds spent per tick (takes precedence)
+      follow_symlinks, same_fs
+                    – descent rules of the scanner.WalkPolicy
+      device_workers – parallel scan threads per st_dev (a warning is
+                      logged when the workers are not used)
+    Falls back to polling, with `reason` set, when inotify cannot be used.
+    `seed` is a (snapshot, dir_meta) pair loaded by dirpoll.persist; the
+    incremental scanners start from it instead of a cold walk.
+    `timings` is a metrics.ScanTimings the scans add their stat and filter
+    time to (no instrumentation when None).
+    """
+    engine = engine or {}
+    if timings is not None:
+        from dirpoll.metrics import timed_filters
+        match, prune = timed_filters(match, prune, timings)
+    kind = engine.get('backend', 'auto')
+    reason = ''
+    policy = walk_policy(paths, recursive, engine)
+    if engine.get('max_entries') or engine.get('max_ms'):
+        from dirpoll.partial import PartialBackend
+        if kind == 'inotify':
+            log.warning("inotify backend not used: partial scans are polling only")
+        _unused_workers(engine, "partial scans")
+        return PartialBackend(paths, recursive, include_hidden, match, prune, interval,
+                              engine.get('max_entries'), engine.get('max_ms'),
+                              seed, timings, policy=policy)
+    if kind in ('auto', 'inotify'):
+        from dirpoll import inotify
+        ok, reason = inotify.available()
+        if ok:
+            for p in paths:
+                fst = fs_type(p)
+                if fst in NETWORK_FS or (fst or '').startswith('nfs'):
+                    ok, reason = False, f"{p} is on a network filesystem ({fst})"
+                    break
+        if ok:
+            inc = IncrementalScanner(paths, recursive, include_hidden, match,
+                                     restat_files=engine.get('restat_files'), prune=prune,
+                                     policy=policy)
+            inc.timings = timings
+            try:
+                backend = inotify.InotifyBackend(inc, interval,
+                                                 reconcile=engine.get('reconcile', 60.0))
+            except OSError as exc:
+                reason = str(exc)
+            else:
+                if seed is not None:
+                    inc.seed(*seed)
+                _unused_workers(engine, "the inotify backend")
+                return backend
+        if kind == 'inotify':
+            log.warning(f"inotify backend unavailable: {reason}")
+    if engine.get('incremental') or engine.get('adaptive'):
+        inc = IncrementalScanner(paths, recursive, include_hidden, match,
+                                 restat_files=engine.get('restat_files'), prune=prune,
+                                 policy=policy)
+        inc.timings = timings
+        if seed is not None:
+            inc.seed(*seed)
+        if engine.get('adaptive'):
+            _unused_workers(engine, "adaptive intervals")
+            return AdaptiveScheduler(inc, interval,
+                                     min_interval=engine.get('min_interval', 0.5),
+                                     max_interval=engine.get('max_interval', 60.0),
+                                     reason=reason)
+        _unused_workers(engine, "incremental scans")
+        return PollingBackend(inc.scan, interval, reason=reason, inc=inc)
+    if engine.get('workers', 1) > 1:
+        pool = ParallelScanner(engine['workers'], device_workers=engine.get('device_workers'))
+
+        def rebind(paths, match, prune, policy):
+            return lambda: pool.scan(paths, recursive, include_hidden, match, prune,
+                                     timings, policy)
+        return PollingBackend(rebind(paths, match, prune, policy), interval, close=pool.close,
+                              reason=reason, rebind=rebind, bases=paths)
+    if engine.get('device_workers'):
+        log.warning("threads per device not used: parallel scan workers are off")
+
+    def rebind(paths, match, prune, policy):
+        return lambda: scanner.scan(paths, recursive, include_hidden, match, prune,
+                                    timings, policy)
+    return PollingBackend(rebind(paths, match, prune, policy), interval, reason=reason,
+                          rebind=rebind, bases=paths)
+
+
+def _unused_workers(engine, engine_name):
+    # the thread pool, and its per-device limit, only serve full rescans
+    if engine.get('workers', 1) > 1:
+        log.warning(f"parallel scan workers not used with {engine_name}")
+    elif engine.get('device_workers'):
+        log.warning(f"threads per device not used with {engine_name}")
+
+
+def walk_policy(paths, recursive, engine):
+    """
+    scanner.WalkPolicy of the engine options for `paths` (None when not
+    recursive).
+    """
+    if not recursive:
+        return None
+    return scanner.WalkPolicy(paths, engine.get('follow_symlinks', False),
+                              engine.get('same_fs', False),
+                              devices=bool(engine.get('device_workers'))
+                              and engine.get('workers', 1) > 1)
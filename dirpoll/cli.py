@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Non-interactive command line.
+
+Both front-ends run headless when given arguments (or a config file):
+
+  main_eng.py [DIR ...] [-c CONFIG] [-i SECONDS] [-r] [--hidden]
+              [--include PAT] [--exclude PAT] [--log-file PATH]
+              [--state-file PATH] [--backend ...] [...]
+  main_eng.py --once --state-file PATH [DIR ...]
+
+The config file is JSON with the same keys as monitor_loop()'s
+arguments, engine options in a nested object:
+
+  {"dirs": ["/srv/data"], "interval": 2, "recursive": true,
+   "include_hidden": false, "include": ["*.csv"], "exclude": [],
+   "log_file": "/var/log/dirpoll.log",
+   "engine": {"backend": "polling", "incremental": true,
+              "state_file": "/var/lib/dirpoll/state"}}
+
+Command line flags override the config file, which overrides the
+defaults. No TTY is needed: a headless monitor stops cleanly on SIGTERM
+or SIGINT (see stop_signals()). SIGHUP re-reads the config file and
+applies its "dirs", "include" and "exclude" to the running monitor
+(reload_config(), Watcher.reconfigure()): unchanged directories are not
+scanned again. The other keys take effect at the next start.
+"""
+
+import argparse
+import json
+import os
+import signal
+from pathlib import Path
+
+from dirpoll.watcher import DEFAULT_ENGINE
+
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+RELOAD_SIGNALS = (signal.SIGHUP,) if hasattr(signal, 'SIGHUP') else ()
+
+DEFAULTS = {
+    'dirs': [], 'interval': 5.0, 'recursive': False, 'include_hidden': False,
+    'include': [], 'exclude': [], 'log_file': None,
+}
+
+# value kinds of the config file keys (a trailing '?' also allows null);
+# the engine options take the kind of their DEFAULT_ENGINE value, or
+# of _ENGINE_OPTIONAL for those that default to None
+_KINDS = {
+    'dirs': 'strings', 'interval': 'number', 'recursive': 'bool', 'include_hidden': 'bool',
+    'include': 'strings', 'exclude': 'strings', 'log_file': 'str?',
+}
+_ENGINE_OPTIONAL = {
+    'restat_files': 'int', 'state_file': 'str', 'jsonl_file': 'str', 'metrics_port': 'int',
+    'max_entries': 'int', 'max_ms': 'number', 'journal_dir': 'str', 'journal_keep': 'int',
+    'device_workers': 'int', 'control_socket': 'str',
+}
+_CHOICES = {
+    'backend': ('auto', 'polling', 'inotify'),
+    'backpressure': ('block', 'drop', 'coalesce'),
+}
+_CHECKS = {
+    'bool': ("true or false", lambda v: isinstance(v, bool)),
+    'int': ("an integer", lambda v: isinstance(v, int) and not isinstance(v, bool)),
+    'number': ("a number", lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)),
+    'str': ("a string", lambda v: isinstance(v, str)),
+    'strings': ("a list of strings",
+                lambda v: isinstance(v, list) and all(isinstance(s, str) for s in v)),
+}
+
+
+class ConfigError(Exception):
+    """
+    Raised when the config file cannot be read or has invalid values.
+    """
+
+
+def build_parser(prog=None):
+    p = argparse.ArgumentParser(
+        prog=prog, description="Poll directories and log added, removed, modified "
+                               "and renamed entries (headless mode).")
+    p.add_argument('dirs', nargs='*', metavar='DIR', help="directories to monitor")
+    p.add_argument('-c', '--config', metavar='PATH', help="JSON config file")
+    p.add_argument('-i', '--interval', type=float, metavar='SECONDS',
+                   help="polling interval (default 5.0)")
+    p.add_argument('-r', '--recursive', action='store_true', default=None,
+                   help="scan subdirectories")
+    p.add_argument('--no-recursive', dest='recursive', action='store_false')
+    p.add_argument('--hidden', dest='include_hidden', action='store_true', default=None,
+                   help="include entries starting with '.'")
+    p.add_argument('--no-hidden', dest='include_hidden', action='store_false')
+    p.add_argument('--include', action='append', metavar='PAT', help="include glob (repeatable)")
+    p.add_argument('--exclude', action='append', metavar='PAT', help="exclude glob (repeatable)")
+    p.add_argument('--log-file', metavar='PATH', help="also log to this file")
+
+    e = p.add_argument_group("scan engine")
+    e.add_argument('--backend', choices=_CHOICES['backend'])
+    e.add_argument('--incremental', action='store_true', default=None,
+                   help="dir-mtime pruning rescans")
+    e.add_argument('--workers', type=int, metavar='N', help="parallel scan threads")
+    e.add_argument('--adaptive', action='store_true', default=None,
+                   help="adaptive per-subtree intervals")
+    e.add_argument('--hashing', action='store_true', default=None,
+                   help="content hashing of modified files")
+    e.add_argument('--no-renames', dest='renames', action='store_false', default=None,
+                   help="report renames as removed + added")
+    e.add_argument('--state-file', metavar='PATH', help="saved snapshot to load and update")
+    e.add_argument('--jsonl-file', metavar='PATH', help="also write events as JSON Lines")
+    e.add_argument('--journal-dir', metavar='DIR',
+                   help="also append events to a sequence-numbered journal in DIR")
+    e.add_argument('--journal-segment-mb', type=int, metavar='MB',
+                   help="start a new journal segment after MB megabytes")
+    e.add_argument('--journal-keep', type=int, metavar='N',
+                   help="keep only the newest N journal segments")
+    e.add_argument('--backpressure', choices=_CHOICES['backpressure'],
+                   help="policy when the output queue is full")
+    e.add_argument('--metrics', action='store_true', default=None,
+                   help="time every scan by phase and log a summary periodically")
+    e.add_argument('--metrics-port', type=int, metavar='PORT',
+                   help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (implies --metrics)")
+    e.add_argument('--metrics-every', type=float, metavar='SECONDS',
+                   help="seconds between metrics summaries in the log")
+    e.add_argument('--debounce', type=float, metavar='SECONDS',
+                   help="hold the events of a path until it has been quiet this long")
+    e.add_argument('--stable-ticks', type=int, metavar='N',
+                   help="hold the events of a path until N scans found it unchanged")
+    e.add_argument('--debounce-max', type=int, metavar='N',
+                   help="paths held at most (the least recently changed is released)")
+    e.add_argument('--max-entries', type=int, metavar='N',
+                   help="partial scans: list at most N entries per tick")
+    e.add_argument('--max-ms', type=int, metavar='MS',
+                   help="partial scans: spend at most MS milliseconds per tick")
+    e.add_argument('--processes', type=int, metavar='N',
+                   help="scan in N worker processes (sharded by base or subtree)")
+    e.add_argument('--rebalance', type=float, metavar='SECONDS',
+                   help="seconds between rebalancing the shards by scan cost")
+    e.add_argument('--follow-symlinks', action='store_true', default=None,
+                   help="descend into symlinked directories (loops are detected)")
+    e.add_argument('--same-fs', action='store_true', default=None,
+                   help="do not descend into other filesystems")
+    e.add_argument('--device-workers', type=int, metavar='N',
+                   help="parallel scans: at most N threads per device or mount")
+    e.add_argument('--control-socket', metavar='PATH',
+                   help="accept directory and pattern changes on this Unix socket")
+
+    o = p.add_argument_group("one-shot diff")
+    o.add_argument('--once', action='store_true',
+                   help="print the changes since the state file was saved and exit "
+                        "(status 0: none, 1: changes, 2: state file missing or unusable)")
+    o.add_argument('--update-state', action='store_true',
+                   help="with --once, save the current snapshot afterwards; a missing "
+                        "state file is created as the baseline (status 0)")
+    return p
+
+
+def load_config(path):
+    """
+    Read a JSON config file into a dict; the type of every value is
+    checked (ConfigError names the bad key).
+    """
+    try:
+        with open(os.path.expanduser(path), encoding='utf-8') as fh:
+            cfg = json.load(fh)
+    except (OSError, ValueError) as exc:
+        raise ConfigError(f"cannot read config {path}: {exc}") from exc
+    if not isinstance(cfg, dict):
+        raise ConfigError(f"config {path}: expected a JSON object")
+    unknown = set(cfg) - set(DEFAULTS) - {'engine'}
+    if unknown:
+        raise ConfigError(f"config {path}: unknown keys {sorted(unknown)}")
+    engine = cfg.get('engine', {})
+    if not isinstance(engine, dict):
+        raise ConfigError(f"config {path}: engine must be an object")
+    if set(engine) - set(DEFAULT_ENGINE):
+        raise ConfigError(f"config {path}: unknown engine options "
+                          f"{sorted(set(engine) - set(DEFAULT_ENGINE))}")
+    for key, value in cfg.items():
+        if key != 'engine':
+            _check(path, key, value, _KINDS[key])
+    for key, value in engine.items():
+        _check(path, f"engine.{key}", value, _engine_kind(key))
+        if key in _CHOICES and value not in _CHOICES[key]:
+            raise ConfigError(f"config {path}: engine.{key} must be one of "
+                              f"{', '.join(_CHOICES[key])}")
+    return cfg
+
+
+def _engine_kind(key):
+    if key in _ENGINE_OPTIONAL:
+        return _ENGINE_OPTIONAL[key] + '?'
+    default = DEFAULT_ENGINE[key]
+    if isinstance(default, bool):
+        return 'bool'
+    if isinstance(default, int):
+        return 'int'
+    return 'number' if isinstance(default, float) else 'str'
+
+
+def _check(path, key, value, kind):
+    if value is None and kind.endswith('?'):
+        return
+    name, ok = _CHECKS[kind.rstrip('?')]
+    if not ok(value):
+        raise ConfigError(f"config {path}: {key} must be {name}"
+                          + (" or null" if kind.endswith('?') else ""))
+
+
+def reload_config(path):
+    """
+    The directories and patterns of a config file, to apply to a running
+    monitor: a dict with those of 'dirs' (resolved Paths), 'include' and
+    'exclude' the file sets. Raises ConfigError.
+    """
+    cfg = load_config(path)
+    out = {}
+    for key in ('dirs', 'include', 'exclude'):
+        if key in cfg:
+            out[key] = list(cfg[key])
+    if 'dirs' in out:
+        dirs = []
+        for d in out['dirs']:
+            p = Path(d).expanduser().resolve()
+            if not p.is_dir():
+                raise ConfigError(f"config {path}: not a directory: {d}")
+            if p not in dirs:
+                dirs.append(p)
+        if not dirs:
+            raise ConfigError(f"config {path}: at least one directory is required")
+        out['dirs'] = dirs
+    return out
+
+
+def parse_args(argv, prog=None):
+    """
+    Parse command line (and config file) into a dict:
+      dirs (resolved Paths), interval, recursive, include_hidden, include,
+      exclude, log_file, engine, once, update_state, config (the config
+      file path, for reloads)
+    Exits with status 2 on invalid arguments, like argparse.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    opts = dict(DEFAULTS)
+    engine = dict(DEFAULT_ENGINE)
+    if args.config:
+        try:
+            cfg = load_config(args.config)
+        except ConfigError as exc:
+            parser.error(str(exc))
+        engine.update(cfg.pop('engine', {}))
+        opts.update(cfg)
+    for key in DEFAULTS:
+        value = getattr(args, key)
+        if value is not None and value != []:
+            opts[key] = value
+    for key in ('backend', 'incremental', 'workers', 'adaptive', 'hashing', 'renames',
+                'state_file', 'jsonl_file', 'backpressure', 'metrics', 'metrics_port',
+                'metrics_every', 'debounce', 'stable_ticks', 'debounce_max', 'max_entries',
+                'max_ms', 'processes', 'rebalance', 'journal_dir', 'journal_segment_mb',
+                'journal_keep', 'follow_symlinks', 'same_fs', 'device_workers',
+                'control_socket'):
+        value = getattr(args, key)
+        if value is not None:
+            engine[key] = value
+
+    dirs = []
+    for d in opts['dirs']:
+        path = Path(d).expanduser().resolve()
+        if not path.is_dir():
+            parser.error(f"not a directory: {d}")
+        if path not in dirs:
+            dirs.append(path)
+    if not dirs:
+        parser.error("at least one directory is required")
+    if opts['interval'] <= 0:
+        parser.error("the interval must be positive")
+    if engine['workers'] < 1:
+        parser.error("--workers must be at least 1")
+    if (engine['device_workers'] or 1) < 1:
+        parser.error("--device-workers must be at least 1")
+    if engine['processes'] < 1:
+        parser.error("--processes must be at least 1")
+    if engine['rebalance'] <= 0:
+        parser.error("--rebalance must be positive")
+    if engine['debounce'] < 0 or engine['stable_ticks'] < 0 or engine['debounce_max'] < 1:
+        parser.error("--debounce and --stable-ticks cannot be negative, "
+                     "--debounce-max must be at least 1")
+    if (engine['max_entries'] or 0) < 0 or (engine['max_ms'] or 0) < 0:
+        parser.error("--max-entries and --max-ms cannot be negative")
+    if engine['journal_segment_mb'] < 1 or (engine['journal_keep'] or 1) < 1:
+        parser.error("--journal-segment-mb and --journal-keep must be at least 1")
+    if engine['metrics_port'] is not None:
+        if not 0 < engine['metrics_port'] < 65536:
+            parser.error("--metrics-port must be between 1 and 65535")
+        engine['metrics'] = True
+    if args.once and not engine['state_file']:
+        parser.error("--once needs a state file (--state-file or engine.state_file)")
+    if args.update_state and not args.once:
+        parser.error("--update-state is only valid with --once")
+    for key in ('state_file', 'jsonl_file', 'journal_dir', 'control_socket'):
+        if engine[key]:
+            engine[key] = os.path.expanduser(engine[key])
+
+    opts['dirs'] = dirs
+    opts['log_file'] = Path(opts['log_file']).expanduser().resolve() if opts['log_file'] else None
+    opts['engine'] = engine
+    opts['once'] = args.once
+    opts['update_state'] = args.update_state
+    opts['config'] = os.path.abspath(os.path.expanduser(args.config)) if args.config else None
+    return opts
+
+
+def stop_signals(signals=STOP_SIGNALS):
+    """
+    Turn `signals` into a stop request the monitor loop can select() on.
+    Returns (fd, restore): `fd` becomes readable when one of them arrives
+    (through signal.set_wakeup_fd, so a select() in progress returns at
+    once; received() tells which); restore() puts the previous handlers
+    back.
+    """
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    os.set_blocking(w, False)
+    old_fd = signal.set_wakeup_fd(w)
+    old = {sig: signal.signal(sig, _ignore) for sig in signals}
+
+    def restore():
+        for sig, handler in old.items():
+            signal.signal(sig, handler)
+        signal.set_wakeup_fd(old_fd)
+        os.close(r)
+        os.close(w)
+
+    return r, restore
+
+
+def received(fd):
+    """
+    Set of the signal numbers that arrived on a stop_signals() descriptor
+    since the last call.
+    """
+    try:
+        return set(os.read(fd, 512))
+    except BlockingIOError:
+        return set()
+
+
+def _ignore(signum, frame):
+    # the wakeup fd does the work; a Python-level handler must exist for it
+    pass
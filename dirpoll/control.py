@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Local control socket for live reconfiguration.
+
+With the 'control_socket' engine option the Watcher listens on a Unix
+socket at that path (mode 0600) and applies requests between two ticks
+(see Watcher.reconfigure()). A client sends one JSON object per
+connection and gets one JSON line back:
+
+  {"add": ["/srv/new"]}                  watch one more directory
+  {"remove": ["/srv/old"]}               stop watching one
+  {"dirs": ["/srv/a", "/srv/b"]}         replace the directory list
+  {"include": ["*.csv"], "exclude": []}  replace the pattern lists
+  {}                                     current configuration only
+
+Keys can be combined ("dirs" is applied before "add" and "remove").
+The answer is {"ok": true, "dirs": [...], "include": [...], "exclude":
+[...], "ms": <milliseconds the change took>}, or {"ok": false, "error":
+"..."} with nothing changed. A client in Python:
+
+    from dirpoll.control import request
+    request('/run/dirpoll.sock', {'add': ['/srv/new']})
+"""
+
+import json
+import logging
+import os
+import socket
+import stat
+import time
+
+log = logging.getLogger("dirpoll")
+
+MAX_REQUEST = 1 << 20
+
+
+class ControlError(Exception):
+    """
+    Raised for a request that cannot be applied (sent back as "error").
+    """
+
+
+class ControlServer:
+    """
+    Listening socket; serve(watcher) answers the pending connections.
+    """
+
+    def __init__(self, path, timeout=0.2):
+        self.path = path
+        self.timeout = timeout   # per connection, request and answer included
+        _remove_stale(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # bound under a temporary name and restricted before it appears at
+        # `path` (the umask is per process: other threads create files too);
+        # nobody can connect before listen()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            sock.bind(tmp)
+            try:
+                os.chmod(tmp, 0o600)
+                os.replace(tmp, path)
+            except OSError:
+                os.remove(tmp)
+                raise
+        except OSError:
+            sock.close()
+            raise
+        sock.listen(8)
+        sock.setblocking(False)
+        self._sock = sock
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def serve(self, watcher):
+        """
+        Accept the waiting clients and apply their requests to `watcher`.
+        """
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                log.warning(f"Control: accept failed: {exc}")
+                return
+            with conn:
+                # a client slow to send its request is dropped when the
+                # deadline passes, so that it cannot stall the ticks
+                deadline = time.monotonic() + self.timeout
+                try:
+                    reply = apply(watcher, _read_request(conn, deadline))
+                except ControlError as exc:
+                    reply = {'ok': False, 'error': str(exc)}
+                try:
+                    conn.settimeout(self.timeout)
+                    conn.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+                except OSError:
+                    pass   # client gone or too slow
+
+    def close(self):
+        self._sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def apply(watcher, req):
+    """
+    Apply one request to `watcher`; return the answer.
+    """
+    if not isinstance(req, dict):
+        raise ControlError("expected a JSON object")
+    unknown = set(req) - {'dirs', 'add', 'remove', 'include', 'exclude'}
+    if unknown:
+        raise ControlError(f"unknown keys {sorted(unknown)}")
+    for key, value in req.items():
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ControlError(f"{key}: expected a list of strings")
+    current = [_resolve(p) for p in watcher.paths]
+    dirs = []
+    for d in req.get('dirs', []) + req.get('add', []):
+        path = _resolve(d)
+        if not os.path.isdir(path):
+            raise ControlError(f"not a directory: {d}")
+        if path not in dirs:
+            dirs.append(path)
+    if 'dirs' not in req:
+        dirs = current + [d for d in dirs if d not in current]
+    for d in req.get('remove', ()):
+        path = _resolve(d)
+        if path not in dirs:
+            raise ControlError(f"not watched: {d}")
+        dirs.remove(path)
+    if not dirs:
+        raise ControlError("at least one directory is required")
+    t0 = time.perf_counter()
+    if req:
+        watcher.reconfigure(dirs if dirs != current else None,
+                            req.get('include'), req.get('exclude'))
+    return {'ok': True, 'dirs': [str(p) for p in watcher.paths],
+            'include': list(watcher.include), 'exclude': list(watcher.exclude),
+            'ms': round((time.perf_counter() - t0) * 1000, 3)}
+
+
+def request(path, req, timeout=10.0):
+    """
+    Client side: send `req` (a dict) to the control socket at `path` and
+    return the decoded answer.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(req) + '\n').encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+def _resolve(path):
+    return os.path.realpath(os.path.expanduser(path))
+
+
+def _read_request(conn, deadline):
+    data = b''
+    try:
+        while not data.endswith(b'\n'):
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise ControlError("timed out reading the request")
+            conn.settimeout(left)
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > MAX_REQUEST:
+                raise ControlError("request too large")
+    except OSError as exc:
+        raise ControlError(f"cannot read the request: {exc}") from exc
+    try:
+        return json.loads(data.decode('utf-8') or '{}')
+    except ValueError as exc:
+        raise ControlError(f"invalid JSON: {exc}") from exc
+
+
+def _remove_stale(path):
+    """
+    Remove a socket left by a monitor that is no longer running.
+    """
+    try:
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            return   # bind() reports it
+    except FileNotFoundError:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+        except OSError:
+            pass
+        else:
+            raise OSError(f"{path}: another monitor is listening")
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Event coalescing and "write finished" detection.
+
+A file written over several ticks (a log being appended, a build output
+written in steps) is reported on every tick. Debouncer holds the events
+of each path until the path is quiet:
+
+  • no change for `quiet` seconds, and
+  • unchanged for `stable_ticks` consecutive scans (its size and mtime
+    did not move, since any change of them is a new event for the path),
+
+and merges the events of a path meanwhile:
+
+  added + modified     = added
+  added + removed      = nothing
+  removed + added      = modified
+  modified + removed   = removed
+  renamed + modified   = renamed
+  added, then renamed  = added at the new path
+  renamed, then removed = removed at the old path
+
+The pending table is bounded (`max_pending` paths); past it the path
+that changed least recently is released at once (LRU), so a storm over
+many paths degrades to undelayed events rather than to lost ones.
+
+Released events keep the time of their last change. Pending events are
+not in the state file: Watcher.flush() releases them all, and the
+front-ends call it when monitoring stops.
+"""
+
+from collections import OrderedDict
+
+from dirpoll.diff import ADDED, MODIFIED, REMOVED, RENAMED
+from dirpoll.output import merge_kind
+from dirpoll.watcher import Event
+
+
+class _Pending:
+    __slots__ = ('kind', 'src', 'time', 'mono', 'tick')
+
+    def __init__(self, kind, src, time, mono, tick):
+        self.kind = kind
+        self.src = src      # (base, rel) of a RENAMED entry's origin
+        self.time = time    # time.time() of the last change
+        self.mono = mono    # time.monotonic() of the last change
+        self.tick = tick    # scan that saw the last change
+
+
+class Debouncer:
+    """
+    Pending-event table between the diff and the output.
+    """
+
+    def __init__(self, quiet=2.0, stable_ticks=1, max_pending=10000):
+        self.quiet = quiet
+        self.stable_ticks = stable_ticks
+        self.max_pending = max_pending
+        self._pending = OrderedDict()   # (base, rel) -> _Pending, least recent change first
+        self._ticks = 0
+        self.stats = {'held': 0, 'merged': 0, 'cancelled': 0, 'evicted': 0, 'released': 0}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, events, mono):
+        """
+        Add the Events of one scan ([] for a scan that found nothing,
+        which still counts as a stable tick); return the events released.
+        `mono` is the time.monotonic() of the scan.
+        """
+        self._ticks += 1
+        out = []
+        for event in events:
+            self._add(event, mono, out)
+        out.extend(self.release(mono))
+        return out
+
+    def next_release(self):
+        """
+        monotonic() time the least recent change becomes quiet, or None
+        when nothing is held or it still needs more scans to be stable.
+        """
+        for entry in self._pending.values():
+            if self._ticks - entry.tick < self.stable_ticks:
+                return None
+            return entry.mono + self.quiet
+        return None
+
+    def release(self, mono):
+        """
+        Return the events of the paths that are quiet and stable.
+        """
+        out = []
+        pending = self._pending
+        horizon = mono - self.quiet
+        stable = self._ticks - self.stable_ticks
+        # ordered by last change: stop at the first path still settling
+        while pending:
+            key, entry = next(iter(pending.items()))
+            if entry.mono > horizon or entry.tick > stable:
+                break
+            del pending[key]
+            out.append(Event(entry.kind, key[0], key[1], entry.src, entry.time))
+        self.stats['released'] += len(out)
+        return out
+
+    def flush(self):
+        """
+        Release every pending event now.
+        """
+        out = [Event(e.kind, k[0], k[1], e.src, e.time) for k, e in self._pending.items()]
+        self._pending.clear()
+        self.stats['released'] += len(out)
+        return out
+
+    # ----------------------------------------------------------------
+    def _add(self, event, mono, out):
+        pending = self._pending
+        key = (event.base, event.rel)
+        kind, src = event.kind, event.src
+        if kind == RENAMED and src in pending:
+            # the entry moved on before it was reported
+            origin = pending.pop(src)
+            self.stats['merged'] += 1
+            if origin.kind == ADDED:
+                kind, src = ADDED, None
+            elif origin.kind == RENAMED:
+                kind, src = (MODIFIED, None) if origin.src == key else (RENAMED, origin.src)
+        elif kind == REMOVED and key in pending and pending[key].kind == RENAMED:
+            # moved, then deleted: the original path is what disappeared
+            origin = pending.pop(key)
+            self.stats['merged'] += 1
+            key, src = origin.src, None
+            before = pending.get(key)
+            if before is not None:
+                # something new appeared at the old path since
+                before.kind = merge_kind(REMOVED, before.kind)
+                before.time, before.mono, before.tick = event.time, mono, self._ticks
+                pending.move_to_end(key)
+                return
+        entry = pending.get(key)
+        if entry is not None:
+            merged = merge_kind(entry.kind, kind)
+            if merged is None:
+                del pending[key]
+                self.stats['cancelled'] += 1
+                return
+            self.stats['merged'] += 1
+            if merged != RENAMED:
+                entry.src = None
+            elif kind == RENAMED:
+                entry.src = src
+            entry.kind = merged
+            entry.time, entry.mono, entry.tick = event.time, mono, self._ticks
+            pending.move_to_end(key)
+        else:
+            self.stats['held'] += 1
+            pending[key] = _Pending(kind, src, event.time, mono, self._ticks)
+            if len(pending) > self.max_pending:
+                old_key, old = pending.popitem(last=False)
+                self.stats['evicted'] += 1
+                out.append(Event(old.kind, old_key[0], old_key[1], old.src, old.time))
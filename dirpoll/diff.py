@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Linear-time, lazy snapshot diff.
+
+iter_changes() walks the two snapshots directory by directory and yields
+changes as it finds them, without building any full-size set:
+
+  • a chunk shared by both snapshots is skipped with one identity check,
+  • chunks with identical name tuples (the usual case: readdir order is
+    stable while a directory does not change) are compared column-wise:
+    each signature column (mtime_ns, size, inode, ctime_ns) is compared
+    in a single C-level pass over the arrays and allocates nothing; only
+    on a mismatch are the entries walked,
+  • other chunks are merged in sorted-name order (two-pointer merge).
+
+So a tick in which nothing changed costs one comparison per entry and
+no allocation at all.
+
+find_renames() then pairs removed and added entries that are the same
+inode: a moved directory becomes one RENAMED event instead of one
+removal and one addition per entry below it.
+"""
+
+from dirpoll.snapshot import Locator
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+RENAMED = 'renamed'
+
+
+def iter_changes(old, new):
+    """
+    Yield (kind, base, rel) for every difference between two Snapshots,
+    kind being ADDED, REMOVED or MODIFIED.
+    """
+    old_dirs = old.dirs
+    for key, nc in new.dirs.items():
+        oc = old_dirs.get(key)
+        if oc is nc:
+            continue
+        base, rel_dir = key
+        if oc is None:
+            for i in range(len(nc.names)):
+                yield ADDED, base, nc.rel(rel_dir, i)
+        elif oc.names == nc.names and oc.isdir == nc.isdir:
+            if not oc.same_values(nc):
+                om, nm, osz, nsz = oc.mtime_ns, nc.mtime_ns, oc.size, nc.size
+                oi, ni, oct_, nct = oc.ino, nc.ino, oc.ctime_ns, nc.ctime_ns
+                for i in range(len(nm)):
+                    if om[i] != nm[i] or osz[i] != nsz[i] or oct_[i] != nct[i] or oi[i] != ni[i]:
+                        yield MODIFIED, base, nc.rel(rel_dir, i)
+        else:
+            yield from _merge_chunks(base, rel_dir, oc, nc)
+    new_dirs = new.dirs
+    for key, oc in old_dirs.items():
+        if key not in new_dirs:
+            base, rel_dir = key
+            for i in range(len(oc.names)):
+                yield REMOVED, base, oc.rel(rel_dir, i)
+
+
+def _merge_chunks(base, rel_dir, oc, nc):
+    """
+    Merge-style diff of two chunks of the same directory whose entries
+    differ or are listed in a different order.
+    """
+    okeys = sorted((oc.rel(rel_dir, i), i) for i in range(len(oc.names)))
+    nkeys = sorted((nc.rel(rel_dir, i), i) for i in range(len(nc.names)))
+    i = j = 0
+    no, nn = len(okeys), len(nkeys)
+    while i < no and j < nn:
+        orel, oi = okeys[i]
+        nrel, ni = nkeys[j]
+        if orel == nrel:
+            if oc.sig(oi) != nc.sig(ni):
+                yield MODIFIED, base, nrel
+            i += 1
+            j += 1
+        elif orel < nrel:
+            yield REMOVED, base, orel
+            i += 1
+        else:
+            yield ADDED, base, nrel
+            j += 1
+    for orel, _ in okeys[i:]:
+        yield REMOVED, base, orel
+    for nrel, _ in nkeys[j:]:
+        yield ADDED, base, nrel
+
+
+def compare(old, new):
+    """
+    Collect iter_changes() into sets of added, removed and modified
+    (base, rel) pairs.
+    """
+    out = {ADDED: set(), REMOVED: set(), MODIFIED: set()}
+    for kind, base, rel in iter_changes(old, new):
+        out[kind].add((base, rel))
+    return out[ADDED], out[REMOVED], out[MODIFIED]
+
+
+def find_renames(old, new, added, removed, modified):
+    """
+    Match removed and added entries by (st_dev, st_ino), plus size for
+    files, using the inode columns recorded by the scan (one dict of the
+    removed entries, no pairwise search).
+
+    Returns (renamed, added, removed, modified): `renamed` is a list of
+    ((old_base, old_rel), (new_base, new_rel)) pairs, sorted by new path;
+    the other sets no longer hold the matched entries. Entries moved
+    along with a renamed directory (same relative path below it) are
+    folded into that directory's event; if their signature changed they
+    are reported as modified at the new path. A file elsewhere with the
+    same inode but another size is left as removed + added. Hard-linked
+    inodes and unknown inodes (0) are left alone.
+    """
+    if not added or not removed:
+        return [], added, removed, modified
+    old_loc, new_loc = Locator(old), Locator(new)
+    index = {}
+    for pair in removed:
+        found = old_loc.find(*pair)
+        if found is None:
+            continue
+        chunk, i = found
+        if not chunk.ino[i]:
+            continue
+        key = (chunk.dev, chunk.ino[i], pair[1].endswith('/'))
+        index[key] = None if key in index else (pair, chunk.sig(i))   # None: ambiguous
+
+    matches = []   # (old pair, new pair, signature equal, size equal)
+    for pair in added:
+        found = new_loc.find(*pair)
+        if found is None:
+            continue
+        chunk, i = found
+        hit = index.get((chunk.dev, chunk.ino[i], pair[1].endswith('/')))
+        if hit is None:
+            continue
+        old_pair, old_sig = hit
+        sig = chunk.sig(i)
+        is_dir = pair[1].endswith('/')
+        index[(chunk.dev, chunk.ino[i], is_dir)] = None
+        matches.append((old_pair, pair, old_sig[:2] == sig[:2], is_dir or old_sig[1] == sig[1]))
+    if not matches:
+        return [], added, removed, modified
+
+    dir_moves = {o: n for o, n, _, sized in matches if sized and o[1].endswith('/')}
+    renamed = []
+    added, removed, modified = set(added), set(removed), set(modified)
+    for o, n, same, sized in matches:
+        if _moved_with_parent(o, n, dir_moves):
+            if not same:
+                modified.add(n)
+        elif sized:
+            renamed.append((o, n))
+        else:
+            continue   # same inode, other size and not moved along: a rewrite
+        added.discard(n)
+        removed.discard(o)
+    renamed.sort(key=lambda p: p[1])
+    return renamed, added, removed, modified
+
+
+def _moved_with_parent(o, n, dir_moves):
+    """
+    True if `o` -> `n` is implied by the move of an enclosing directory.
+    """
+    (obase, orel), (nbase, nrel) = o, n
+    cut = len(orel.rstrip('/'))
+    while True:
+        cut = orel.rfind('/', 0, cut)
+        if cut < 0:
+            return False
+        odir = orel[:cut + 1]
+        target = dir_moves.get((obase, odir))
+        if target is not None:
+            tbase, tdir = target
+            return tbase == nbase and nrel == tdir + orel[cut + 1:]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled include/exclude glob filter.
+
+fnmatch.fnmatch() normalizes case and looks up its regex cache on every
+call; calling it once per pattern per entry dominates a filtered poll.
+compile_filter() turns each pattern list into one matcher, once per
+monitor session:
+
+  • literal patterns        ('Makefile')  -> set membership
+  • '*<literal>' patterns   ('*.log')     -> one str.endswith(tuple)
+  • '<literal>*' patterns   ('build/*')   -> one str.startswith(tuple)
+  • everything else                       -> a single combined regex
+
+Semantics are those of fnmatch.fnmatch ('*' also matches '/').
+
+Exclude patterns ending in '*' also drive directory pruning: if such a
+pattern matches a directory's relative path ('build/'), it matches every
+path below it as well, so the walkers skip the whole subtree.
+
+narrows() tells whether new pattern lists can only reject more: the
+recorded entries are then re-filtered in memory when the patterns of a
+running monitor change (Watcher.reconfigure()).
+"""
+
+import fnmatch
+import functools
+import os
+import re
+
+_MAGIC = re.compile(r'[*?[]')
+# True where fnmatch.fnmatch folds case / separators (Windows)
+_NORMCASE = os.path.normcase('A/') != 'A/'
+
+
+class _Matcher:
+    """
+    Union of glob patterns with literal/prefix/suffix fast paths.
+    """
+    __slots__ = ('literals', 'prefixes', 'suffixes', 'regex', 'empty')
+
+    def __init__(self, patterns):
+        literals, prefixes, suffixes, globs = set(), [], [], []
+        for pat in patterns:
+            if _NORMCASE:
+                pat = os.path.normcase(pat)
+            m = _MAGIC.search(pat)
+            if m is None:
+                literals.add(pat)
+            elif pat[0] == '*' and _MAGIC.search(pat, 1) is None:
+                suffixes.append(pat[1:])
+            elif m.start() == len(pat) - 1 and pat[-1] == '*':
+                prefixes.append(pat[:-1])
+            else:
+                globs.append(pat)
+        self.literals = frozenset(literals)
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        self.regex = (re.compile('|'.join(fnmatch.translate(p) for p in globs)).match
+                      if globs else None)
+        self.empty = not patterns
+
+    def hits(self, name):
+        """
+        Return True if `name` matches at least one pattern.
+        """
+        return (name in self.literals
+                or name.endswith(self.suffixes)
+                or name.startswith(self.prefixes)
+                or (self.regex is not None and self.regex(name) is not None))
+
+
+class PathFilter:
+    """
+    Compiled include/exclude filter.
+      match(rel)     -> True if rel passes the filters (as _filter_match)
+      prune(rel_dir) -> True if nothing at or below rel_dir can pass
+    """
+
+    def __init__(self, includes, excludes):
+        self.includes = tuple(includes)
+        self.excludes = tuple(excludes)
+        self._inc = _Matcher(self.includes)
+        self._exc = _Matcher(self.excludes)
+        self._prune = _Matcher([p for p in self.excludes if p.endswith('*')])
+
+    def match(self, name):
+        if _NORMCASE:
+            name = os.path.normcase(name)
+        if not self._inc.empty and not self._inc.hits(name):
+            return False
+        if not self._exc.empty and self._exc.hits(name):
+            return False
+        return True
+
+    def prune(self, rel_dir):
+        if self._prune.empty:
+            return False
+        if _NORMCASE:
+            rel_dir = os.path.normcase(rel_dir)
+        return self._prune.hits(rel_dir)
+
+
+@functools.lru_cache(maxsize=32)
+def _compile(includes, excludes):
+    return PathFilter(includes, excludes)
+
+
+def compile_filter(includes, excludes):
+    """
+    Return a cached PathFilter for the given pattern lists, or None when
+    there are no patterns at all (callers then skip filtering entirely).
+    """
+    includes = tuple(includes or ())
+    excludes = tuple(excludes or ())
+    if not includes and not excludes:
+        return None
+    return _compile(includes, excludes)
+
+
+def narrows(includes, excludes, new_includes, new_excludes):
+    """
+    True if the new pattern lists pass no path the old ones rejected
+    (and prune no less): every exclude is kept and the includes, if
+    any, are a subset of the old ones. False when that cannot be shown
+    from the lists alone.
+    """
+    if not set(excludes) <= set(new_excludes):
+        return False
+    if not includes:
+        return True
+    return bool(new_includes) and set(new_includes) <= set(includes)
+
+
+def match_both(match, other):
+    """
+    Predicate passing what both `match` and `other` pass (None: no filter).
+    """
+    if match is None or other is None:
+        return match or other
+    return lambda rel: match(rel) and other(rel)
+
+
+def prune_either(prune, other):
+    """
+    Predicate pruning what `prune` or `other` prunes (None: no pruning).
+    """
+    if prune is None or other is None:
+        return prune or other
+    return lambda rel_dir: prune(rel_dir) or other(rel_dir)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in content hashing of modified files.
+
+The snapshot signature (mtime_ns, size, inode, ctime_ns) says that a
+file may have changed; ContentHasher.confirm() drops the MODIFIED
+events whose content did not change (a `touch`, a rewrite with the same
+bytes, an atomic replace by an identical copy):
+
+  • a file whose size changed is reported without hashing,
+  • otherwise the new version is hashed (blake2b, chunked reads) and
+    compared with the digest of the old version, looked up in a cache
+    keyed by (inode, size, mtime_ns) – unchanged files are never
+    re-hashed,
+  • files whose old digest is unknown are reported, and their new digest
+    is cached for next time; warm() fills the cache in the background:
+    one pass over every file, then only the files that are new or
+    changed since the snapshot it last looked at.
+
+Hashing runs on a thread pool, within `budget` bytes per tick: what does
+not fit is reported as modified without verification (never delayed).
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dirpoll.snapshot import Locator, signature
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    """
+    Return (digest, key, stable): the blake2b digest of `path`, its
+    (inode, size, mtime_ns) after reading, and whether it stayed the same
+    while being read.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as fh:
+        before = os.fstat(fh.fileno())
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+        after = os.fstat(fh.fileno())
+    mtime_ns, size, ino, _ = signature(after)
+    key = (ino, size, mtime_ns)
+    stable = signature(before)[:3] == (mtime_ns, size, ino)
+    return h.digest(), key, stable
+
+
+class ContentHasher:
+    """
+    Digest cache plus the thread pool hashing modified files.
+    """
+
+    def __init__(self, workers=4, budget=64 << 20, cache_size=200000, executor=None):
+        self.budget = budget
+        self.cache_size = cache_size
+        self._cache = OrderedDict()   # (inode, size, mtime_ns) -> digest, LRU
+        self._lock = threading.Lock()
+        self._own = executor is None
+        self._pool = executor or ThreadPoolExecutor(workers, thread_name_prefix="dirpoll-hash")
+        self._left = budget
+        self._warm_iter = None
+        self._warmed = None           # dirs of the snapshot the last warm pass started from
+        self._warming = []
+        self.stats = {'hashed_files': 0, 'hashed_bytes': 0, 'suppressed': 0,
+                      'unverified': 0, 'cache_hits': 0}
+
+    def confirm(self, modified, old, new):
+        """
+        Return the subset of `modified` (base, rel) pairs whose content
+        changed or could not be verified. Starts a new tick's budget.
+        """
+        self._left = self.budget
+        old_loc, new_loc = Locator(old), Locator(new)
+        result = set()
+        jobs = []
+        for base, rel in modified:
+            if rel.endswith('/'):
+                result.add((base, rel))
+                continue
+            o, n = _sig(old_loc, base, rel), _sig(new_loc, base, rel)
+            if o is None or n is None or o[1] != n[1]:
+                result.add((base, rel))   # size changed: no need to hash
+                continue
+            old_digest = self._get((o[2], o[1], o[0]))
+            new_key = (n[2], n[1], n[0])
+            if old_digest is None:
+                result.add((base, rel))
+                self.stats['unverified'] += 1
+                self._warm_one(base + os.sep + rel, n[1])
+                continue
+            new_digest = self._get(new_key)
+            if new_digest is not None:
+                self.stats['cache_hits'] += 1
+                if new_digest != old_digest:
+                    result.add((base, rel))
+                else:
+                    self.stats['suppressed'] += 1
+                continue
+            if n[1] > self._left:
+                result.add((base, rel))
+                self.stats['unverified'] += 1
+                continue
+            self._left -= n[1]
+            jobs.append(((base, rel), new_key, old_digest,
+                         self._pool.submit(self._hash, base + os.sep + rel)))
+        for pair, new_key, old_digest, fut in jobs:
+            try:
+                digest, key, stable = fut.result()
+            except OSError:
+                result.add(pair)
+                continue
+            if stable and key == new_key and digest == old_digest:
+                self.stats['suppressed'] += 1
+            else:
+                result.add(pair)
+        return result
+
+    def warm(self, snapshot):
+        """
+        Hash, in the background and within what is left of this tick's
+        budget, files of `snapshot` that have no cached digest yet: all
+        of them on the first pass, later only those new or changed since
+        the previous pass started.
+        """
+        self._warming = [f for f in self._warming if not f.done()]
+        if self._warming:
+            return   # previous batch still running
+        if self._warm_iter is None:
+            self._warm_iter = _files(snapshot, self._warmed)
+            self._warmed = dict(snapshot.dirs)
+        while self._warm_iter is not None:
+            # a slice that fits the budget, then one lock for its cache lookups
+            batch, left = [], self._left
+            for item in self._warm_iter:
+                size = item[1]
+                if size > self.budget:
+                    continue   # would never fit: verified only when modified
+                if size > left:
+                    self._warm_iter = _chain_one(item, self._warm_iter)
+                    break
+                batch.append(item)
+                left -= size
+            else:
+                self._warm_iter = None   # pass done
+            if not batch:
+                return
+            with self._lock:
+                batch = [(path, size) for path, size, key in batch if key not in self._cache]
+            for path, size in batch:
+                self._warm_one(path, size)
+
+    def close(self):
+        if self._own:
+            self._pool.shutdown(wait=False)
+
+    # ----------------------------------------------------------------
+    def _warm_one(self, path, size):
+        if size <= self._left:
+            self._left -= size
+            self._warming.append(self._pool.submit(self._hash, path))
+
+    def _hash(self, path):
+        digest, key, stable = file_digest(path)
+        with self._lock:
+            self.stats['hashed_files'] += 1
+            self.stats['hashed_bytes'] += key[1]
+            if stable:
+                self._cache[key] = digest
+                self._cache.move_to_end(key)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return digest, key, stable
+
+    def _get(self, key):
+        with self._lock:
+            digest = self._cache.get(key)
+            if digest is not None:
+                self._cache.move_to_end(key)
+            return digest
+
+
+def _sig(locator, base, rel):
+    found = locator.find(base, rel)
+    return None if found is None else found[0].sig(found[1])
+
+
+def _files(snapshot, since=None):
+    """
+    Yield (path, size, cache key) of every file of `snapshot` or, given
+    the dirs of an earlier snapshot `since`, of those not in it with the
+    same key.
+    """
+    for key, chunk in list(snapshot.dirs.items()):
+        old = None if since is None else since.get(key)
+        if old is chunk:
+            continue   # shared, unchanged chunk
+        known = () if old is None else set(_keys(old))
+        prefix = key[0] + os.sep + key[1]
+        for i, name in enumerate(chunk.names):
+            if not chunk.isdir[i]:
+                k = (chunk.ino[i], chunk.size[i], chunk.mtime_ns[i])
+                if k not in known:
+                    yield prefix + name, chunk.size[i], k
+
+
+def _keys(chunk):
+    return zip(chunk.ino, chunk.size, chunk.mtime_ns)
+
+
+def _chain_one(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental scanning with directory-mtime pruning.
+
+On POSIX a directory's mtime changes whenever an entry is added, removed
+or renamed inside it. IncrementalScanner keeps a persistent tree index
+of every walked directory (mtime_ns, inode, descended subdirectories and
+the DirChunk of its recorded entries) and, on each tick:
+
+  • stats every indexed directory once (O(number of directories)),
+  • re-lists only the directories whose mtime/inode changed,
+  • re-stats files on a rolling subset (`restat_files` per tick),
+    since rewriting a file does not touch its parent's mtime.
+
+scan() returns a Snapshot equivalent to scanner.scan(). Unchanged
+directories contribute the very same DirChunk object as in the previous
+snapshot (chunks are copied on write), so consecutive snapshots share
+almost all their memory. With restat_files=None every file is re-stated
+on every tick (exact, but still without any readdir on unchanged
+directories).
+
+Event-driven backends (dirpoll.inotify) skip the per-directory stat and
+call refresh() with the directories they know to be dirty; the
+on_new_dir/on_drop_dir hooks tell them when the index grows or shrinks,
+and on_new_leaf/on_drop_leaf report recorded directories that are not
+descended into (symlinks, non-recursive mode), whose mtime changes
+without any event on the parent.
+
+seed() rebuilds the index from a snapshot saved by dirpoll.persist, so a
+restarted monitor re-lists only what changed while it was down.
+
+reconfigure() changes the bases and filters of a running scanner: an
+added base is walked on its own, a removed one forgotten, and the index
+is re-filtered in memory when the new patterns only narrow the old ones.
+
+With a scanner.WalkPolicy the descent follows its rules (symlinks,
+filesystem boundaries, duplicate mounts); the chain of symlink targets
+followed down to a directory is kept for the directories below a
+followed link only.
+"""
+
+import os
+from array import array
+from collections import deque
+
+from dirpoll.scanner import resolve_base
+from dirpoll.snapshot import ChunkBuilder, DirChunk, Snapshot, signature
+
+
+class _DirState:
+    """
+    Index node: identity of a directory, the names of the subdirectories
+    the walk descends into, of the recorded but not descended ones, and
+    the chunk of its recorded entries.
+    """
+    __slots__ = ('mtime_ns', 'ino', 'ctime_ns', 'subdirs', 'leafdirs', 'chunk')
+
+    def __init__(self, mtime_ns, ino, subdirs, leafdirs, chunk, ctime_ns=None):
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        self.ctime_ns = ctime_ns   # last seen; a chmod/chown changes only this
+        self.subdirs = subdirs
+        self.leafdirs = leafdirs
+        self.chunk = chunk
+
+
+class IncrementalScanner:
+    """
+    Stateful scanner: the first scan() is a full walk that builds the
+    tree index, later calls only re-list directories that changed.
+    """
+
+    def __init__(self, bases, recursive, include_hidden, match=None,
+                 restat_files=None, prune=None, policy=None):
+        self.bases = [resolve_base(b) for b in bases]
+        self.recursive = recursive
+        self.include_hidden = include_hidden
+        self.match = match
+        self.restat_files = restat_files
+        self.prune = prune
+        self.policy = policy
+        self._index = {}          # (base, rel_dir) -> _DirState
+        self._links = {}          # (base, rel_dir) -> followed link targets, when any
+        self._rotation = deque()  # (base, rel_dir, state) round-robin for file re-stat
+        self._restat_at = 0       # entry of the rotation's head to resume from
+        self._touched = None      # set collecting changed keys (refresh_subtree)
+        self.stats = {}
+        self.timings = None       # optional metrics.ScanTimings for the stat calls
+        # optional callbacks (base, rel_dir) for directories entering/leaving the
+        # index, and (base, rel_dir, name) for recorded non-descended directories
+        self.on_new_dir = None
+        self.on_drop_dir = None
+        self.on_new_leaf = None
+        self.on_drop_leaf = None
+
+    def scan(self):
+        """
+        Refresh the index and return a Snapshot.
+        """
+        self.reset_stats()
+        for base in self.bases:
+            self._refresh(base)
+        self._restat_rolling()
+        return self.snapshot()
+
+    def refresh(self, dirs):
+        """
+        Re-list only the given (base, rel_dir) directories, plus any new
+        subdirectories found under them, and return a Snapshot.
+        """
+        self.reset_stats()
+        # parents first: re-listing a parent may drop a dirty child
+        for base, rel_dir in sorted(dirs, key=lambda k: k[1].count('/')):
+            state = self._index.get((base, rel_dir))
+            if state is None:
+                continue
+            state.mtime_ns = None
+            self._refresh(base, rel_dir, only_new=True)
+        return self.snapshot()
+
+    def refresh_subtree(self, base, rel_dir='', descend=True):
+        """
+        Refresh one indexed subtree and re-stat all its files (or, when
+        not `descend`, only the directory itself plus any new
+        subdirectories). Returns the keys of the directories whose chunk
+        changed or that left the index. Stats accumulate until
+        reset_stats().
+        """
+        self._touched = touched = set()
+        visited = []
+        try:
+            self._refresh(base, rel_dir, only_new=not descend, visited=visited)
+            for item in visited:
+                self._restat_dir(*item, None)
+        finally:
+            self._touched = None
+        return touched
+
+    def reset_stats(self):
+        self.stats = {'dirs_checked': 0, 'dirs_listed': 0, 'files_restat': 0}
+
+    def snapshot(self):
+        """
+        Snapshot of the current index (no filesystem access).
+        """
+        return Snapshot({key: state.chunk for key, state in self._index.items()})
+
+    def dir_meta(self):
+        """
+        { (base, rel_dir): (mtime_ns, inode) } of the indexed directories,
+        as saved by dirpoll.persist.
+        """
+        return {key: (state.mtime_ns, state.ino) for key, state in self._index.items()
+                if state.mtime_ns is not None}
+
+    def seed(self, snapshot, dir_meta):
+        """
+        Build the index from a saved snapshot instead of a cold walk: the
+        next scan() only re-lists directories whose mtime/inode differs
+        from `dir_meta` (or that have no entry in it). Must be called
+        before the first scan().
+        """
+        bases = set(self.bases)
+        keys = [key for key in snapshot.dirs if key[0] in bases]
+        children = {}
+        for base, rel_dir in keys:
+            if rel_dir:
+                cut = rel_dir.rfind('/', 0, len(rel_dir) - 1) + 1
+                children.setdefault((base, rel_dir[:cut]), set()).add(rel_dir[cut:-1])
+        if self.policy is not None and self.policy.follow_symlinks:
+            for key in sorted(keys, key=lambda k: k[1].count('/')):
+                if key[1]:
+                    self._seed_links(key)
+        for key in keys:
+            chunk = snapshot.dirs[key]
+            subdirs = children.get(key, set())
+            leafdirs = {name for name, d in zip(chunk.names, chunk.isdir)
+                        if d and name not in subdirs}
+            mtime_ns, ino = dir_meta.get(key, (None, None))
+            state = _DirState(mtime_ns, ino, subdirs, leafdirs, chunk)
+            self._index[key] = state
+            self._rotation.append((key[0], key[1], state))
+            if self.on_new_dir is not None:
+                self.on_new_dir(*key)
+            if self.on_new_leaf is not None:
+                for name in leafdirs:
+                    self.on_new_leaf(key[0], key[1], name)
+
+    def reconfigure(self, bases, match=None, prune=None, policy=None, snapshot=None,
+                    refilter=True, relist=False):
+        """
+        Switch to new bases and filters without a cold walk: removed bases
+        leave the index, added ones are walked now. With `refilter` the
+        recorded entries are filtered again in memory (the new filters must
+        not admit anything the old ones rejected); with `relist` every
+        directory is re-listed by the next scan instead.
+        Returns the Snapshot to diff the next scan against: the index, or,
+        with `relist`, `snapshot` (the last one scanned) filtered likewise
+        plus the added bases.
+        """
+        bases = [resolve_base(b) for b in bases]
+        for base in self.bases:
+            state = self._index.get((base, ''))
+            if base not in bases and state is not None:
+                self._drop(base, '', state)
+        self.match, self.prune, self.policy = match, prune, policy
+        if relist:
+            for state in self._index.values():
+                state.mtime_ns = None
+        elif refilter:
+            self._refilter()
+        added = [b for b in bases if b not in self.bases]
+        self.bases = bases
+        for base in added:
+            self._refresh(base)
+        if not relist:
+            return self.snapshot()
+        snap = snapshot.filtered(match, prune, set(bases))
+        added = set(added)
+        snap.update(Snapshot({key: state.chunk for key, state in self._index.items()
+                              if key[0] in added}))
+        return snap
+
+    # ----------------------------------------------------------------
+    def _refilter(self):
+        """
+        Apply the current match/prune to the indexed chunks and subtrees.
+        """
+        index = self._index
+        match, prune = self.match, self.prune
+        for key in list(index):
+            state = index.get(key)
+            if state is None:
+                continue   # in a subtree pruned meanwhile
+            base, rel_dir = key
+            if match is not None:
+                chunk = state.chunk.filtered(rel_dir, match)
+                if chunk is not state.chunk:
+                    state.chunk = chunk
+                    gone = state.leafdirs - set(chunk.names)
+                    state.leafdirs -= gone
+                    if self.on_drop_leaf is not None:
+                        for name in gone:
+                            self.on_drop_leaf(base, rel_dir, name)
+            if prune is None:
+                continue
+            for name in [n for n in state.subdirs if prune(rel_dir + n + '/')]:
+                state.subdirs.discard(name)
+                child = index.get((base, rel_dir + name + '/'))
+                if child is not None:
+                    self._drop(base, rel_dir + name + '/', child)
+                if name in state.chunk.names:
+                    # still recorded, no longer descended into
+                    state.leafdirs.add(name)
+                    if self.on_new_leaf is not None:
+                        self.on_new_leaf(base, rel_dir, name)
+
+    def _seed_links(self, key):
+        """
+        Rebuild the followed-link chain of a seeded directory (its parent's
+        must be known already).
+        """
+        base, rel_dir = key
+        cut = rel_dir.rfind('/', 0, len(rel_dir) - 1) + 1
+        links = self._links.get((base, rel_dir[:cut]), ())
+        path = base + os.sep + rel_dir[:-1]
+        if os.path.islink(path):
+            links += (os.path.realpath(path),)
+        if links:
+            self._links[key] = links
+
+    def _refresh(self, base, start='', only_new=False, visited=None):
+        index = self._index
+        timings = self.timings
+        stack = [start]
+        while stack:
+            rel_dir = stack.pop()
+            path = base + os.sep + rel_dir if rel_dir else base
+            key = (base, rel_dir)
+            state = self._index.get(key)
+            self.stats['dirs_checked'] += 1
+            try:
+                st = os.stat(path) if timings is None else timings.timed_stat(os.stat, path)
+            except OSError:
+                # vanished: the parent's mtime changed too and it will
+                # be re-listed on the next tick
+                if state is not None:
+                    self._drop(base, rel_dir, state)
+                continue
+            if state is None or state.mtime_ns != st.st_mtime_ns or state.ino != st.st_ino:
+                if state is not None and rel_dir:
+                    self._patch_parent(base, rel_dir, st)
+                state = self._relist(base, rel_dir, path, st, state)
+            elif state.ctime_ns != st.st_ctime_ns and rel_dir:
+                # metadata change (chmod, chown): only the parent's entry
+                self._patch_parent(base, rel_dir, st)
+            state.ctime_ns = st.st_ctime_ns
+            if visited is not None:
+                visited.append((base, rel_dir, state))
+            for name in state.subdirs:
+                child = rel_dir + name + '/'
+                if not only_new or (base, child) not in index:
+                    stack.append(child)
+
+    def _relist(self, base, rel_dir, path, st, state):
+        """
+        Re-read a directory whose mtime changed and rebuild its chunk.
+        """
+        self.stats['dirs_listed'] += 1
+        if self._touched is not None:
+            self._touched.add((base, rel_dir))
+        chunk = ChunkBuilder()
+        subdirs = set()
+        leafdirs = set()
+        timings = self.timings
+        policy = self.policy
+        links = self._links.get((base, rel_dir), ()) if self._links else ()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            it = None
+        if it is not None:
+            with it:
+                for entry in it:
+                    name = entry.name
+                    if not self.include_hidden and name[0] == '.':
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    rel = rel_dir + name + '/' if is_dir else rel_dir + name
+                    recorded = False
+                    if self.match is None or self.match(rel):
+                        try:
+                            if timings is None:
+                                chunk.add(name, is_dir, entry.stat())
+                            else:
+                                chunk.add(name, is_dir, timings.timed_stat(entry.stat))
+                            recorded = True
+                        except OSError:
+                            pass
+                    if is_dir:
+                        descend = False
+                        if self.recursive and policy is None:
+                            try:
+                                link = entry.is_symlink()
+                            except OSError:
+                                link = True
+                            descend = not link and (self.prune is None or not self.prune(rel))
+                        elif self.recursive and (self.prune is None or not self.prune(rel)):
+                            sub = policy.descend(entry, base, links)
+                            descend = sub is not None
+                            if sub:
+                                self._links[(base, rel)] = sub
+                            elif descend:
+                                self._links.pop((base, rel), None)
+                        if descend:
+                            subdirs.add(name)
+                        elif recorded:
+                            leafdirs.add(name)
+        if state is None:
+            state = _DirState(st.st_mtime_ns, st.st_ino, subdirs, leafdirs, chunk.build())
+            self._index[(base, rel_dir)] = state
+            self._rotation.append((base, rel_dir, state))
+            if self.on_new_dir is not None:
+                self.on_new_dir(base, rel_dir)
+            old_leaves = ()
+        else:
+            for name in state.subdirs - subdirs:
+                child = self._index.get((base, rel_dir + name + '/'))
+                if child is not None:
+                    self._drop(base, rel_dir + name + '/', child)
+            old_leaves = state.leafdirs
+            state.mtime_ns, state.ino = st.st_mtime_ns, st.st_ino
+            state.subdirs, state.leafdirs, state.chunk = subdirs, leafdirs, chunk.build()
+        if self.on_drop_leaf is not None:
+            for name in old_leaves:
+                if name not in leafdirs:
+                    self.on_drop_leaf(base, rel_dir, name)
+        if self.on_new_leaf is not None:
+            for name in leafdirs:
+                if name not in old_leaves:
+                    self.on_new_leaf(base, rel_dir, name)
+        return state
+
+    def _patch_parent(self, base, rel_dir, st):
+        """
+        Update the parent's recorded signature of directory `rel_dir`.
+        """
+        cut = rel_dir.rfind('/', 0, len(rel_dir) - 1) + 1
+        parent = self._index.get((base, rel_dir[:cut]))
+        if parent is None:
+            return
+        name = rel_dir[cut:-1]
+        try:
+            i = parent.chunk.names.index(name)
+        except ValueError:
+            return  # filtered out
+        sig = signature(st)
+        if parent.chunk.sig(i) == sig:
+            return
+        if self._touched is not None:
+            self._touched.add((base, rel_dir[:cut]))
+        _set_sig(_writable(parent), i, sig)
+
+    def _drop(self, base, rel_dir, state):
+        """
+        Forget a whole indexed subtree.
+        """
+        del self._index[(base, rel_dir)]
+        self._links.pop((base, rel_dir), None)
+        if self._touched is not None:
+            self._touched.add((base, rel_dir))
+        if self.on_drop_dir is not None:
+            self.on_drop_dir(base, rel_dir)
+        if self.on_drop_leaf is not None:
+            for name in state.leafdirs:
+                self.on_drop_leaf(base, rel_dir, name)
+        for name in state.subdirs:
+            child = self._index.get((base, rel_dir + name + '/'))
+            if child is not None:
+                self._drop(base, rel_dir + name + '/', child)
+
+    def _restat_rolling(self):
+        """
+        Re-stat leaf entries of indexed directories in round-robin order
+        until `restat_files` entries have been checked this tick. A
+        directory larger than the budget is resumed where the previous
+        tick stopped.
+        """
+        budget = self.restat_files
+        rotation = self._rotation
+        for _ in range(len(rotation)):
+            if budget is not None and budget <= 0:
+                break
+            item = rotation.popleft()
+            base, rel_dir, state = item
+            start, self._restat_at = self._restat_at, 0
+            if self._index.get((base, rel_dir)) is not state:
+                continue  # directory dropped (or re-created) since queued
+            budget, stop = self._restat_dir(base, rel_dir, state, budget, start)
+            if stop is None:
+                rotation.append(item)
+            else:
+                rotation.appendleft(item)
+                self._restat_at = stop
+                break
+
+    def _restat_dir(self, base, rel_dir, state, budget, start=0):
+        """
+        Re-stat the leaf entries of one indexed directory from entry
+        `start`; returns what is left of `budget` (None: unlimited) and
+        the entry to resume from when it ran out first (None: done).
+        """
+        dir_path = base + os.sep + rel_dir if rel_dir else base + os.sep
+        chunk = state.chunk
+        names = chunk.names
+        cols = None
+        timings = self.timings
+        for i in range(start, len(names)):
+            name = names[i]
+            if name in state.subdirs:
+                continue  # refreshed by the directory walk itself
+            if budget is not None:
+                if budget <= 0:
+                    return budget, i
+                budget -= 1
+            self.stats['files_restat'] += 1
+            try:
+                if timings is None:
+                    st = os.stat(dir_path + name)
+                else:
+                    st = timings.timed_stat(os.stat, dir_path + name)
+            except OSError:
+                # gone or now dangling: force a re-list next tick
+                state.mtime_ns = None
+                continue
+            sig = signature(st)
+            if sig != chunk.sig(i):
+                if cols is None:
+                    cols = _writable(state)
+                    if self._touched is not None:
+                        self._touched.add((base, rel_dir))
+                _set_sig(cols, i, sig)
+        return budget, None
+
+
+def _writable(state):
+    """
+    Copy-on-write: give `state` a private copy of its chunk's signature
+    columns (the old chunk may be referenced by a previous snapshot)
+    and return them.
+    """
+    chunk = state.chunk
+    cols = (array('q', chunk.mtime_ns), array('q', chunk.size),
+            array('Q', chunk.ino), array('q', chunk.ctime_ns))
+    state.chunk = DirChunk(chunk.names, chunk.isdir, *cols, chunk.dev)
+    return cols
+
+
+def _set_sig(cols, i, sig):
+    cols[0][i], cols[1][i], cols[2][i], cols[3][i] = sig
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Linux inotify backend (ctypes bindings to libc, no external modules).
+
+Every directory of the IncrementalScanner index gets a watch. Events
+only mark directories dirty; the scanner then re-lists exactly those
+directories (IncrementalScanner.refresh), so the snapshots, and thus
+the added/removed/modified events, are the same as with polling.
+
+Recorded directories that are not descended into (symlinked dirs, all
+subdirectories in non-recursive mode) get a watch too, whose events
+mark their parent dirty: their mtime is part of the parent's chunk.
+Directories reached through a followed symlink (WalkPolicy) are watched
+at the link's target.
+
+A full reconciliation scan runs every `reconcile` seconds and right
+after an IN_Q_OVERFLOW, to catch anything the kernel queue dropped or
+never reported (targets of symlinked files, writes through hard links
+outside the tree).
+If watches run out (ENOSPC) the backend degrades to plain incremental
+polling instead of failing.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import sys
+import time
+
+log = logging.getLogger("dirpoll")
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_MASK_ADD = 0x20000000
+
+# indexed directories: any change of an entry or of the directory itself
+DIR_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+            | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+            | IN_ONLYDIR | IN_DONT_FOLLOW | IN_MASK_ADD)
+# leaf directories: only what changes their own mtime/ctime
+LEAF_MASK = (IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+             | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_MASK_ADD)
+
+_EVENT = struct.Struct('iIII')   # wd, mask, cookie, len
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        libc.inotify_rm_watch.restype = ctypes.c_int
+        _libc = libc
+    return _libc
+
+
+def available():
+    """
+    Return (True, '') if inotify can be used here, else (False, reason).
+    """
+    if not sys.platform.startswith('linux'):
+        return False, "inotify is Linux-only"
+    try:
+        libc = _load_libc()
+        libc.inotify_init1
+    except (OSError, AttributeError) as exc:
+        return False, f"libc without inotify ({exc})"
+    return True, ''
+
+
+class InotifyBackend:
+    """
+    Event-driven backend around an IncrementalScanner.
+
+    Watches are registered under tokens: ('dir', key) for an indexed
+    directory, ('leaf', key, name) for a non-descended directory recorded
+    in `key`. One inode can carry several tokens (a symlinked directory
+    pointing inside the tree), so the kernel watch is only removed when
+    its last token is gone.
+    """
+    name = 'inotify'
+
+    def __init__(self, inc, interval, reconcile=60.0, debounce=0.02):
+        self.inc = inc
+        self.interval = interval   # polling period once degraded
+        self.reconcile = reconcile
+        self.debounce = debounce
+        self.reason = ''
+        self.degraded = False
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self._wd = {}         # wd -> set of tokens
+        self._tok = {}        # token -> wd
+        self._orphans = set()
+        self._readd = set()   # tokens whose inode went away (IN_IGNORED)
+        self._next_reconcile = 0.0
+        inc.on_new_dir = lambda base, rel_dir: self._watch(('dir', (base, rel_dir)))
+        inc.on_drop_dir = lambda base, rel_dir: self._forget(('dir', (base, rel_dir)))
+        inc.on_new_leaf = lambda base, rel_dir, name: self._watch(('leaf', (base, rel_dir), name))
+        inc.on_drop_leaf = lambda base, rel_dir, name: self._forget(('leaf', (base, rel_dir), name))
+
+    # --- backend protocol ----------------------------------------------
+    def fds(self):
+        return [] if self.degraded else [self._fd]
+
+    def timeout(self):
+        if self.degraded:
+            return self.interval
+        return max(0.0, self._next_reconcile - time.monotonic())
+
+    def baseline(self):
+        return self._full_scan()
+
+    def poll(self, ready):
+        """
+        Return a new Snapshot, or None when there is nothing to report.
+        """
+        if self.degraded or time.monotonic() >= self._next_reconcile:
+            self._drain()  # events are covered by the full scan
+            return self._full_scan()
+        if self._fd not in ready:
+            return None
+        time.sleep(self.debounce)   # let a burst of events settle
+        dirty, overflow = self._drain()
+        if overflow:
+            log.warning("inotify queue overflow: running a reconciliation scan")
+            return self._full_scan()
+        if not dirty and not self._readd:
+            return None
+        snap = self.inc.refresh(dirty)
+        self._settle()
+        return snap
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        inc = self.inc
+        inc.on_new_dir = inc.on_drop_dir = inc.on_new_leaf = inc.on_drop_leaf = None
+
+    def dir_meta(self):
+        return self.inc.dir_meta()
+
+    def reconfigure(self, bases, match, prune, policy, snapshot, refilter=True, relist=False):
+        """
+        Switch to new bases and filters (IncrementalScanner.reconfigure());
+        the watches follow the index. Re-listing everything is left to an
+        immediate reconciliation scan.
+        """
+        snap = self.inc.reconfigure(bases, match, prune, policy, snapshot, refilter, relist)
+        self._settle()
+        if relist:
+            self._next_reconcile = 0.0
+        return snap
+
+    # --- internals ---------------------------------------------------------
+    def _full_scan(self):
+        snap = self.inc.scan()
+        self._settle()
+        self._next_reconcile = time.monotonic() + self.reconcile
+        return snap
+
+    def _settle(self):
+        """
+        After a refresh: re-attach watches lost to replaced inodes and
+        release watches no token refers to any more.
+        """
+        readd, self._readd = self._readd, set()
+        index = self.inc._index
+        for token in readd:
+            state = index.get(token[1])
+            if state is None:
+                continue
+            if token[0] == 'dir' or token[2] in state.leafdirs:
+                self._watch(token)
+        for wd in self._orphans:
+            if not self._wd.get(wd):
+                self._wd.pop(wd, None)
+                if not self.degraded:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+        self._orphans.clear()
+
+    def _watch(self, token):
+        if self.degraded:
+            return
+        base, rel_dir = token[1]
+        if token[0] == 'dir':
+            path = base + os.sep + rel_dir if rel_dir else base
+            mask = DIR_MASK
+            if token[1] in self.inc._links:
+                # reached through a followed symlink, which may be `path` itself
+                mask &= ~IN_DONT_FOLLOW
+        else:
+            path = base + os.sep + rel_dir + token[2]
+            mask = LEAF_MASK
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self._degrade("inotify watch limit reached (fs.inotify.max_user_watches)")
+            # ENOENT/ENOTDIR: raced with a removal, the parent is dirty anyway
+            return
+        old = self._tok.get(token)
+        if old is not None and old != wd:
+            self._forget(token)
+        self._tok[token] = wd
+        self._wd.setdefault(wd, set()).add(token)
+
+    def _forget(self, token):
+        wd = self._tok.pop(token, None)
+        if wd is None:
+            return
+        tokens = self._wd.get(wd)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                # released after the batch unless a move re-attached it meanwhile
+                self._orphans.add(wd)
+
+    def _degrade(self, reason):
+        log.warning(f"{reason}: falling back to polling")
+        self.degraded = True
+        self.reason = reason
+        self.name = 'polling'
+
+    def _drain(self):
+        """
+        Read all pending events; return (dirty directories, overflow).
+        """
+        dirty = set()
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                overflow = True
+                break
+            if not buf:
+                break
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, pos)
+                named = length and buf[pos + _EVENT.size] != 0
+                pos += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                tokens = self._wd.get(wd)
+                if not tokens:
+                    continue
+                if mask & IN_IGNORED:
+                    del self._wd[wd]
+                for token in list(tokens):
+                    key = token[1]
+                    if token[0] == 'leaf' or not named:
+                        # the directory itself changed: its parent records it
+                        dirty.add(key if token[0] == 'leaf' else _parent(key))
+                    if token[0] == 'dir':
+                        dirty.add(key)
+                    if mask & IN_IGNORED:
+                        self._tok.pop(token, None)
+                        self._readd.add(token)
+        dirty.discard(None)
+        return dirty, overflow
+
+
+def _parent(key):
+    """
+    Key of the directory recording `key`, None for a base.
+    """
+    base, rel_dir = key
+    if not rel_dir:
+        return None
+    cut = rel_dir.rfind('/', 0, len(rel_dir) - 1) + 1
+    return (base, rel_dir[:cut])
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only change journal with sequence numbers.
+
+The log file is written for people; consumers that tail and parse it
+lose their place when it is rotated. With the 'journal_dir' engine
+option every event is also appended to a journal:
+
+  directory/
+    00000000000000000001.jsonl   segments, named after their first seq
+    00000000000000000001.idx
+    00000000000000052118.jsonl
+    00000000000000052118.idx
+    cursors/NAME                 positions of named consumers (Cursor)
+
+A segment is JSON Lines, one event per line, in the JsonLinesSink format
+plus "seq", the event's sequence number (1, 2, 3, ... with no gaps, also
+across restarts). A new segment is started once the current one reaches
+`segment_bytes`; with `keep_segments` the oldest are then deleted.
+
+The .idx file next to a segment is a sparse index: one entry (seq u64,
+time f64, byte offset u64, little-endian) every `index_every` events,
+the first event of the segment included. Its time is the largest event
+time so far, so the index is sorted by time even when events are not
+(debounced events keep the time of their last change). Seeking to a
+sequence number or a time is a binary search over the segment names and
+then over one index, followed by reading at most `index_every` lines.
+
+JournalReader replays the journal from a cursor (the last seq a
+consumer has processed); any number of readers, in any process, can
+read while the monitor writes, each at its own pace. A line the writer
+has not finished yet is left for the next read, and a torn last line
+left by a crash is truncated when the journal is opened again.
+"""
+
+import json
+import logging
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+
+from dirpoll.output import event_record
+
+log = logging.getLogger("dirpoll")
+
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_SUFFIX = '.idx'
+_ENTRY = struct.Struct('<QdQ')   # seq, time (running max), byte offset
+
+
+def _segment_name(first, suffix):
+    return f"{first:020d}{suffix}"
+
+
+def list_segments(directory):
+    """
+    First sequence numbers of the segments in `directory`, in order.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(SEGMENT_SUFFIX)]) for n in names
+                  if n.endswith(SEGMENT_SUFFIX) and n[:-len(SEGMENT_SUFFIX)].isdigit())
+
+
+def read_index(directory, first):
+    """
+    Sparse index of a segment: (seqs, times, offsets) lists. A torn last
+    entry is ignored.
+    """
+    try:
+        with open(os.path.join(directory, _segment_name(first, INDEX_SUFFIX)), 'rb') as fh:
+            data = fh.read()
+    except FileNotFoundError:
+        return [], [], []
+    data = data[:len(data) - len(data) % _ENTRY.size]
+    entries = list(_ENTRY.iter_unpack(data))
+    return [e[0] for e in entries], [e[1] for e in entries], [e[2] for e in entries]
+
+
+class Journal:
+    """
+    Writer: appends events to the current segment.
+    """
+
+    def __init__(self, directory, segment_bytes=64 << 20, index_every=256,
+                 keep_segments=None, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self.keep_segments = keep_segments
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._segments = list_segments(directory)
+        self._data = self._index = None
+        self.seq = 0          # last sequence number written
+        self._tmax = 0.0      # largest event time written
+        self._first = None    # first seq of the current segment
+        self._size = 0
+        if self._segments:
+            self._recover(self._segments[-1])
+
+    def append(self, events):
+        """
+        Append (time, kind, base, rel, src) events; return the last seq.
+        """
+        data, index = [], []
+        for ts, kind, base, rel, src in events:
+            if self._data is None:
+                self._open(self.seq + 1)
+            elif self._size >= self.segment_bytes and self.seq >= self._first:
+                self._write(data, index)
+                data, index = [], []
+                self._open(self.seq + 1)
+            self.seq += 1
+            if ts > self._tmax:
+                self._tmax = ts
+            obj = {'seq': self.seq}
+            obj.update(event_record(ts, kind, base, rel, src))
+            line = (json.dumps(obj) + '\n').encode('ascii')
+            if (self.seq - self._first) % self.index_every == 0:
+                index.append(_ENTRY.pack(self.seq, self._tmax, self._size))
+            data.append(line)
+            self._size += len(line)
+        self._write(data, index)
+        return self.seq
+
+    def close(self):
+        for fh in (self._data, self._index):
+            if fh is not None:
+                fh.close()
+        self._data = self._index = None
+
+    # ----------------------------------------------------------------
+    def _path(self, first, suffix):
+        return os.path.join(self.directory, _segment_name(first, suffix))
+
+    def _write(self, data, index):
+        if data:
+            # the lines before their index entries: a reader never finds
+            # an offset past the end of the data
+            self._data.write(b''.join(data))
+            self._data.flush()
+            if self.fsync:
+                os.fsync(self._data.fileno())
+        if index:
+            self._index.write(b''.join(index))
+            self._index.flush()
+
+    def _open(self, first):
+        """
+        Start (or, after _recover(), reopen) the segment beginning at `first`.
+        """
+        self.close()
+        if first not in self._segments:
+            self._segments.append(first)
+            self._size = 0
+        self._first = first
+        self._data = open(self._path(first, SEGMENT_SUFFIX), 'ab')
+        self._index = open(self._path(first, INDEX_SUFFIX), 'ab')
+        if self.keep_segments:
+            while len(self._segments) > self.keep_segments:
+                old = self._segments.pop(0)
+                for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+                    try:
+                        os.remove(self._path(old, suffix))
+                    except FileNotFoundError:
+                        pass
+                log.info(f"Journal: removed segment {_segment_name(old, SEGMENT_SUFFIX)}")
+
+    def _recover(self, first):
+        """
+        Find the last complete event of the last segment, truncate what
+        follows it and continue that segment.
+        """
+        seqs, times, offsets = read_index(self.directory, first)
+        path = self._path(first, SEGMENT_SUFFIX)
+        with open(path, 'rb') as fh:
+            end = fh.seek(0, os.SEEK_END)
+            while offsets and offsets[-1] >= end:
+                del seqs[-1], times[-1], offsets[-1]
+            good = offsets[-1] if offsets else 0
+            self.seq = first - 1
+            # may include the time of a torn event: too high is harmless
+            self._tmax = times[-1] if times else 0.0
+            fh.seek(good)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    rec = json.loads(line)
+                    seq, ts = rec['seq'], rec['time']
+                except (ValueError, KeyError, TypeError):
+                    break
+                self.seq = seq
+                self._tmax = max(self._tmax, ts)
+                good += len(line)
+        if good < end:
+            log.warning(f"Journal: truncated {end - good} bytes of an incomplete event "
+                        f"in {_segment_name(first, SEGMENT_SUFFIX)}")
+            os.truncate(path, good)
+        kept = bisect_left(offsets, good)
+        with open(self._path(first, INDEX_SUFFIX), 'ab') as fh:
+            fh.truncate(kept * _ENTRY.size)
+        self._size = good
+        self._open(first)
+
+
+class JournalSink:
+    """
+    EventPipeline sink appending every batch to a Journal.
+    """
+
+    def __init__(self, directory, segment_bytes=64 << 20, keep_segments=None):
+        self.journal = Journal(directory, segment_bytes, keep_segments=keep_segments)
+
+    def write(self, events):
+        self.journal.append(events)
+
+    def close(self):
+        self.journal.close()
+
+
+class JournalReader:
+    """
+    Replay of a journal directory, safe to use while it is written.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._indexes = {}   # first seq -> index of a segment that is no longer written
+
+    def first_seq(self):
+        """
+        Oldest sequence number still in the journal, or None if it is empty.
+        """
+        segments = list_segments(self.directory)
+        return segments[0] if segments else None
+
+    def last_seq(self):
+        """
+        Newest complete sequence number, or 0 if the journal is empty.
+        """
+        segments = list_segments(self.directory)
+        if not segments:
+            return 0
+        last = segments[-1] - 1
+        for rec in self._records(segments[-1], self._start(segments, -1, None)):
+            last = rec['seq']
+        return last
+
+    def read(self, after=0, limit=None):
+        """
+        Yield the events (dicts with "seq") that follow sequence number
+        `after`, up to what is written now; at most `limit` of them.
+        """
+        segments = list_segments(self.directory)
+        if not segments:
+            return
+        if after + 1 < segments[0]:
+            log.warning(f"Journal: events {after + 1}-{segments[0] - 1} were already "
+                        f"removed; replaying from {segments[0]}")
+        i = max(0, bisect_right(segments, after + 1) - 1)
+        count = 0
+        for j in range(i, len(segments)):
+            offset = self._start(segments, j, after + 1) if j == i else 0
+            for rec in self._records(segments[j], offset):
+                if rec['seq'] <= after:
+                    continue
+                yield rec
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def follow(self, after=0, poll=0.5):
+        """
+        read() forever: wait `poll` seconds whenever the reader has caught up.
+        """
+        while True:
+            caught_up = True
+            for rec in self.read(after, 10000):
+                after = rec['seq']
+                caught_up = False
+                yield rec
+            if caught_up:
+                time.sleep(poll)
+
+    def seq_at(self, when):
+        """
+        Cursor (the seq before the first event) for replaying from time
+        `when` (time.time() seconds): read(seq_at(t)) starts with the
+        first event detected at or after t.
+        """
+        segments = list_segments(self.directory)
+        if not segments:
+            return 0
+        # last segment whose first event is older than `when`
+        lo, hi = 0, len(segments)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            times = self._index(segments, mid)[1]
+            if times and times[0] >= when:
+                hi = mid
+            else:
+                lo = mid + 1
+        i = max(0, lo - 1)
+        _, times, offsets = self._index(segments, i)
+        # last entry whose running maximum is below `when`
+        k = bisect_left(times, when) - 1
+        offset = offsets[k] if k >= 0 else 0
+        for j in range(i, len(segments)):
+            for rec in self._records(segments[j], offset if j == i else 0):
+                if rec['time'] >= when:
+                    return rec['seq'] - 1
+        return self.last_seq()
+
+    # ----------------------------------------------------------------
+    def _index(self, segments, i):
+        first = segments[i]
+        cached = self._indexes.get(first)
+        if cached is not None:
+            return cached
+        index = read_index(self.directory, first)
+        if i < len(segments) - 1:
+            self._indexes[first] = index   # complete: no longer written
+        return index
+
+    def _start(self, segments, i, seq):
+        """
+        Byte offset in segment i of the indexed event at or before `seq`
+        (None: the last indexed event).
+        """
+        seqs, _, offsets = self._index(segments, i)
+        if not seqs:
+            return 0
+        k = len(seqs) - 1 if seq is None else bisect_right(seqs, seq) - 1
+        return offsets[k] if k >= 0 else 0
+
+    def _records(self, first, offset):
+        try:
+            fh = open(os.path.join(self.directory, _segment_name(first, SEGMENT_SUFFIX)), 'rb')
+        except FileNotFoundError:
+            return   # removed by retention meanwhile
+        with fh:
+            fh.seek(offset)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    return   # still being written
+                yield json.loads(line)
+
+
+class Cursor:
+    """
+    Persistent position of a named consumer: the last seq it processed,
+    kept in directory/cursors/NAME.
+
+        reader, cursor = JournalReader(d), Cursor(d, 'indexer')
+        for rec in reader.read(cursor.seq):
+            handle(rec)
+            cursor.commit(rec['seq'])
+    """
+
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, 'cursors', name)
+        try:
+            with open(self.path, encoding='ascii') as fh:
+                self.seq = int(fh.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            self.seq = 0
+
+    def commit(self, seq):
+        """
+        Record `seq` as processed (written atomically).
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='ascii') as fh:
+            fh.write(f"{seq}\n")
+        os.replace(tmp, self.path)
+        self.seq = seq
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Per-tick instrumentation.
+
+With the 'metrics' engine option the Watcher measures every tick that
+scans:
+
+  walk    listing directories (scan time minus stat and filter time;
+          with inotify it includes the debounce pause)
+  stat    os.stat / DirEntry.stat calls
+  filter  include/exclude matching and subtree pruning
+  diff    snapshot diff, rename pairing, content hashing
+  emit    handing the events to the output pipeline
+
+plus the entries stat'ed, the directories pruned by the filters and the
+events produced. Each measure is kept in a RollingHistogram: the last
+`window` samples for percentiles (logged every `metrics_every` seconds)
+and cumulative buckets for the Prometheus text format, served on
+127.0.0.1:`metrics_port`/metrics by MetricsServer when a port is set.
+
+A tick whose scan takes more than `slow_fraction` of the polling interval
+is logged as a warning (at most once per log period): the directories
+should then be split across several monitors.
+
+Stat and filter times come from ScanTimings, filled by the scanners
+(dirpoll.scanner, dirpoll.incremental) and by the wrapped filter
+predicates of timed_filters(). Parallel scans add to it from several
+threads without locking, so their figures are approximate.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("dirpoll")
+
+_clock = time.perf_counter
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# name -> (help, buckets, unit shown in the log)
+MEASURES = {
+    'walk_seconds': ("Directory listing time per tick", SECONDS_BUCKETS, 's'),
+    'stat_seconds': ("Stat time per tick", SECONDS_BUCKETS, 's'),
+    'filter_seconds': ("Filter matching and pruning time per tick", SECONDS_BUCKETS, 's'),
+    'diff_seconds': ("Snapshot diff time per tick", SECONDS_BUCKETS, 's'),
+    'emit_seconds': ("Event hand-off time per tick", SECONDS_BUCKETS, 's'),
+    'scan_seconds': ("Total scan time per tick", SECONDS_BUCKETS, 's'),
+    'entries_scanned': ("Entries stat'ed per tick", COUNT_BUCKETS, ''),
+    'dirs_pruned': ("Directories pruned by the filters per tick", COUNT_BUCKETS, ''),
+    'events': ("Events produced per tick", COUNT_BUCKETS, ''),
+}
+
+
+class ScanTimings:
+    """
+    Accumulators the scanners add to during one tick.
+    """
+    __slots__ = ('stat_time', 'stat_calls', 'filter_time', 'pruned')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stat_time = 0.0     # seconds in stat calls
+        self.stat_calls = 0
+        self.filter_time = 0.0   # seconds in match/prune
+        self.pruned = 0          # directories pruned
+
+    def timed_stat(self, stat, *args):
+        """
+        stat(*args), with its time added to stat_time.
+        """
+        t0 = _clock()
+        try:
+            return stat(*args)
+        finally:
+            self.stat_time += _clock() - t0
+            self.stat_calls += 1
+
+
+def timed_filters(match, prune, timings):
+    """
+    Wrap the filter predicates so that they add their time (and the
+    pruned directories) to `timings`.
+    """
+    tmatch = tprune = None
+    if match is not None:
+        def tmatch(rel):
+            t0 = _clock()
+            ok = match(rel)
+            timings.filter_time += _clock() - t0
+            return ok
+    if prune is not None:
+        def tprune(rel_dir):
+            t0 = _clock()
+            cut = prune(rel_dir)
+            timings.filter_time += _clock() - t0
+            if cut:
+                timings.pruned += 1
+            return cut
+    return tmatch, tprune
+
+
+class RollingHistogram:
+    """
+    Last `window` samples (for percentiles) plus cumulative bucket
+    counts, sum and count since start (for Prometheus).
+    """
+
+    def __init__(self, buckets, window=1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.recent.append(value)
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def percentile(self, q):
+        if not self.recent:
+            return 0.0
+        s = sorted(self.recent)
+        return s[min(len(s) - 1, int(q * len(s)))]
+
+
+class Metrics:
+    """
+    Rolling histograms of the MEASURES, plus tick counters.
+    """
+
+    def __init__(self, interval, slow_fraction=0.5, log_every=60.0, window=1024):
+        self.interval = interval
+        self.slow_fraction = slow_fraction
+        self.log_every = log_every
+        self.hist = {name: RollingHistogram(spec[1], window) for name, spec in MEASURES.items()}
+        self.ticks = 0
+        self.slow_ticks = 0
+        self._lock = threading.Lock()
+        self._next_log = time.monotonic() + log_every
+        self._warned = False
+
+    def record(self, values):
+        """
+        Add one tick ({measure: value}); log the summary when due and warn
+        about slow scans.
+        """
+        with self._lock:
+            self.ticks += 1
+            for name, value in values.items():
+                self.hist[name].observe(value)
+            slow = values.get('scan_seconds', 0.0) > self.slow_fraction * self.interval
+            if slow:
+                self.slow_ticks += 1
+        if slow and not self._warned:
+            self._warned = True
+            log.warning(f"Scan took {values['scan_seconds']:.2f}s, over "
+                        f"{self.slow_fraction:.0%} of the {self.interval:g}s interval: "
+                        f"consider splitting the directories across several monitors")
+        now = time.monotonic()
+        if self.log_every and now >= self._next_log:
+            self._next_log = now + self.log_every
+            self._warned = False
+            log.info(self.summary())
+
+    def summary(self):
+        """
+        One log line: p50/p99 of every measure over the window.
+        """
+        with self._lock:
+            parts = []
+            for name, (_, _, unit) in MEASURES.items():
+                h = self.hist[name]
+                short = name.replace('_seconds', '')
+                if unit == 's':
+                    parts.append(f"{short} {h.percentile(0.5) * 1000:.1f}/"
+                                 f"{h.percentile(0.99) * 1000:.1f}ms")
+                else:
+                    parts.append(f"{short} {h.percentile(0.5):.0f}/{h.percentile(0.99):.0f}")
+            return (f"Metrics ({self.ticks} ticks, {self.slow_ticks} slow; p50/p99): "
+                    + ", ".join(parts))
+
+    def prometheus(self):
+        """
+        Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, (help_text, _, _) in MEASURES.items():
+                h = self.hist[name]
+                metric = f"dirpoll_tick_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                total = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    total += n
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {total}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum {h.sum:.6f}")
+                lines.append(f"{metric}_count {h.count}")
+            lines.append("# HELP dirpoll_ticks_total Ticks that scanned")
+            lines.append("# TYPE dirpoll_ticks_total counter")
+            lines.append(f"dirpoll_ticks_total {self.ticks}")
+            lines.append("# HELP dirpoll_slow_ticks_total Ticks whose scan exceeded "
+                         "the slow fraction of the interval")
+            lines.append("# TYPE dirpoll_slow_ticks_total counter")
+            lines.append(f"dirpoll_slow_ticks_total {self.slow_ticks}")
+            lines.append("# HELP dirpoll_interval_seconds Polling interval")
+            lines.append("# TYPE dirpoll_interval_seconds gauge")
+            lines.append(f"dirpoll_interval_seconds {self.interval:g}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serve Metrics.prometheus() at http://host:port/metrics from a daemon
+    thread (http.server, localhost by default).
+    """
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass   # keep scrapes out of the event log
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="dirpoll-metrics", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
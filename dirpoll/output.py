@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous, batched event output.
+
+The monitor loop hands each tick's events to an EventPipeline and goes
+back to scanning; a writer thread drains a bounded queue and passes the
+events to the sinks in batches:
+
+  • LogSink        – the usual log lines, formatted per event but written
+                     to each handler's stream with one write per batch,
+  • JsonLinesSink  – one JSON object per event, for downstream tools,
+  • JournalSink    – the same objects with sequence numbers, in the
+                     segmented journal of dirpoll.journal.
+
+When the queue is full the `policy` decides:
+
+  • 'block'    – the scan loop waits for the writer (nothing is lost),
+  • 'drop'     – new events are discarded and counted,
+  • 'coalesce' – an event for a path that is already queued is merged
+                 into it (added+modified = added, added+removed = nothing,
+                 removed+added = modified, renamed+removed = removed at
+                 the old path, ...); once the queue is full,
+                 further events are folded into one 'modified' event of
+                 their parent directory (rel '' for the base itself), so
+                 the backlog is bounded by the number of directories that
+                 changed rather than by the number of events.
+
+Events keep the time they were detected (the one submitted with them,
+else the time of submit()), so log timestamps do not drift with the
+writer's backlog.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from dirpoll.diff import ADDED, MODIFIED, REMOVED, RENAMED
+
+log = logging.getLogger("dirpoll")
+
+POLICIES = ('block', 'drop', 'coalesce')
+
+# (earlier kind, later kind) -> merged kind, None when the two cancel out.
+# RENAMED + REMOVED is a REMOVED of the path the entry was renamed from.
+_MERGE = {
+    (ADDED, MODIFIED): ADDED,
+    (ADDED, REMOVED): None,
+    (REMOVED, ADDED): MODIFIED,
+    (MODIFIED, MODIFIED): MODIFIED,
+    (MODIFIED, REMOVED): REMOVED,
+    (RENAMED, MODIFIED): RENAMED,
+    (RENAMED, REMOVED): REMOVED,
+}
+
+
+def merge_kind(first, then):
+    """
+    Kind of the one event equivalent to `first` followed by `then` for
+    the same path, or None when they cancel out (see _MERGE).
+    """
+    return _MERGE.get((first, then), then)
+
+
+class EventPipeline:
+    """
+    Bounded queue of (time, kind, base, rel, src) events and the writer
+    thread feeding `sinks` (objects with write(events) and close()).
+    `src` is the (base, rel) a RENAMED entry came from, else None.
+    """
+
+    def __init__(self, sinks, maxsize=100000, policy='block', batch=1000):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown backpressure policy {policy!r}")
+        self.sinks = list(sinks)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch = batch
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'coalesced': 0}
+        self._queue = deque()        # (base, rel) keys, in arrival order
+        self._pending = {}           # (base, rel) -> (time, kind, src)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="dirpoll-output", daemon=True)
+        self._thread.start()
+
+    def submit(self, events):
+        """
+        Queue an iterable of (kind, base, rel), (kind, base, rel, src) or
+        (kind, base, rel, src, time) events; `time` defaults to now.
+        """
+        now = time.time()
+        cond = self._cond
+        with cond:
+            for event in events:
+                kind, base, rel = event[:3]
+                src = event[3] if len(event) > 3 else None
+                ts = event[4] if len(event) > 4 and event[4] is not None else now
+                key = (base, rel)
+                queued = self._pending.get(key)
+                if queued is not None:
+                    if self.policy == 'coalesce':
+                        self._merge(key, queued[1], kind, ts)
+                        continue
+                    # same path queued twice (block/drop): keep both events
+                    key = (base, rel, ts, kind)
+                if self.policy == 'coalesce' and len(self._queue) >= self.maxsize:
+                    self._fold(base, rel, ts)
+                    continue
+                while len(self._queue) >= self.maxsize and not self._closed:
+                    if self.policy == 'drop':
+                        break
+                    cond.notify_all()
+                    cond.wait()
+                if len(self._queue) >= self.maxsize:
+                    self.stats['dropped'] += 1
+                    continue
+                self._queue.append(key)
+                self._pending[key] = (ts, kind, src)
+                self.stats['queued'] += 1
+            cond.notify_all()
+
+    def close(self, timeout=None):
+        """
+        Write out what is queued, stop the writer and close the sinks.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        for sink in self.sinks:
+            sink.close()
+        if self.stats['dropped']:
+            log.warning(f"output queue full: {self.stats['dropped']} events dropped")
+
+    # ----------------------------------------------------------------
+    def _merge(self, key, old, new, ts):
+        merged = merge_kind(old, new)
+        self.stats['coalesced'] += 1
+        if merged is None:
+            # cancelled: leave a tombstone in the queue order
+            del self._pending[key]
+        elif old == RENAMED and new == REMOVED:
+            # moved, then deleted: the original path is what disappeared
+            origin = self._pending.pop(key)[2]
+            before = self._pending.get(origin)
+            if before is None:
+                self._queue.append(origin)
+                self._pending[origin] = (ts, REMOVED, None)
+            else:
+                # something new appeared at the old path since
+                self._pending[origin] = (before[0], merge_kind(REMOVED, before[1]), None)
+        else:
+            ts, _, src = self._pending[key]
+            self._pending[key] = (ts, merged, src if merged == RENAMED else None)
+
+    def _fold(self, base, rel, now):
+        """
+        Queue full ('coalesce'): report `rel` as a change of its parent.
+        """
+        self.stats['coalesced'] += 1
+        cut = rel.rfind('/', 0, len(rel) - 1) + 1
+        key = (base, rel[:cut])
+        queued = self._pending.get(key)
+        if queued is not None:
+            if queued[1] == REMOVED:
+                self._pending[key] = (queued[0], MODIFIED, None)
+            return
+        self._queue.append(key)
+        self._pending[key] = (now, MODIFIED, None)
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while not self._queue and not self._closed:
+                    cond.wait()
+                if not self._queue and self._closed:
+                    return
+                batch = []
+                queue, pending = self._queue, self._pending
+                while queue and len(batch) < self.batch:
+                    key = queue.popleft()
+                    item = pending.pop(key, None)
+                    if item is not None:
+                        batch.append((item[0], item[1], key[0], key[1], item[2]))
+                cond.notify_all()
+            if batch:
+                for sink in self.sinks:
+                    try:
+                        sink.write(batch)
+                    except Exception:
+                        log.exception(f"output sink {type(sink).__name__} failed")
+                self.stats['written'] += len(batch)
+
+
+class LogSink:
+    """
+    Log lines through the handlers of `logger` (the root logger by
+    default), formatted exactly as logging.info(format_event(kind, base,
+    rel, src)) would format them, but written with one stream write per
+    batch.
+    """
+
+    def __init__(self, format_event, logger=None, level=logging.INFO):
+        self.format_event = format_event
+        self.logger = logger or logging.getLogger()
+        self.level = level
+
+    def write(self, events):
+        logger = self.logger
+        if not logger.isEnabledFor(self.level):
+            return
+        records = []
+        for ts, kind, base, rel, src in events:
+            record = logger.makeRecord(logger.name, self.level, __file__, 0,
+                                       self.format_event(kind, base, rel, src), None, None)
+            record.created = ts
+            record.msecs = (ts - int(ts)) * 1000
+            records.append(record)
+        for handler in _handlers(logger):
+            if self.level < handler.level:
+                continue
+            stream = getattr(handler, 'stream', None)
+            if stream is None:
+                for record in records:
+                    handler.handle(record)
+                continue
+            text = ''.join(handler.format(r) + handler.terminator
+                           for r in records if handler.filter(r))
+            handler.acquire()
+            try:
+                stream.write(text)
+                stream.flush()
+            finally:
+                handler.release()
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """
+    Append events to `path` as JSON Lines:
+      {"time": ..., "event": "added", "base": ..., "path": ..., "type": "file"}
+    renames also carry "from_base" and "from".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'a', encoding='utf-8')
+
+    def write(self, events):
+        self._fh.write(''.join(json.dumps(event_record(*e)) + '\n' for e in events))
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+LABELS = {ADDED: "+Added   ", REMOVED: "-Removed ", MODIFIED: "*Modified",
+          RENAMED: "~Renamed "}
+
+
+def format_event(kind, base, rel, src=None, labels=LABELS):
+    """
+    Log line of one event (LogSink): `labels` maps each kind to its tag.
+    `src` is the (base, relative_path) a renamed entry came from.
+    """
+    typ = "DIR" if rel.endswith("/") else "FILE"
+    path = rel.rstrip('/') or '.'
+    if src is not None:
+        old = src[1].rstrip('/') or '.'
+        if src[0] != base:
+            old = f"[{src[0]}] {old}"
+        path = f"{old} -> {path}"
+    return f"[{base}] {labels[kind]}{typ}: {path}"
+
+
+def event_record(ts, kind, base, rel, src=None):
+    """
+    JSON object of one event (JsonLinesSink, dirpoll.journal).
+    """
+    obj = {'time': ts, 'event': kind, 'base': base, 'path': rel.rstrip('/'),
+           'type': 'dir' if rel.endswith('/') else 'file'}
+    if src is not None:
+        obj['from_base'], obj['from'] = src[0], src[1].rstrip('/')
+    return obj
+
+
+def _handlers(logger):
+    """
+    Handlers a record logged on `logger` would reach.
+    """
+    while logger is not None:
+        yield from logger.handlers
+        if not logger.propagate:
+            break
+        logger = logger.parent
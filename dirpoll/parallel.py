@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel multi-root / subtree scanning on a thread pool.
+
+os.scandir and os.stat release the GIL, so several threads can wait on
+the filesystem at the same time: a slow NFS mount no longer holds up
+the local bases. Work is split per directory with work stealing:
+
+  • every worker owns a deque of pending directories and pops from its
+    own end (depth-first, good locality),
+  • an idle worker steals from the opposite end of another worker's
+    deque, which holds the oldest and usually largest subtrees,
+  • each worker fills a private Snapshot; their directory chunks are
+    merged at the end (keys are disjoint), giving the same result as
+    scanner.scan().
+
+With `device_workers` (and a WalkPolicy that reports devices) at most
+that many threads list directories of the same st_dev at once: a worker
+skips the queued directories of a device that is saturated and takes
+another device's, so a slow NFS mount cannot occupy every thread while
+local disks wait. Workers wait only when all queued work is on
+saturated devices.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dirpoll import scanner
+from dirpoll.snapshot import Snapshot
+
+
+class ParallelScanner:
+    """
+    Reusable parallel scanner. The thread pool lives as long as the
+    object; call close() (or use it as a context manager) to release it.
+    """
+
+    def __init__(self, workers=4, executor=None, device_workers=None):
+        self.workers = max(1, int(workers))
+        self.device_workers = device_workers
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="dirpoll-scan")
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def scan(self, bases, recursive, include_hidden, match=None, prune=None, timings=None,
+             policy=None):
+        """
+        Same contract as scanner.scan(), executed on the thread pool.
+        """
+        if self.workers == 1:
+            return scanner.scan(bases, recursive, include_hidden, match, prune, timings, policy)
+        limited = self.device_workers and policy is not None and policy.devices
+        roots = []
+        for base in bases:
+            base = scanner.resolve_base(base)
+            dev = None
+            if limited:
+                try:
+                    dev = policy.base_dev(base)
+                except OSError:
+                    pass
+            roots.append((base, base, '', (), dev))
+        if not recursive:
+            # one task per base, nothing to steal
+            futures = [self._executor.submit(scanner.scan, [base], False, include_hidden, match,
+                                             None, timings)
+                       for base, _, _, _, _ in roots]
+            snapshot = Snapshot()
+            for fut in futures:
+                snapshot.update(fut.result())
+            return snapshot
+        return _WorkStealingWalk(self, roots, include_hidden, match, prune, timings, policy,
+                                 self.device_workers if limited else None).run()
+
+
+class _WorkStealingWalk:
+    """
+    State of one parallel recursive walk.
+    """
+
+    def __init__(self, owner, roots, include_hidden, match, prune, timings=None, policy=None,
+                 limit=None):
+        self.owner = owner
+        self.include_hidden = include_hidden
+        self.match = match
+        self.prune = prune
+        self.timings = timings
+        self.policy = policy
+        self.limit = limit          # directories of one st_dev listed at once
+        self.busy = {}              # st_dev -> directories being listed
+        n = owner.workers
+        self.queues = [deque() for _ in range(n)]
+        for i, root in enumerate(roots):
+            self.queues[i % n].append(root)
+        self.pending = len(roots)   # directories queued or being listed
+        self.cond = threading.Condition()
+
+    def run(self):
+        futures = [self.owner._executor.submit(self._worker, i)
+                   for i in range(len(self.queues))]
+        snapshot = Snapshot()
+        for fut in futures:
+            snapshot.update(fut.result())
+        return snapshot
+
+    def _next_task(self, me):
+        own = self.queues[me]
+        try:
+            return own.pop()
+        except IndexError:
+            pass
+        n = len(self.queues)
+        for k in range(1, n):
+            try:
+                return self.queues[(me + k) % n].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _next_limited_task(self, me):
+        """
+        _next_task() skipping directories of saturated devices (called
+        with self.cond held, which then guards the deques).
+        """
+        busy, limit = self.busy, self.limit
+        own = self.queues[me]
+        for i in range(len(own) - 1, -1, -1):
+            if busy.get(own[i][4], 0) < limit:
+                task = own[i]
+                del own[i]
+                busy[task[4]] = busy.get(task[4], 0) + 1
+                return task
+        n = len(self.queues)
+        for k in range(1, n):
+            queue = self.queues[(me + k) % n]
+            for i, task in enumerate(queue):
+                if busy.get(task[4], 0) < limit:
+                    del queue[i]
+                    busy[task[4]] = busy.get(task[4], 0) + 1
+                    return task
+        return None
+
+    def _worker(self, me):
+        local = Snapshot()
+        own = self.queues[me]
+        subdirs = []
+        limited = self.limit is not None
+        while True:
+            if limited:
+                with self.cond:
+                    task = self._next_limited_task(me)
+            else:
+                task = self._next_task(me)
+            if task is None:
+                with self.cond:
+                    if self.pending == 0:
+                        self.cond.notify_all()
+                        return local
+                    self.cond.wait(0.005)
+                continue
+            base, path, rel_dir, links, dev = task
+            try:
+                scanner._walk_dir(base, path, rel_dir, self.include_hidden, self.match, local,
+                                  subdirs, self.prune, self.timings, self.policy, links)
+            finally:
+                # account for the new work before publishing it
+                with self.cond:
+                    self.pending += len(subdirs) - 1
+                    if limited:
+                        self.busy[dev] -= 1
+                        own.extend((base,) + d for d in subdirs)
+                if not limited:
+                    own.extend((base,) + d for d in subdirs)
+                with self.cond:
+                    if subdirs or self.pending == 0 or limited:
+                        self.cond.notify_all()
+                subdirs.clear()
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded-work partial scans for huge trees.
+
+A full rescan of a 10M-file archive takes minutes in a single tick.
+PartialBackend spreads the walk over ticks instead: each poll lists at
+most `max_entries` entries and/or spends at most `max_ms` milliseconds,
+then the walk is suspended until the next tick. The traversal is a
+generator, so its cursor (the stack of directories still to list, and
+the open os.scandir() iterator of the directory being listed) survives
+between ticks as the generator's own state; a directory larger than the
+budget is simply listed over several ticks.
+
+Every directory whose listing completes is a region: poll_region()
+returns the (old, new) sub-snapshots of the regions completed during
+the tick, and the Watcher diffs only those, so the work per tick is
+bounded by the budget rather than by the size of the tree (memory is
+not: the snapshot of the whole tree is kept between passes). Regions whose
+entries did not change keep their previous chunk and are left out.
+Directories that were not met again during a whole pass (deleted, now
+unreadable or pruned) are dropped when the pass ends.
+
+The first pass, without a state file, builds the baseline silently:
+changes in directories it has not reached yet are not reported. Each
+completed pass logs its duration, the full-coverage period: a change is
+detected at most that long after it happened. Renames are paired
+within the regions of one tick only; a move between directories listed
+in different ticks is reported as removed + added.
+
+reconfigure() applies new bases and filters between two ticks without
+restarting the walk: removed bases and the entries the new filters
+reject leave the snapshot at once; the regions of added bases, and the
+entries only the new filters admit, join it silently as the walk
+reaches them, until a whole pass has run with the new configuration.
+"""
+
+import logging
+import os
+import time
+
+from dirpoll.filters import match_both, prune_either
+from dirpoll.scanner import resolve_base
+from dirpoll.snapshot import ChunkBuilder, Snapshot
+
+log = logging.getLogger("dirpoll")
+
+_clock = time.perf_counter
+
+
+class PartialBackend:
+    """
+    Polling backend walking the tree a bounded slice per tick.
+    """
+    name = 'partial'
+
+    def __init__(self, bases, recursive, include_hidden, match=None, prune=None,
+                 interval=5.0, max_entries=None, max_ms=None, seed=None, timings=None,
+                 reason='', policy=None):
+        self.bases = [resolve_base(b) for b in bases]
+        self.recursive = recursive
+        self.include_hidden = include_hidden
+        self.match = match
+        self.prune = prune
+        self.interval = interval
+        self.max_entries = max_entries
+        self.max_ms = max_ms
+        self.timings = timings
+        self.reason = reason
+        self.policy = policy     # scanner.WalkPolicy, or None
+        self.snapshot = Snapshot() if seed is None else seed[0]
+        self.cursor = None       # (base, rel_dir) being listed
+        self.passes = 0          # completed passes
+        self.coverage = None     # seconds the last complete pass took
+        self._silent = seed is None
+        self._done = []          # (key, chunk or None) completed this tick
+        self._left = 0
+        self._deadline = None
+        self._ticks = 0          # ticks of the current pass
+        self._reconfigured = False   # bases/filters changed during the current pass
+        self._transition = None  # (old bases, old match, old prune, last pass) after reconfigure()
+        self._walk = self._traverse()
+
+    @property
+    def complete(self):
+        """True once the snapshot covers the whole tree."""
+        return self.passes > 0 or not self._silent
+
+    def fds(self):
+        return []
+
+    def timeout(self):
+        return self.interval
+
+    def baseline(self):
+        # filled region by region by the first pass
+        return self.snapshot
+
+    def poll(self, ready):
+        """
+        Backend protocol: advance the walk, return a copy of the snapshot.
+        """
+        self.poll_region(ready)
+        return Snapshot(dict(self.snapshot.dirs))
+
+    def poll_region(self, ready):
+        """
+        Advance the walk by one budget; return the (old, new) Snapshots of
+        the regions that changed, or None when there is nothing to diff.
+        """
+        self._left = self.max_entries or float('inf')
+        self._deadline = _clock() + self.max_ms / 1000.0 if self.max_ms else None
+        self._ticks += 1
+        next(self._walk)
+        done, self._done = self._done, []
+        dirs = self.snapshot.dirs
+        old, new = Snapshot(), Snapshot()
+        transition = self._transition
+        for key, chunk in done:
+            prev = dirs.get(key)
+            if chunk is None:
+                if prev is not None:
+                    del dirs[key]
+                    if transition is not None:
+                        prev = _seen(key, prev, transition)
+                    if prev is not None:
+                        old.dirs[key] = prev
+                continue
+            if (prev is not None and prev.names == chunk.names and prev.isdir == chunk.isdir
+                    and prev.same_values(chunk)):
+                continue   # unchanged: keep sharing the previous chunk
+            dirs[key] = chunk
+            if transition is not None:
+                # diffed as every configuration since reconfigure() saw
+                # it: what only the new one records joins silently
+                prev, chunk = _seen(key, prev, transition), _seen(key, chunk, transition)
+                if chunk is None:
+                    continue
+            if prev is not None:
+                old.dirs[key] = prev
+            new.dirs[key] = chunk
+        if transition is not None and self.passes >= transition[3]:
+            self._transition = None
+        if self._silent or not (old.dirs or new.dirs):
+            return None
+        return old, new
+
+    def reconfigure(self, bases, match, prune, policy, snapshot=None, refilter=True,
+                    relist=False):
+        """
+        Switch to new bases and filters (see the module docstring);
+        returns the re-filtered snapshot. Nothing is scanned now.
+        """
+        bases = [resolve_base(b) for b in bases]
+        if relist or any(b not in self.bases for b in bases):
+            # until the pass in progress, if any, and a whole new one are done
+            last = self.passes + (1 if self.cursor is None else 2)
+            match0, prune0 = (self.match, self.prune) if relist else (None, None)
+            kept = {b for b in self.bases if b in bases}
+            if self._transition is not None:
+                match1, prune1, kept1, _ = self._transition
+                match0, prune0 = match_both(match0, match1), prune_either(prune0, prune1)
+                kept &= kept1
+            self._transition = (match0, prune0, kept, last)
+        if refilter or relist:
+            self.snapshot = self.snapshot.filtered(match, prune, set(bases))
+        else:
+            self.snapshot = self.snapshot.filtered(bases=set(bases))
+        self.bases, self.match, self.prune, self.policy = bases, match, prune, policy
+        self._reconfigured = True
+        return self.snapshot
+
+    def close(self):
+        self._walk.close()   # closes a scandir() left open mid-directory
+
+    def dir_meta(self):
+        return None
+
+    # ----------------------------------------------------------------
+    def _spent(self):
+        self._left -= 1
+        return self._left < 0 or (self._deadline is not None and _clock() >= self._deadline)
+
+    def _traverse(self):
+        """
+        Endless walk, one pass after another; suspends (yields) whenever
+        the tick's budget is spent and at the end of every pass.
+        """
+        while True:
+            start = time.monotonic()
+            self._ticks = 1
+            self._reconfigured = False
+            seen = set()
+            for base in self.bases:
+                stack = [('', base, ())]
+                while stack:
+                    rel_dir, path, links = stack.pop()
+                    if (self._reconfigured and rel_dir and self.prune is not None
+                            and self.prune(rel_dir)):
+                        continue   # queued before reconfigure() pruned it
+                    key = self.cursor = (base, rel_dir)
+                    subdirs = [] if self.recursive else None
+                    chunk = yield from self._list(base, path, rel_dir, subdirs, links)
+                    if self._reconfigured:
+                        if base not in self.bases:
+                            break   # removed meanwhile
+                        if chunk is not None and self.match is not None:
+                            # partly listed with the previous filters
+                            chunk = chunk.filtered(rel_dir, self.match)
+                    if chunk is None:
+                        continue
+                    seen.add(key)
+                    self._done.append((key, chunk))
+                    if subdirs:
+                        stack.extend(subdirs)
+            for key in self.snapshot.dirs:
+                if key not in seen:
+                    self._done.append((key, None))
+            self.cursor = None
+            self.passes += 1
+            self.coverage = time.monotonic() - start
+            log.info(f"Partial scan: pass {self.passes} covered {len(seen)} directories "
+                     f"in {self.coverage:.1f}s ({self._ticks} ticks)")
+            yield   # a pass always ends a tick
+            self._silent = False
+
+    def _list(self, base, path, rel_dir, subdirs, links=()):
+        """
+        List one directory (same rules as scanner._walk_dir), suspending
+        when the budget is spent. Returns its chunk, or None if it cannot
+        be read.
+        """
+        if self._spent():
+            yield
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return None
+        chunk = ChunkBuilder()
+        add = chunk.add
+        include_hidden, match, prune = self.include_hidden, self.match, self.prune
+        policy = self.policy
+        timings = self.timings
+        with it:
+            for entry in it:
+                if self._spent():
+                    yield
+                name = entry.name
+                if not include_hidden and name[0] == '.':
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                rel = rel_dir + name + '/' if is_dir else rel_dir + name
+                if match is None or match(rel):
+                    try:
+                        if timings is None:
+                            add(name, is_dir, entry.stat())
+                        else:
+                            add(name, is_dir, timings.timed_stat(entry.stat))
+                    except OSError:
+                        pass
+                if is_dir and subdirs is not None:
+                    if prune is not None and prune(rel):
+                        continue
+                    if policy is not None:
+                        sub = policy.descend(entry, base, links)
+                        if sub is not None:
+                            subdirs.append((rel, entry.path, sub))
+                        continue
+                    try:
+                        if entry.is_symlink():
+                            continue
+                    except OSError:
+                        continue
+                    subdirs.append((rel, entry.path, ()))
+        return chunk.build()
+
+
+def _seen(key, chunk, transition):
+    """
+    The part of region `key` that all configurations of a transition
+    record (None: none of it).
+    """
+    if chunk is None:
+        return None
+    match, prune, bases, _ = transition
+    return Snapshot({key: chunk}).filtered(match, prune, bases).dirs.get(key)
+
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk snapshot.
+
+The snapshot (and, when available, the incremental scanner's per
+directory mtime_ns/inode) is saved to a compact binary file so that a
+restarted monitor can report what changed while it was down, and can
+seed its index instead of paying a cold full scan.
+
+File layout (all integers little-endian):
+
+  header   magic "DPSNAP", version, byte order, ndirs, nentries,
+           settings length, strings length, CRC32 of everything below
+  settings JSON: bases, scan options, save time
+  strings  NUL-separated UTF-8: the ndirs relative directory paths,
+           then the nentries entry names
+  dirs     base index (u32), entry count (u32), mtime_ns (i64), inode (u64),
+           entries' device (u64)
+  entries  kinds (u8), mtime_ns (i64), size (i64), inode (u64),
+           ctime_ns (i64) columns
+
+Files are written to a temporary name, fsync'ed and atomically renamed
+over the old one; they are read through mmap and rejected if the
+checksum or the settings do not match.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from dirpoll.snapshot import DirChunk, Snapshot
+
+MAGIC = b'DPSNAP'
+VERSION = 1
+_HEADER = struct.Struct('<6sHBxQQQQI')
+_intern = sys.intern
+
+
+class StateError(Exception):
+    """
+    Raised when a state file is missing, corrupt or incompatible.
+    """
+
+
+def settings_of(bases, recursive, include_hidden, include_pats, exclude_pats,
+                follow_symlinks=False, same_fs=False):
+    """
+    Scan settings a saved snapshot is only valid for.
+    """
+    return {
+        'bases': [str(b) for b in bases],
+        'recursive': bool(recursive),
+        'include_hidden': bool(include_hidden),
+        'include': list(include_pats or ()),
+        'exclude': list(exclude_pats or ()),
+        'follow_symlinks': bool(follow_symlinks),
+        'same_fs': bool(same_fs),
+    }
+
+
+def _col(typecode, values=()):
+    col = array(typecode, values)
+    if sys.byteorder != 'little':
+        col.byteswap()
+    return col.tobytes()
+
+
+def save(path, snapshot, settings, dir_meta=None):
+    """
+    Atomically write `snapshot` to `path`. `dir_meta` maps
+    (base, rel_dir) to (mtime_ns, inode) of the directory itself.
+    """
+    dir_meta = dir_meta or {}
+    base_ids = {}
+    rel_dirs, base_idx, counts, mtime_ns, inodes = [], array('I'), array('I'), array('q'), array('Q')
+    devs = array('Q')
+    names = []
+    isdir = bytearray()
+    mtime, size, ino_col, ctime = array('q'), array('q'), array('Q'), array('q')
+    for key, chunk in snapshot.dirs.items():
+        base, rel_dir = key
+        base_idx.append(base_ids.setdefault(base, len(base_ids)))
+        rel_dirs.append(rel_dir)
+        counts.append(len(chunk.names))
+        mt, ino = dir_meta.get(key, (None, None))
+        mtime_ns.append(-1 if mt is None else mt)
+        inodes.append(0 if ino is None else ino)
+        devs.append(chunk.dev)
+        names.extend(chunk.names)
+        isdir += chunk.isdir
+        mtime.extend(chunk.mtime_ns)
+        size.extend(chunk.size)
+        ino_col.extend(chunk.ino)
+        ctime.extend(chunk.ctime_ns)
+
+    meta = dict(settings)
+    meta['snapshot_bases'] = list(base_ids)
+    meta['saved_at'] = time.time()
+    settings_blob = json.dumps(meta).encode('utf-8')
+    strings = '\0'.join(rel_dirs + names).encode('utf-8', 'surrogateescape')
+    sections = [
+        settings_blob, strings,
+        _col('I', base_idx), _col('I', counts), _col('q', mtime_ns), _col('Q', inodes),
+        _col('Q', devs),
+        bytes(isdir), _col('q', mtime), _col('q', size), _col('Q', ino_col), _col('q', ctime),
+    ]
+    crc = 0
+    for sec in sections:
+        crc = zlib.crc32(sec, crc)
+    header = _HEADER.pack(MAGIC, VERSION, 0, len(rel_dirs), len(names),
+                          len(settings_blob), len(strings), crc)
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as fh:
+            fh.write(header)
+            for sec in sections:
+                fh.write(sec)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def load(path, settings=None):
+    """
+    Read a state file. Returns (snapshot, dir_meta, saved_settings).
+    Raises StateError if it is unreadable, corrupt, or was saved with
+    scan settings different from `settings` (when given).
+    """
+    try:
+        fh = open(path, 'rb')
+    except OSError as exc:
+        raise StateError(f"cannot open state file: {exc}") from exc
+    with fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as exc:
+            raise StateError(f"cannot map state file: {exc}") from exc
+    with mm:
+        return _parse(mm, settings)
+
+
+def _parse(mm, settings):
+    if len(mm) < _HEADER.size:
+        raise StateError("state file truncated")
+    magic, version, _order, ndirs, nentries, slen, strlen, crc = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise StateError("not a dirpoll state file (or unsupported version)")
+    body = memoryview(mm)[_HEADER.size:]
+    try:
+        if zlib.crc32(body) != crc:
+            raise StateError("state file checksum mismatch")
+
+        pos = 0
+
+        def take(n):
+            nonlocal pos
+            if pos + n > len(body):
+                raise StateError("state file truncated")
+            view = body[pos:pos + n]
+            pos += n
+            return view
+
+        def column(typecode, count):
+            col = array(typecode)
+            col.frombytes(take(col.itemsize * count))
+            if sys.byteorder != 'little':
+                col.byteswap()
+            return col
+
+        saved = json.loads(bytes(take(slen)).decode('utf-8'))
+        if settings is not None:
+            current = {k: saved.get(k) for k in settings}
+            if current != settings:
+                raise StateError("state file was saved with different scan settings")
+        strings = bytes(take(strlen)).decode('utf-8', 'surrogateescape').split('\0')
+        if ndirs + nentries == 0:
+            strings = []
+        if len(strings) != ndirs + nentries:
+            raise StateError("state file string table is inconsistent")
+        base_idx = column('I', ndirs)
+        counts = column('I', ndirs)
+        mtime_ns = column('q', ndirs)
+        inodes = column('Q', ndirs)
+        devs = column('Q', ndirs)
+        isdir = bytes(take(nentries))
+        mtime = column('q', nentries)
+        size = column('q', nentries)
+        ino = column('Q', nentries)
+        ctime = column('q', nentries)
+    finally:
+        body.release()
+
+    # names are not interned: that alone would double the load time, and
+    # loaded chunks are either reused unchanged (seed) or dropped after
+    # the first diff
+    bases = [_intern(b) for b in saved.get('snapshot_bases', [])]
+    names = strings[ndirs:]
+    snapshot = Snapshot()
+    dir_meta = {}
+    start = 0
+    for d in range(ndirs):
+        end = start + counts[d]
+        key = (bases[base_idx[d]], strings[d])
+        snapshot.dirs[key] = DirChunk(tuple(names[start:end]), isdir[start:end],
+                                      mtime[start:end], size[start:end],
+                                      ino[start:end], ctime[start:end], devs[d])
+        if mtime_ns[d] >= 0:
+            dir_meta[key] = (mtime_ns[d], inodes[d])
+        start = end
+    if start != nentries:
+        raise StateError("state file directory table is inconsistent")
+    return snapshot, dir_meta, saved
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+os.scandir-based directory walker.
+
+Records the same entries as the original os.walk/Path implementation
+(directories carry a trailing '/'), into a compact snapshot.Snapshot,
+but
+
+  • takes the entry type from the DirEntry (d_type) instead of a stat,
+  • builds relative paths by string concatenation down the walk,
+  • performs a single stat per recorded entry,
+  • walks with an explicit stack (no recursion limit on deep trees),
+  • optionally prunes subtrees that the filters exclude entirely.
+
+Which subdirectories are descended into is decided by a WalkPolicy when
+one is given (symlinks, filesystem boundaries, duplicate mounts); the
+recorded entries are the same whatever the policy.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+from dirpoll.snapshot import ChunkBuilder, Snapshot, intern_base
+
+log = logging.getLogger("dirpoll")
+
+
+def resolve_base(base):
+    """
+    Absolute, symlink-free form of a base directory, as used in snapshots.
+    """
+    return intern_base(str(Path(base).resolve()))
+
+
+def _within(path, root):
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def _unescape(field):
+    # /proc/self/mountinfo escapes space, tab, newline and backslash as \ooo
+    if '\\' not in field:
+        return field
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == '\\' and field[i + 1:i + 4].isdigit():
+            out.append(chr(int(field[i + 1:i + 4], 8)))
+            i += 4
+        else:
+            out.append(field[i])
+            i += 1
+    return ''.join(out)
+
+
+def duplicate_mounts(bases):
+    """
+    Mount points inside the trees of `bases` whose content is already
+    reachable at another path of those trees: bind mounts of a watched
+    directory (including loops back to an ancestor) and second mounts of
+    the same filesystem. Of identical mounts the one with the smallest
+    path is kept. Read from /proc/self/mountinfo (empty elsewhere).
+    """
+    try:
+        with open('/proc/self/mountinfo', encoding='utf-8', errors='surrogateescape') as fh:
+            lines = fh.read().splitlines()
+    except OSError:
+        return frozenset()
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 5:
+            continue
+        # mount id, parent id, major:minor, root in its filesystem, mount point
+        mounts.append((fields[2], _unescape(fields[3]), _unescape(fields[4])))
+    by_point = {point: (dev, root) for dev, root, point in mounts}
+    out = set()
+    for dev, root, point in mounts:
+        if not any(_within(point, b) and point != b for b in bases):
+            continue
+        for odev, oroot, opoint in mounts:
+            if odev != dev or opoint == point or not _within(root, oroot):
+                continue
+            # where `root` shows through the other mount
+            alt = (opoint.rstrip('/') + root[len(oroot.rstrip('/')):]).rstrip('/') or '/'
+            if alt == point or not any(_within(alt, b) for b in bases):
+                continue
+            shown = by_point.get(alt)
+            if shown is not None and shown != (dev, root):
+                continue   # another filesystem is mounted over it
+            if shown == (dev, root) and alt > point:
+                continue   # identical mounts: the smaller path is walked
+            out.add(point)
+            break
+    return frozenset(out)
+
+
+class WalkPolicy:
+    """
+    Which subdirectories a recursive walk descends into.
+
+      follow_symlinks  also descend into symlinked directories, unless
+                       the target lies inside a watched tree (it is
+                       walked there), contains one, or is inside or
+                       above a target already followed on the way down
+                       (a loop)
+      same_fs          stay on the filesystem (st_dev) of the base, like
+                       find -xdev
+      devices          hand the st_dev of every subdirectory to the
+                       walker (per-device limits in dirpoll.parallel)
+
+    Second mounts of content already reachable in the watched trees
+    (duplicate_mounts(), computed when the policy is created) are never
+    descended into, so bind-mounted trees are walked once and bind-mount
+    loops end. Directories not descended into are still recorded.
+    """
+
+    def __init__(self, bases, follow_symlinks=False, same_fs=False, devices=False):
+        self.bases = [resolve_base(b) for b in bases]
+        self.follow_symlinks = follow_symlinks
+        self.same_fs = same_fs
+        self.devices = devices
+        self.skip_mounts = duplicate_mounts(self.bases)
+        self._base_dev = {}
+
+    def descend(self, entry, base, links=()):
+        """
+        Return the followed-link chain to walk subdirectory `entry` with
+        (`links` plus its target when it is a symlink), or None to not
+        descend into it.
+        """
+        try:
+            if entry.is_symlink():
+                if not self.follow_symlinks:
+                    return None
+                return self._follow(entry.path, base, links)
+            if self.skip_mounts and entry.path in self.skip_mounts:
+                log.debug(f"Not descending into {entry.path}: mounted elsewhere in the tree")
+                return None
+            if self.same_fs and entry.stat().st_dev != self.base_dev(base):
+                return None
+        except OSError:
+            return None
+        return links
+
+    def base_dev(self, base):
+        dev = self._base_dev.get(base)
+        if dev is None:
+            dev = self._base_dev[base] = os.stat(base).st_dev
+        return dev
+
+    def device(self, entry):
+        """
+        st_dev of a subdirectory to be walked (None if unknown).
+        """
+        try:
+            return entry.stat().st_dev
+        except OSError:
+            return None
+
+    def _follow(self, path, base, links):
+        target = os.path.realpath(path)
+        for root in self.bases + list(links):
+            if _within(target, root) or _within(root, target):
+                log.debug(f"Not following {path} -> {target}: walked already (or a loop)")
+                return None
+        if self.same_fs and os.stat(target).st_dev != self.base_dev(base):
+            return None
+        return links + (target,)
+
+
+def scan(bases, recursive, include_hidden, match=None, prune=None, timings=None,
+         policy=None):
+    """
+    Walk through each base directory and return a Snapshot.
+    Snapshot.to_dict() gives the v1.3.0 form
+      { "base|relative_path": last_modification_time }
+
+    `match` is an optional predicate on the relative path; entries for
+    which it returns False are not recorded (directories are still walked).
+    `prune` is an optional predicate on a directory's relative path
+    ('a/b/'); when it returns True the walk does not descend into it.
+    `timings` is an optional metrics.ScanTimings the stat calls add to.
+    `policy` is an optional WalkPolicy; without one symlinked directories
+    are not descended into and everything else is.
+    """
+    snapshot = Snapshot()
+    for base in bases:
+        base = resolve_base(base)
+        if recursive:
+            _walk_tree(base, include_hidden, match, snapshot, prune, timings, policy)
+        else:
+            _walk_dir(base, base, '', include_hidden, match, snapshot, None, None, timings)
+    return snapshot
+
+
+def _walk_dir(base, path, rel_dir, include_hidden, match, snapshot, subdirs,
+              prune=None, timings=None, policy=None, links=()):
+    """
+    Record the entries of a single directory into `snapshot` as one chunk.
+    If `subdirs` is a list, the subdirectories to descend into (not
+    pruned; not symlinks, or as `policy` decides) are appended to it as
+    (path, rel, links, st_dev) tuples so the caller can walk them; st_dev
+    is None unless the policy asks for devices.
+    """
+    try:
+        it = os.scandir(path)
+    except OSError:
+        # same as os.walk: unreadable directories are skipped silently
+        return
+    chunk = ChunkBuilder()
+    add = chunk.add
+    with it:
+        for entry in it:
+            name = entry.name
+            if not include_hidden and name[0] == '.':
+                continue
+            try:
+                # is_dir() follows symlinks, like os.walk's classification
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            rel = rel_dir + name + '/' if is_dir else rel_dir + name
+            if match is None or match(rel):
+                try:
+                    if timings is None:
+                        add(name, is_dir, entry.stat())
+                    else:
+                        add(name, is_dir, timings.timed_stat(entry.stat))
+                except OSError:
+                    # vanished between readdir and stat, or dangling link
+                    pass
+            if is_dir and subdirs is not None:
+                if prune is not None and prune(rel):
+                    continue
+                if policy is None:
+                    try:
+                        if entry.is_symlink():
+                            continue
+                    except OSError:
+                        continue
+                    subdirs.append((entry.path, rel, (), None))
+                    continue
+                sub = policy.descend(entry, base, links)
+                if sub is not None:
+                    subdirs.append((entry.path, rel, sub,
+                                    policy.device(entry) if policy.devices else None))
+    snapshot.add_chunk(base, rel_dir, chunk.build())
+
+
+def _walk_tree(base, include_hidden, match, snapshot, prune=None, timings=None, policy=None):
+    """
+    Recursive walk driven by an explicit stack of (path, rel, links, dev) tuples.
+    """
+    stack = [(base, '', (), None)]
+    while stack:
+        path, rel_dir, links, _ = stack.pop()
+        _walk_dir(base, path, rel_dir, include_hidden, match, snapshot, stack, prune, timings,
+                  policy, links)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive per-subtree polling.
+
+Instead of rescanning every base each `interval`, AdaptiveScheduler
+splits the IncrementalScanner index into units, each with its own
+interval:
+
+  • the listing of each base (its own entries and new subdirectories),
+  • each top-level subdirectory of a base, with everything below it.
+
+A unit that changed is polled again after `min_interval`; each quiet
+poll multiplies its interval by `backoff`, up to `max_interval`. The
+next poll of a unit is also pushed back to at least cost / `duty`
+seconds, so that a unit whose scan takes 4 s is not scanned back to back
+when its interval is 5 s (duty=0.5 keeps any unit busy at most half of
+the time). When a subtree vanishes or its top-level directory changes,
+the base listing that records it is made due as well.
+
+Every poll of a unit re-stats all of its files (the `restat_files`
+budget of the scanner does not apply): quiet units are simply polled
+less often.
+
+The scheduler is a backend (see dirpoll.backends): the monitor loop
+waits timeout() seconds and calls poll(), which scans the due units.
+stats() reports the per-unit schedule.
+"""
+
+import time
+
+
+class _Unit:
+    """
+    Scheduling state of one subtree.
+    """
+    __slots__ = ('base', 'rel_dir', 'interval', 'due', 'scans', 'changes',
+                 'last_change', 'last_cost', 'total_cost')
+
+    def __init__(self, base, rel_dir, interval, due):
+        self.base = base
+        self.rel_dir = rel_dir
+        self.interval = interval
+        self.due = due
+        self.scans = 0
+        self.changes = 0
+        self.last_change = None
+        self.last_cost = 0.0
+        self.total_cost = 0.0
+
+
+class AdaptiveScheduler:
+    """
+    Polling backend with per-subtree intervals over an IncrementalScanner.
+    """
+    name = 'adaptive'
+
+    def __init__(self, inc, interval, min_interval=0.5, max_interval=60.0,
+                 backoff=2.0, duty=0.5, reason=''):
+        self.inc = inc
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.duty = duty
+        self.reason = reason
+        self._units = {}   # (base, rel_dir) -> _Unit
+
+    # --- backend protocol ----------------------------------------------
+    def fds(self):
+        return []
+
+    def timeout(self):
+        if not self._units:
+            return self.interval
+        return max(0.0, min(u.due for u in self._units.values()) - time.monotonic())
+
+    def baseline(self):
+        snap = self.inc.scan()
+        start = min(max(self.interval, self.min_interval), self.max_interval)
+        self._sync_units(time.monotonic(), start)
+        return snap
+
+    def poll(self, ready):
+        """
+        Scan the due units; return a new Snapshot, or None if none of
+        them changed.
+        """
+        inc = self.inc
+        inc.reset_stats()
+        now = time.monotonic()
+        due = [u for u in self._units.values() if u.due <= now]
+        # subtrees first: they may make their base listing due
+        due.sort(key=lambda u: u.rel_dir == '')
+        changed = False
+        for unit in due:
+            t0 = time.monotonic()
+            touched = inc.refresh_subtree(unit.base, unit.rel_dir, descend=unit.rel_dir != '')
+            end = time.monotonic()
+            self._account(unit, bool(touched), end - t0, end)
+            if touched:
+                changed = True
+                root_key = (unit.base, '')
+                if unit.rel_dir and (root_key in touched
+                                     or (unit.base, unit.rel_dir) not in inc._index):
+                    root = self._units.get(root_key)
+                    if root is not None and root.due > end:
+                        root.interval = self.min_interval
+                        root.due = end
+                        if root not in due:
+                            due.append(root)
+        if not changed:
+            return None
+        # a directory that just appeared is likely to keep changing
+        self._sync_units(time.monotonic(), self.min_interval)
+        return inc.snapshot()
+
+    def close(self):
+        pass
+
+    def dir_meta(self):
+        return self.inc.dir_meta()
+
+    def reconfigure(self, bases, match, prune, policy, snapshot, refilter=True, relist=False):
+        """
+        Switch to new bases and filters (IncrementalScanner.reconfigure());
+        units follow the bases, and all are due at once when everything
+        must be re-listed.
+        """
+        snap = self.inc.reconfigure(bases, match, prune, policy, snapshot, refilter, relist)
+        now = time.monotonic()
+        self._sync_units(now, min(max(self.interval, self.min_interval), self.max_interval))
+        if relist:
+            for unit in self._units.values():
+                unit.due = now
+        return snap
+
+    def stats(self):
+        """
+        Per-unit schedule: a list of dicts sorted by base and subtree.
+        """
+        now = time.monotonic()
+        wall = time.time()
+        out = []
+        for (base, rel_dir), u in sorted(self._units.items()):
+            out.append({
+                'base': base,
+                'subtree': rel_dir or '.',
+                'interval': u.interval,
+                'next_in': max(0.0, u.due - now),
+                'scans': u.scans,
+                'changes': u.changes,
+                'last_change': None if u.last_change is None else wall - (now - u.last_change),
+                'last_cost': u.last_cost,
+                'avg_cost': u.total_cost / u.scans if u.scans else 0.0,
+            })
+        return out
+
+    # ----------------------------------------------------------------
+    def _account(self, unit, changed, cost, now):
+        unit.scans += 1
+        unit.last_cost = cost
+        unit.total_cost += cost
+        if changed:
+            unit.changes += 1
+            unit.last_change = now
+            unit.interval = self.min_interval
+        else:
+            unit.interval = min(unit.interval * self.backoff, self.max_interval)
+        unit.due = now + max(unit.interval, cost / self.duty - cost)
+
+    def _sync_units(self, now, start):
+        """
+        Add units (polled first after `start` seconds) for new top-level
+        directories, remove vanished ones.
+        """
+        index = self.inc._index
+        wanted = set()
+        for base in self.inc.bases:
+            wanted.add((base, ''))   # kept even while missing, to notice it coming back
+            state = index.get((base, ''))
+            if state is None:
+                continue
+            for name in state.subdirs:
+                if (base, name + '/') in index:
+                    wanted.add((base, name + '/'))
+        units = self._units
+        for key in list(units):
+            if key not in wanted:
+                del units[key]
+        for key in wanted:
+            if key not in units:
+                units[key] = _Unit(key[0], key[1], start, now + start)
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process sharded monitoring.
+
+Scanning, filtering and diffing are CPU-bound Python: one process tops
+out at one core. With the 'processes' engine option ShardedBackend
+spreads the watched tree over worker processes:
+
+  • shards are whole bases, or, when there are fewer bases than about
+    four shards per worker, hashed buckets of a base's top-level
+    subdirectories (crc32 of the name; the entry of such a directory in
+    the base's own listing goes with it, the base's files with bucket
+    0), so that one huge base is split as well,
+  • each worker keeps the snapshots of its shards, scans them every
+    `interval` seconds and sends back only the change events of each
+    tick (plus the scan cost of each shard) over its pipe,
+  • the supervisor (this backend, in the monitor's process) selects on
+    the pipes and on the process sentinels: a worker that dies is
+    restarted with the same shards (after a back-off if it keeps dying),
+  • every `rebalance` seconds shards are moved from the most to the
+    least loaded worker when their measured costs are out of balance.
+
+A restarted worker, or one given a moved shard, starts from a new
+baseline of its shards: changes made between the last scan of the old
+owner and that baseline are not reported. reconfigure() sends new
+filters to the live workers, which re-filter their snapshots in memory
+(or, when the new patterns may admit more, rescan once and report only
+what both configurations record); the shards of an added base are
+assigned like moved ones, those of a removed base are dropped. Renames
+are paired within a shard only; a move between shards (a top-level
+directory renamed to a name of another bucket included) is reported as
+removed + added.
+
+The backend reports events rather than snapshots: it implements
+poll_events() in place of poll(), and the Watcher diffs nothing itself,
+so the state file, content hashing and partial scans do not apply.
+"""
+
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+
+from dirpoll.scanner import resolve_base
+from dirpoll.snapshot import Snapshot
+
+log = logging.getLogger("dirpoll")
+
+SHARDS_PER_WORKER = 4
+
+
+def plan_shards(bases, recursive, workers):
+    """
+    Shards for `workers` processes: (base, bucket, buckets) triples,
+    bucket None for a whole base.
+    """
+    bases = [resolve_base(b) for b in bases]
+    want = workers * SHARDS_PER_WORKER
+    if not recursive or len(bases) >= want:
+        return [(b, None, 1) for b in bases]
+    buckets = -(-want // len(bases))
+    return [(b, k, buckets) for b in bases for k in range(buckets)]
+
+
+def bucket_of(name, buckets):
+    return zlib.crc32(name.encode('utf-8', 'surrogateescape')) % buckets
+
+
+def scan_shard(shard, recursive, include_hidden, flt, policy=None):
+    """
+    Snapshot of one shard (used by the workers).
+    """
+    from dirpoll import scanner
+    base, bucket, buckets = shard
+    match = flt and flt.match
+    prune = flt and flt.prune
+    if bucket is None:
+        return scanner.scan([base], recursive, include_hidden, match, prune, None, policy)
+
+    def shard_prune(rel):
+        # top-level directories ('name/') of other buckets are not descended
+        if rel.find('/') == len(rel) - 1 and bucket_of(rel[:-1], buckets) != bucket:
+            return True
+        return prune is not None and prune(rel)
+
+    snap = scanner.scan([base], recursive, include_hidden, match, shard_prune, None, policy)
+    top = snap.dirs.get((base, ''))
+    if top is not None:
+        # a top-level directory's entry goes with its content, so that its
+        # renames pair as in one process; the base's files with bucket 0
+        keep = [i for i, name in enumerate(top.names)
+                if (bucket_of(name, buckets) if top.isdir[i] else 0) == bucket]
+        snap.dirs[(base, '')] = top.select(keep)
+    return snap
+
+
+def _worker_main(conn, recursive, include_hidden, include, exclude, interval, renames,
+                 bases=(), follow_symlinks=False, same_fs=False):
+    """
+    Worker process: scan the assigned shards every `interval` and send
+    ('tick', events, {shard: (cost, events)}) messages; ('assign',
+    shards), ('release', shards), ('drop', shards), ('config', include,
+    exclude, bases, relist) and ('stop',) come from the supervisor.
+    """
+    from dirpoll.filters import compile_filter
+    from dirpoll.scanner import WalkPolicy
+    from dirpoll.watcher import changes
+    # Ctrl+C reaches the whole process group: leave the shutdown to the supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    flt = compile_filter(include, exclude)
+    # the policy of all the bases, so that each shard skips the others' trees
+    policy = WalkPolicy(bases, follow_symlinks, same_fs) if recursive else None
+    snaps = {}
+    due = time.monotonic() + interval
+    try:
+        while True:
+            if conn.poll(max(0.0, due - time.monotonic())):
+                msg = conn.recv()
+                if msg[0] == 'stop':
+                    return
+                costs = {}
+                if msg[0] == 'assign':
+                    for shard in msg[1]:
+                        t0 = time.perf_counter()
+                        snaps[shard] = scan_shard(shard, recursive, include_hidden, flt, policy)
+                        costs[shard] = time.perf_counter() - t0
+                    conn.send(('ready', costs))
+                elif msg[0] == 'release':
+                    events = []
+                    for shard in msg[1]:
+                        old = snaps.pop(shard, None)
+                        if old is not None:
+                            new = scan_shard(shard, recursive, include_hidden, flt, policy)
+                            found = changes(old, new, renames)
+                            events += [e.as_tuple() + (e.time,) for e in found]
+                    conn.send(('tick', events, {}))
+                elif msg[0] == 'drop':
+                    for shard in msg[1]:
+                        snaps.pop(shard, None)
+                elif msg[0] == 'config':
+                    _, include, exclude, bases, relist = msg
+                    old_flt, flt = flt, compile_filter(include, exclude)
+                    policy = WalkPolicy(bases, follow_symlinks, same_fs) if recursive else None
+                    match, prune = flt and flt.match, flt and flt.prune
+                    if not relist:
+                        if flt is not old_flt:
+                            snaps = {shard: snap.filtered(match, prune)
+                                     for shard, snap in snaps.items()}
+                        continue
+                    # report the changes both configurations record
+                    events = []
+                    for shard, old in snaps.items():
+                        new = scan_shard(shard, recursive, include_hidden, flt, policy)
+                        found = changes(old.filtered(match, prune),
+                                        new.filtered(old_flt.match, old_flt.prune), renames)
+                        events += [e.as_tuple() + (e.time,) for e in found]
+                        snaps[shard] = new
+                    conn.send(('tick', events, {}))
+                continue
+            events = []
+            costs = {}
+            for shard, old in snaps.items():
+                t0 = time.perf_counter()
+                new = scan_shard(shard, recursive, include_hidden, flt, policy)
+                found = changes(old, new, renames)
+                events += [e.as_tuple() + (e.time,) for e in found]
+                snaps[shard] = new
+                costs[shard] = (time.perf_counter() - t0, len(found))
+            conn.send(('tick', events, costs))
+            due = time.monotonic() + interval
+    except (EOFError, OSError):
+        return   # supervisor gone
+
+
+class _Worker:
+    __slots__ = ('wid', 'process', 'conn', 'shards', 'started', 'crashes', 'restart_at')
+
+    def __init__(self, wid):
+        self.wid = wid
+        self.process = None
+        self.conn = None
+        self.shards = []
+        self.started = 0.0
+        self.crashes = 0         # quick consecutive crashes, for the back-off
+        self.restart_at = None   # monotonic() time of a pending restart
+
+
+class _ShardStats:
+    __slots__ = ('cost', 'scans', 'changes', 'total_cost')
+
+    def __init__(self):
+        self.cost = 0.0          # moving average of the scan cost
+        self.scans = 0
+        self.changes = 0
+        self.total_cost = 0.0
+
+
+class ShardedBackend:
+    """
+    Supervisor of the worker processes; reports their events.
+    """
+    name = 'sharded'
+
+    def __init__(self, paths, recursive, include_hidden, include, exclude, interval,
+                 processes, renames=True, rebalance=60.0, imbalance=1.25, reason='',
+                 follow_symlinks=False, same_fs=False):
+        self.recursive = recursive
+        self.interval = interval
+        self.rebalance = rebalance
+        self.imbalance = imbalance
+        self.reason = reason
+        self.restarts = 0
+        self.moves = 0
+        self._args = (recursive, include_hidden, list(include or ()), list(exclude or ()),
+                      interval, renames, [str(p) for p in paths], follow_symlinks, same_fs)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._shards = {s: _ShardStats() for s in plan_shards(paths, recursive, processes)}
+        self._workers = [_Worker(i) for i in range(min(processes, len(self._shards)))]
+        for i, shard in enumerate(self._shards):
+            self._workers[i % len(self._workers)].shards.append(shard)
+        self._next_rebalance = time.monotonic() + rebalance
+
+    # --- backend protocol -------------------------------------------
+    def fds(self):
+        fds = []
+        for w in self._workers:
+            if w.process is not None:
+                fds.append(w.conn.fileno())
+                fds.append(w.process.sentinel)
+        return fds
+
+    def timeout(self):
+        due = self._next_rebalance
+        for w in self._workers:
+            if w.restart_at is not None:
+                due = min(due, w.restart_at)
+        return max(0.0, due - time.monotonic())
+
+    def baseline(self):
+        """
+        Start the workers and wait for their first snapshots.
+        """
+        for w in self._workers:
+            self._spawn(w)
+        for w in self._workers:
+            self._receive(w, [], block=True)
+        return Snapshot()
+
+    def poll_events(self, ready):
+        """
+        Collect the events sent by the workers whose pipe is in `ready`,
+        restart dead ones and rebalance when due; returns a list of
+        (kind, base, rel, src, time) tuples.
+        """
+        events = []
+        ready = set(ready)
+        now = time.monotonic()
+        for w in self._workers:
+            if w.process is None:
+                if w.restart_at is not None and now >= w.restart_at:
+                    self._spawn(w)
+                continue
+            if w.conn.fileno() in ready:
+                self._receive(w, events)
+            if w.process.sentinel in ready or not w.process.is_alive():
+                self._receive(w, events)   # whatever it sent before dying
+                self._crashed(w, now)
+        if now >= self._next_rebalance:
+            self._rebalance()
+            self._next_rebalance = time.monotonic() + self.rebalance
+        return events
+
+    def close(self):
+        for w in self._workers:
+            if w.process is None:
+                continue
+            try:
+                w.conn.send(('stop',))
+            except OSError:
+                pass
+        for w in self._workers:
+            if w.process is None:
+                continue
+            w.process.join(2.0)
+            if w.process.is_alive():
+                w.process.terminate()
+                w.process.join()
+            w.conn.close()
+            w.process = None
+
+    def dir_meta(self):
+        return None
+
+    def reconfigure(self, paths, include, exclude, relist=False):
+        """
+        Switch the workers to new bases and filters (see the module
+        docstring); `relist` when the new patterns may admit entries the
+        old ones rejected.
+        """
+        bases = [resolve_base(p) for p in paths]
+        args = list(self._args)
+        args[2], args[3] = list(include or ()), list(exclude or ())
+        args[6] = [str(b) for b in bases]
+        self._args = tuple(args)
+        live = [w for w in self._workers if w.process is not None]
+        for w in self._workers:
+            gone = [s for s in w.shards if s[0] not in bases]
+            if not gone:
+                continue
+            w.shards = [s for s in w.shards if s[0] in bases]
+            for shard in gone:
+                del self._shards[shard]
+            if w in live:
+                self._send(w, ('drop', gone))
+        for w in live:
+            self._send(w, ('config',) + tuple(args[2:4]) + (args[6], relist))
+        known = {s[0] for s in self._shards}
+        added = [b for b in bases if b not in known]
+        if not added:
+            return
+        # planned on their own, so that the shards of the other bases stay put
+        load = {w.wid: len(w.shards) for w in self._workers}
+        for shard in plan_shards(added, self.recursive, len(self._workers)):
+            self._shards[shard] = _ShardStats()
+            w = min(self._workers, key=lambda w: load[w.wid])
+            w.shards.append(shard)
+            load[w.wid] += 1
+            if w.process is not None:
+                self._send(w, ('assign', [shard]))
+
+    def stats(self):
+        """
+        Per-shard schedule rows (same keys as the adaptive backend's).
+        """
+        owner = {s: w.wid for w in self._workers for s in w.shards}
+        out = []
+        for (base, bucket, buckets), st in sorted(self._shards.items(),
+                                                   key=lambda i: (i[0][0], i[0][1] or 0)):
+            subtree = '.' if bucket is None else f"bucket {bucket}/{buckets}"
+            out.append({
+                'base': base,
+                'subtree': f"{subtree} (worker {owner.get((base, bucket, buckets))})",
+                'interval': self.interval,
+                'scans': st.scans,
+                'changes': st.changes,
+                'last_cost': st.cost,
+                'avg_cost': st.total_cost / st.scans if st.scans else 0.0,
+            })
+        return out
+
+    # ----------------------------------------------------------------
+    def _send(self, w, msg):
+        try:
+            w.conn.send(msg)
+        except OSError:
+            pass   # died: the sentinel reports it
+
+    def _spawn(self, w):
+        parent, child = self._ctx.Pipe()
+        w.process = self._ctx.Process(target=_worker_main, args=(child,) + self._args,
+                                      name=f"dirpoll-shard-{w.wid}", daemon=True)
+        w.process.start()
+        child.close()
+        w.conn = parent
+        w.started = time.monotonic()
+        w.restart_at = None
+        if w.shards:
+            parent.send(('assign', list(w.shards)))
+
+    def _receive(self, w, events, block=False):
+        """
+        Read the pending messages of `w` (block: until its 'ready').
+        """
+        conn = w.conn
+        try:
+            while block or conn.poll():
+                msg = conn.recv()
+                if msg[0] == 'ready':
+                    for shard, cost in msg[1].items():
+                        self._shards[shard].cost = cost
+                    block = False
+                elif msg[0] == 'tick':
+                    _, batch, costs = msg
+                    events.extend(batch)
+                    for shard, (cost, found) in costs.items():
+                        st = self._shards.get(shard)
+                        if st is not None:
+                            st.scans += 1
+                            st.total_cost += cost
+                            st.cost = cost if st.scans == 1 else 0.8 * st.cost + 0.2 * cost
+                            st.changes += bool(found)
+        except (EOFError, OSError):
+            pass   # died: the sentinel reports it
+
+    def _crashed(self, w, now):
+        w.process.join(1.0)
+        code = w.process.exitcode
+        w.conn.close()
+        w.process = None
+        self.restarts += 1
+        w.crashes = w.crashes + 1 if now - w.started < 10.0 else 1
+        delay = 0.0 if w.crashes <= 1 else min(60.0, 2.0 ** (w.crashes - 1))
+        log.warning(f"Shard worker {w.wid} exited (code {code}): restarting"
+                    + (f" in {delay:.0f}s" if delay else ""))
+        if delay:
+            w.restart_at = now + delay
+        else:
+            self._spawn(w)
+
+    def _rebalance(self):
+        """
+        Move shards from the most to the least loaded live worker while
+        that reduces the imbalance.
+        """
+        live = [w for w in self._workers if w.process is not None]
+        if len(live) < 2:
+            return
+        load = {w.wid: sum(self._shards[s].cost for s in w.shards) for w in live}
+        for _ in range(len(self._shards)):
+            hi = max(live, key=lambda w: load[w.wid])
+            lo = min(live, key=lambda w: load[w.wid])
+            mean = sum(load.values()) / len(live)
+            gap = load[hi.wid] - load[lo.wid]
+            if mean <= 0 or load[hi.wid] <= self.imbalance * mean or len(hi.shards) < 2:
+                return
+            # the shard whose move best evens out the pair
+            shard = min((s for s in hi.shards if self._shards[s].cost < gap),
+                        key=lambda s: abs(gap / 2 - self._shards[s].cost), default=None)
+            if shard is None:
+                return
+            cost = self._shards[shard].cost
+            try:
+                hi.conn.send(('release', [shard]))
+                lo.conn.send(('assign', [shard]))
+            except OSError:
+                return
+            hi.shards.remove(shard)
+            lo.shards.append(shard)
+            load[hi.wid] -= cost
+            load[lo.wid] += cost
+            self.moves += 1
+            log.info(f"Shards: moved {shard[0]} "
+                     f"{'.' if shard[1] is None else f'bucket {shard[1]}/{shard[2]}'} "
+                     f"({cost * 1000:.0f} ms) from worker {hi.wid} to worker {lo.wid}")
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Compact snapshot representation.
+
+The v1.3.0 snapshot was a dict { "base|relative_path": mtime } that
+repeated the full base path in every key and boxed every mtime in a
+float object. A Snapshot instead stores, per listed directory, one
+DirChunk keyed by (base, rel_dir):
+
+  • bases and directory paths are stored once per directory,
+  • entry names are interned, so consecutive snapshots of the same tree
+    share the name strings,
+  • per-entry values live in array-backed columns (the change signature:
+    mtime_ns, size, inode, ctime_ns) and a bytes column of entry kinds.
+
+Chunks are immutable once built: scanners that know a directory did not
+change (see dirpoll.incremental) reuse the very same chunk object in the
+next snapshot, and the diff (dirpoll.diff) skips it with an identity
+check.
+"""
+
+import os
+import sys
+from array import array
+
+_intern = sys.intern
+
+# DirEntry.stat() leaves st_ino at 0 on Windows while os.stat() fills it:
+# keep it out of the signature there so both kinds of stat agree
+_USE_INO = os.name != 'nt'
+
+
+def signature(st):
+    """
+    Change signature of a stat result: (mtime_ns, size, inode, ctime_ns).
+    Nanosecond times catch same-second rewrites, the inode catches files
+    replaced by rename, ctime catches writes that restore the mtime.
+    """
+    return st.st_mtime_ns, st.st_size, st.st_ino if _USE_INO else 0, st.st_ctime_ns
+
+
+class DirChunk:
+    """
+    The recorded entries of one directory, as parallel columns.
+      names     – tuple of entry names (interned)
+      isdir     – bytes, 1 for directories (recorded with a trailing '/')
+      mtime_ns  – array('q') of st_mtime_ns
+      size      – array('q') of st_size
+      ino       – array('Q') of st_ino
+      ctime_ns  – array('q') of st_ctime_ns
+      dev       – st_dev of the entries (0 if unknown); a mount point is
+                  keyed by its parent's device
+    """
+    __slots__ = ('names', 'isdir', 'mtime_ns', 'size', 'ino', 'ctime_ns', 'dev')
+
+    def __init__(self, names, isdir, mtime_ns, size, ino, ctime_ns, dev=0):
+        self.names = names
+        self.isdir = isdir
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.ino = ino
+        self.ctime_ns = ctime_ns
+        self.dev = dev
+
+    def __len__(self):
+        return len(self.names)
+
+    def rel(self, rel_dir, i):
+        """
+        Relative path of entry `i` (directories end with '/').
+        """
+        return rel_dir + self.names[i] + '/' if self.isdir[i] else rel_dir + self.names[i]
+
+    def sig(self, i):
+        """
+        Change signature of entry `i` (see signature()).
+        """
+        return self.mtime_ns[i], self.size[i], self.ino[i], self.ctime_ns[i]
+
+    def same_values(self, other):
+        """
+        True if every signature column equals `other`'s (C-level array
+        comparisons, no allocation).
+        """
+        return (self.mtime_ns == other.mtime_ns and self.size == other.size
+                and self.ctime_ns == other.ctime_ns and self.ino == other.ino)
+
+    def select(self, keep):
+        """
+        Chunk of the entries whose indexes are listed in `keep`.
+        """
+        return DirChunk(tuple(self.names[i] for i in keep), bytes(self.isdir[i] for i in keep),
+                        array('q', (self.mtime_ns[i] for i in keep)),
+                        array('q', (self.size[i] for i in keep)),
+                        array('Q', (self.ino[i] for i in keep)),
+                        array('q', (self.ctime_ns[i] for i in keep)), self.dev)
+
+    def filtered(self, rel_dir, match):
+        """
+        This chunk without the entries `match` rejects (the chunk itself
+        when it keeps them all).
+        """
+        keep = [i for i in range(len(self.names)) if match(self.rel(rel_dir, i))]
+        return self if len(keep) == len(self.names) else self.select(keep)
+
+
+class ChunkBuilder:
+    """
+    Accumulates the entries of one directory while it is being listed.
+    """
+    __slots__ = ('names', 'isdir', 'mtime_ns', 'size', 'ino', 'ctime_ns', 'dev')
+
+    def __init__(self):
+        self.dev = 0
+        self.names = []
+        self.isdir = bytearray()
+        self.mtime_ns = array('q')
+        self.size = array('q')
+        self.ino = array('Q')
+        self.ctime_ns = array('q')
+
+    def add(self, name, is_dir, st):
+        self.names.append(_intern(name))
+        self.isdir.append(1 if is_dir else 0)
+        self.mtime_ns.append(st.st_mtime_ns)
+        self.size.append(st.st_size)
+        self.ino.append(st.st_ino if _USE_INO else 0)
+        self.ctime_ns.append(st.st_ctime_ns)
+        if not self.dev:
+            self.dev = st.st_dev
+
+    def build(self):
+        return DirChunk(tuple(self.names), bytes(self.isdir), self.mtime_ns, self.size,
+                        self.ino, self.ctime_ns, self.dev)
+
+
+class Snapshot:
+    """
+    Compact snapshot: { (base, rel_dir): DirChunk }.
+    `rel_dir` is '' for the base itself and 'a/b/' for subdirectories.
+    """
+    __slots__ = ('dirs',)
+
+    def __init__(self, dirs=None):
+        self.dirs = {} if dirs is None else dirs
+
+    def add_chunk(self, base, rel_dir, chunk):
+        self.dirs[(base, rel_dir)] = chunk
+
+    def update(self, other):
+        """
+        Merge another snapshot's directories into this one.
+        """
+        self.dirs.update(other.dirs)
+
+    def filtered(self, match=None, prune=None, bases=None):
+        """
+        Snapshot of the entries that pass `match`, outside the subtrees
+        `prune` cuts and, if `bases` (a set) is given, of those bases only,
+        as a scan with these filters would record them. No filesystem
+        access; chunks that keep all their entries are shared.
+        """
+        dirs = {}
+        cut = {}   # rel_dir -> True if it is at or below a pruned directory
+        for key, chunk in self.dirs.items():
+            base, rel_dir = key
+            if bases is not None and base not in bases:
+                continue
+            if prune is not None and rel_dir and _pruned(rel_dir, prune, cut):
+                continue
+            dirs[key] = chunk if match is None else chunk.filtered(rel_dir, match)
+        return Snapshot(dirs)
+
+    def __len__(self):
+        return sum(len(c) for c in self.dirs.values())
+
+    def bases(self):
+        return sorted({base for base, _ in self.dirs})
+
+    def items(self):
+        """
+        Yield (base, rel, mtime) for every recorded entry, mtime in
+        seconds: the same float as os.stat()'s st_mtime.
+        """
+        for (base, rel_dir), chunk in self.dirs.items():
+            for i in range(len(chunk.names)):
+                yield base, chunk.rel(rel_dir, i), _seconds(chunk.mtime_ns[i])
+
+    def to_dict(self):
+        """
+        Return the v1.3.0 form { "base|relative_path": mtime }.
+        """
+        return {f"{base}|{rel}": mtime for base, rel, mtime in self.items()}
+
+
+class Locator:
+    """
+    (base, rel) -> (chunk, index) lookups in a Snapshot, indexing each
+    chunk's names on first use (for the few paths a diff reports).
+    """
+    __slots__ = ('dirs', 'names')
+
+    def __init__(self, snapshot):
+        self.dirs = snapshot.dirs
+        self.names = {}
+
+    def find(self, base, rel):
+        """
+        Return (chunk, i) for the entry `rel` of `base`, or None.
+        """
+        cut = rel.rfind('/', 0, len(rel) - 1) + 1
+        key = (base, rel[:cut])
+        chunk = self.dirs.get(key)
+        if chunk is None:
+            return None
+        index = self.names.get(key)
+        if index is None:
+            index = self.names[key] = {n: i for i, n in enumerate(chunk.names)}
+        i = index.get(rel[cut:].rstrip('/'))
+        if i is None or bool(chunk.isdir[i]) != rel.endswith('/'):
+            return None
+        return chunk, i
+
+
+def _seconds(ns):
+    # as CPython builds st_mtime (sec + nsec * 1e-9); ns / 1e9 can differ
+    # in the last bits
+    return ns // 1000000000 + (ns % 1000000000) * 1e-9
+
+
+def _pruned(rel_dir, prune, cut):
+    hit = cut.get(rel_dir)
+    if hit is None:
+        parent = rel_dir[:rel_dir.rfind('/', 0, len(rel_dir) - 1) + 1]
+        hit = cut[rel_dir] = bool(prune(rel_dir) or (parent and _pruned(parent, prune, cut)))
+    return hit
+
+
+def intern_base(base):
+    """
+    Intern a base path so every chunk key shares one string object.
+    """
+    return _intern(base)
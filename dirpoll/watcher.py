@@ -0,0 +1,659 @@
+# -*- coding: utf-8 -*-
+"""
+Importable monitoring API.
+
+Watcher ties the scan engine together (backend, diff, rename pairing,
+content hashing, state file) and hands out Event objects, with no
+logging setup, terminal or output handling of its own:
+
+    from dirpoll.watcher import Watcher
+
+    with Watcher(['/srv/data'], interval=2, recursive=True) as w:
+        for event in w:                  # blocks; w.stop() ends the loop
+            print(event.kind, event.path)
+
+    async for event in Watcher(['/srv/data']):   # same, from asyncio
+        ...                                      # (dirpoll.aio.watch())
+
+A caller with its own select() loop uses the backend-style protocol
+instead: select on fds() for at most timeout() seconds, then pass the
+ready descriptors to step(), which scans only when something is due
+and returns that tick's events.
+
+With the 'metrics' engine option every scanning tick is timed by phase
+(see dirpoll.metrics); Watcher.metrics holds the histograms and, with
+'metrics_port', they are served in the Prometheus text format.
+With 'debounce' (seconds) or 'stable_ticks' the events of a path are
+held until it is quiet, and merged (see dirpoll.debounce); flush()
+releases them when monitoring stops. With 'max_entries' or 'max_ms'
+each tick walks a bounded slice of the tree and diffs only the
+directories it completed (see dirpoll.partial). With 'processes' > 1
+the tree is scanned by worker processes that send back only their
+events (see dirpoll.shard).
+
+reconfigure() changes the watched paths and the patterns of a running
+Watcher between two ticks, without a new baseline: an added directory
+is scanned on its own, a removed one is dropped from the snapshot, and
+the recorded entries are re-filtered in memory. With 'control_socket'
+(a path) the same changes can be requested by other processes (see
+dirpoll.control).
+
+scan() and filter_match() are the one-shot helpers the front-ends used
+to define themselves; diff.compare() diffs two snapshots.
+"""
+
+import logging
+import os
+import select
+import time
+
+from dirpoll import persist, scanner
+from dirpoll.backends import open_backend, walk_policy
+from dirpoll.diff import ADDED, MODIFIED, REMOVED, RENAMED, compare, find_renames
+from dirpoll.filters import compile_filter, match_both, narrows, prune_either
+from dirpoll.snapshot import Snapshot
+
+log = logging.getLogger("dirpoll")
+
+DEFAULT_ENGINE = {
+    'backend': 'auto', 'incremental': False, 'restat_files': None, 'workers': 1,
+    'state_file': None, 'backpressure': 'block', 'jsonl_file': None,
+    'adaptive': False, 'min_interval': 0.5, 'max_interval': 60.0,
+    'hashing': False, 'hash_budget_mb': 64, 'renames': True,
+    'metrics': False, 'metrics_port': None, 'metrics_every': 60.0, 'slow_fraction': 0.5,
+    'debounce': 0.0, 'stable_ticks': 0, 'debounce_max': 10000,
+    'max_entries': None, 'max_ms': None, 'processes': 1, 'rebalance': 60.0,
+    'journal_dir': None, 'journal_segment_mb': 64, 'journal_keep': None,
+    'follow_symlinks': False, 'same_fs': False, 'device_workers': None,
+    'control_socket': None,
+}
+
+
+class Event:
+    """
+    One change of a watched directory.
+
+      kind   ADDED, REMOVED, MODIFIED or RENAMED (dirpoll.diff)
+      base   the watched directory it belongs to
+      rel    path relative to base, '/'-separated, with a trailing '/'
+             for directories ('' is the base itself)
+      src    (base, rel) a RENAMED entry came from, else None
+      time   when it was detected (time.time())
+
+    Events are values: equal and hashed by (kind, base, rel, src), not
+    by time, and not to be modified once built. A plain __slots__ class
+    rather than a frozen dataclass keeps the core importable on 3.6 and
+    construction cheap (frozen __init__ goes through object.__setattr__).
+    """
+    __slots__ = ('kind', 'base', 'rel', 'src', 'time')
+
+    def __init__(self, kind, base, rel, src=None, time=None):
+        self.kind = kind
+        self.base = base
+        self.rel = rel
+        self.src = src
+        self.time = time
+
+    @property
+    def is_dir(self):
+        return self.rel.endswith('/')
+
+    @property
+    def path(self):
+        """Absolute path of the entry."""
+        return os.path.join(self.base, *self.rel.rstrip('/').split('/'))
+
+    @property
+    def src_path(self):
+        """Absolute path a renamed entry came from, else None."""
+        if self.src is None:
+            return None
+        return os.path.join(self.src[0], *self.src[1].rstrip('/').split('/'))
+
+    def as_tuple(self):
+        """(kind, base, rel, src), as EventPipeline.submit() takes it."""
+        return (self.kind, self.base, self.rel, self.src)
+
+    def __eq__(self, other):
+        if not isinstance(other, Event):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        src = f", src={self.src!r}" if self.src is not None else ""
+        return f"Event({self.kind!r}, {self.base!r}, {self.rel!r}{src})"
+
+
+def scan(paths, recursive=False, include_hidden=False, include=(), exclude=()):
+    """
+    One full scan of `paths` into a Snapshot, with the glob filters.
+    """
+    flt = compile_filter(include, exclude)
+    if flt is None:
+        return scanner.scan(paths, recursive, include_hidden)
+    return scanner.scan(paths, recursive, include_hidden, flt.match, flt.prune)
+
+
+def filter_match(name, include=(), exclude=()):
+    """
+    Return True if `name` passes include/exclude glob patterns.
+    """
+    flt = compile_filter(include, exclude)
+    return flt is None or flt.match(name)
+
+
+def changes(old, new, renames=True, hasher=None, now=None):
+    """
+    Events between two snapshots, in reporting order: renames (by new
+    path), then added, removed and modified entries, each sorted.
+    """
+    added, removed, modified = compare(old, new)
+    renamed = []
+    if renames:
+        renamed, added, removed, modified = find_renames(old, new, added, removed, modified)
+    if hasher is not None:
+        modified = hasher.confirm(modified, old, new)
+    now = time.time() if now is None else now
+    return ([Event(RENAMED, n[0], n[1], o, now) for o, n in renamed]
+            + [Event(ADDED, b, r, None, now) for b, r in sorted(added)]
+            + [Event(REMOVED, b, r, None, now) for b, r in sorted(removed)]
+            + [Event(MODIFIED, b, r, None, now) for b, r in sorted(modified)])
+
+
+class Watcher:
+    """
+    Monitor `paths` with the engine options of `engine` (see
+    DEFAULT_ENGINE) and report Events.
+    """
+
+    def __init__(self, paths, interval=5.0, recursive=False, include_hidden=False,
+                 include=(), exclude=(), engine=None):
+        self.paths = list(paths)
+        self.interval = interval
+        self.recursive = recursive
+        self.include_hidden = include_hidden
+        self.include = list(include or ())
+        self.exclude = list(exclude or ())
+        self.engine = dict(DEFAULT_ENGINE, **(engine or {}))
+        self.state_file = self.engine['state_file']
+        if self.engine['processes'] > 1 and self.state_file:
+            log.warning("State: the state file is not used with sharded monitoring")
+            self.state_file = None
+        self.save_every = self.engine.get('save_every', 300.0)
+        self.backend = None
+        self.snapshot = None
+        self.state_loaded = 0       # entries of the loaded state file
+        self.state_saved = None     # settings (and saved_at) it was saved with
+        self.state_error = None     # why it could not be used
+        self.metrics = None         # metrics.Metrics with the 'metrics' option
+        self._settings = None
+        self._seed = None
+        self._hasher = None
+        self._due = 0.0
+        self._dirty = False
+        self._next_save = 0.0
+        self._stopped = False
+        self._closed = False
+        self._wake = None
+        self._timings = None
+        self._server = None
+        self._debounce = None
+        self._partial = False       # backend diffs by region (dirpoll.partial)
+        self._sharded = False       # backend reports events (dirpoll.shard)
+        self._transition = None     # (match, prune, bases) the next diff sees, after reconfigure()
+        self._control = None        # control.ControlServer with 'control_socket'
+
+    # --- setup ---------------------------------------------------------
+    def load_state(self):
+        """
+        Load the state file (once). Returns True if it can be used; else
+        state_error tells why.
+        """
+        if self._settings is not None or not self.state_file:
+            return self.state_saved is not None
+        self._settings = self._current_settings()
+        try:
+            snap, meta, saved = persist.load(self.state_file, self._settings)
+        except persist.StateError as exc:
+            self.state_error = exc
+            return False
+        self._seed = (snap, meta)
+        self.state_loaded = len(snap)
+        self.state_saved = saved
+        return True
+
+    def _current_settings(self):
+        return persist.settings_of([scanner.resolve_base(p) for p in self.paths],
+                                   self.recursive, self.include_hidden,
+                                   self.include, self.exclude,
+                                   self.engine['follow_symlinks'], self.engine['same_fs'])
+
+    def start(self):
+        """
+        Load the state file and open the backend, without scanning yet.
+        """
+        if self.backend is not None or self._closed:
+            return
+        self.load_state()
+        engine = self.engine
+        if engine['metrics']:
+            from dirpoll.metrics import Metrics, ScanTimings
+            self._timings = ScanTimings()
+            self.metrics = Metrics(self.interval, engine['slow_fraction'],
+                                   engine['metrics_every'])
+        self._open_backend()
+        if engine['hashing'] and not self._sharded:
+            from dirpoll.hashing import ContentHasher
+            self._hasher = ContentHasher(budget=engine['hash_budget_mb'] << 20)
+        if engine['debounce'] > 0 or engine['stable_ticks'] > 0:
+            from dirpoll.debounce import Debouncer
+            self._debounce = Debouncer(engine['debounce'], engine['stable_ticks'],
+                                       engine['debounce_max'])
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        os.set_blocking(w, False)
+        self._wake = (r, w)
+        if self.metrics is not None and engine['metrics_port']:
+            self._serve_metrics(engine['metrics_port'])
+        if engine['control_socket']:
+            self._serve_control(engine['control_socket'])
+
+    def _open_backend(self):
+        engine = self.engine
+        if engine['processes'] > 1:
+            from dirpoll.shard import ShardedBackend
+            # the workers compile the filters themselves
+            self.backend = ShardedBackend(self.paths, self.recursive, self.include_hidden,
+                                          self.include, self.exclude, self.interval,
+                                          engine['processes'], engine['renames'],
+                                          engine['rebalance'],
+                                          follow_symlinks=engine['follow_symlinks'],
+                                          same_fs=engine['same_fs'])
+            self._sharded = True
+        else:
+            flt = compile_filter(self.include, self.exclude)
+            self.backend = open_backend(self.paths, self.recursive, self.include_hidden,
+                                        flt and flt.match, flt and flt.prune,
+                                        self.interval, engine, self._seed, self._timings)
+            self._partial = hasattr(self.backend, 'poll_region')
+
+    def _serve_metrics(self, port):
+        from dirpoll.metrics import MetricsServer
+        try:
+            self._server = MetricsServer(self.metrics, port)
+        except OSError as exc:
+            log.warning(f"Metrics: cannot listen on port {port}: {exc}")
+        else:
+            host, port = self._server.address[:2]
+            log.info(f"Metrics: serving http://{host}:{port}/metrics")
+
+    def _serve_control(self, path):
+        from dirpoll.control import ControlServer
+        try:
+            self._control = ControlServer(path)
+        except OSError as exc:
+            log.warning(f"Control: cannot listen on {path}: {exc}")
+        else:
+            log.info(f"Control: listening on {path}")
+
+    def open(self):
+        """
+        Take the first snapshot. Returns the events since the state file
+        was saved (none without one); later calls return [].
+        """
+        if self.snapshot is not None or self._closed:
+            return []
+        self.start()
+        engine = self.engine
+        self.snapshot = self.backend.baseline()
+        events = []
+        if self._seed is not None:
+            if not self._partial:   # (a partial backend diffs it region by region)
+                events = changes(self._seed[0], self.snapshot, engine['renames'], self._hasher)
+            self._seed = None
+        if self._hasher is not None:
+            self._hasher.warm(self.snapshot)
+        now = time.monotonic()
+        self._due = now + self.backend.timeout()
+        self._next_save = now + self.save_every
+        return events
+
+    # --- select()-loop protocol -----------------------------------------
+    def fds(self):
+        """
+        Descriptors to select() on (backend events, stop()).
+        """
+        if self.backend is None:
+            return []
+        fds = [self._wake[0]] + self.backend.fds()
+        if self._control is not None:
+            fds.append(self._control.fileno())
+        return fds
+
+    def timeout(self):
+        """
+        Seconds until the next scan (or the release of held events) is due.
+        """
+        due = self._due
+        if self._debounce:
+            release = self._debounce.next_release()
+            if release is not None:
+                due = min(due, release)
+        return max(0.0, due - time.monotonic())
+
+    def step(self, ready=(), emit=None):
+        """
+        Scan if the backend has events in `ready` or its interval is up;
+        return the events found (often none). `emit`, if given, is called
+        with them first (timed as the emit phase of the metrics).
+        """
+        if self.snapshot is None:
+            return self.open()
+        if self._closed or self._stopped:
+            return []
+        wake = self._wake[0]
+        if wake in ready:
+            _drain(wake)
+        control = self._control and self._control.fileno()
+        if control in ready:
+            self._control.serve(self)
+        fired = [fd for fd in ready if fd != wake and fd != control]
+        debounce = self._debounce
+        if not fired and time.monotonic() < self._due:
+            if debounce is None:
+                return []
+            # held events whose quiet period ended between two scans
+            due = debounce.next_release()
+            now = time.monotonic()
+            if due is None or now < due:
+                return []
+            events = debounce.release(now)
+            if emit is not None:
+                emit(events)
+            return events
+        if self._sharded:
+            events = [Event(*e) for e in self.backend.poll_events(fired)]
+            if debounce is not None:
+                events = debounce.push(events, time.monotonic())
+            self._reschedule()
+            if events and emit is not None:
+                emit(events)
+            return events
+        timings = self._timings
+        if timings is not None:
+            timings.reset()
+            t0 = time.perf_counter()
+        if self._partial:
+            old, new = self.backend.poll_region(fired) or (None, None)
+        else:
+            old, new = self.snapshot, self.backend.poll(fired)
+        if timings is not None:
+            t1 = time.perf_counter()
+        if new is None:
+            # nothing changed: still a stable tick for the held events
+            events = [] if debounce is None else debounce.push([], time.monotonic())
+            self._reschedule()
+            if timings is not None:
+                t2 = time.perf_counter()
+            if events and emit is not None:
+                emit(events)
+            if timings is not None:
+                # quiet ticks count too, for the histograms and slow-scan warnings
+                self._record(timings, t1 - t0, t2 - t1,
+                             time.perf_counter() - t2 if emit is not None else None,
+                             len(events))
+            return events
+        view = new
+        if self._transition is not None:
+            # first scan since reconfigure() widened the patterns: the
+            # entries only the new ones admit join the snapshot silently
+            match, prune, kept = self._transition
+            view = new.filtered(match, prune, kept)
+            view.update(Snapshot({k: c for k, c in new.dirs.items() if k[0] not in kept}))
+            self._transition = None
+        events = changes(old, view, self.engine['renames'], self._hasher)
+        if self._hasher is not None:
+            self._hasher.warm(new)
+        self.snapshot = self.backend.snapshot if self._partial else new
+        self._dirty = self._dirty or bool(events)
+        if debounce is not None:
+            events = debounce.push(events, time.monotonic())
+        self._reschedule()
+        if timings is not None:
+            t2 = time.perf_counter()
+        if emit is not None:
+            emit(events)
+        if timings is not None:
+            self._record(timings, t1 - t0, t2 - t1,
+                         time.perf_counter() - t2 if emit is not None else None, len(events))
+        if self.state_file and self._dirty and time.monotonic() >= self._next_save:
+            self.save()
+        return events
+
+    def _reschedule(self):
+        now = time.monotonic()
+        self._due = now + self.backend.timeout()
+        if self._debounce:
+            # event-driven backends scan rarely: tick at the interval while
+            # events are held, so that they can become stable
+            self._due = min(self._due, now + self.interval)
+
+    def flush(self):
+        """
+        Release the events held by the debounce stage, if any.
+        """
+        if self._debounce is None:
+            return []
+        return self._debounce.flush()
+
+    def _record(self, timings, scan, diff, emit, events):
+        values = {
+            'walk_seconds': max(0.0, scan - timings.stat_time - timings.filter_time),
+            'stat_seconds': timings.stat_time,
+            'filter_seconds': timings.filter_time,
+            'diff_seconds': diff,
+            'scan_seconds': scan,
+            'entries_scanned': timings.stat_calls,
+            'dirs_pruned': timings.pruned,
+            'events': events,
+        }
+        if emit is not None:
+            values['emit_seconds'] = emit
+        self.metrics.record(values)
+
+    # --- live reconfiguration -------------------------------------------
+    def reconfigure(self, paths=None, include=None, exclude=None):
+        """
+        Watch `paths` with the `include`/`exclude` patterns from now on
+        (None: unchanged), without a new baseline. Call it between two
+        step()s, from the thread that runs them.
+
+          • a removed path leaves the snapshot (no events),
+          • an added path is scanned on its own (no events; with partial
+            scans it is absorbed by the next pass instead),
+          • the recorded entries are re-filtered in memory. When the new
+            patterns may admit entries the old ones rejected (an exclude
+            dropped, an include added), those have never been listed:
+            the next scan lists every directory again, and its diff
+            ignores the newly admitted entries, which join silently.
+
+        Changes made meanwhile to entries both configurations record are
+        reported by the next tick, once. Before open() only the
+        configuration the backend is opened with changes.
+        """
+        t0 = time.perf_counter()
+        paths = self.paths if paths is None else list(paths)
+        include = self.include if include is None else list(include)
+        exclude = self.exclude if exclude is None else list(exclude)
+        old_bases = [scanner.resolve_base(p) for p in self.paths]
+        bases = [scanner.resolve_base(p) for p in paths]
+        refilter = (include, exclude) != (self.include, self.exclude)
+        # (index backends still owe the re-listing of a previous widening)
+        relist = refilter and (self._transition is not None
+                               or not narrows(self.include, self.exclude, include, exclude))
+        old_flt = compile_filter(self.include, self.exclude)
+        self.paths, self.include, self.exclude = paths, include, exclude
+        if self.snapshot is None:
+            if self.state_file:
+                # the state file is checked against the new settings
+                self._settings = self._seed = self.state_saved = self.state_error = None
+                self.state_loaded = 0
+            if self.backend is not None:
+                self.backend.close()
+                self.load_state()
+                self._open_backend()
+            return
+        if self.state_file:
+            self._settings = self._current_settings()
+        if self._sharded:
+            self.backend.reconfigure(paths, include, exclude, relist)
+        else:
+            flt = compile_filter(include, exclude)
+            match, prune = flt and flt.match, flt and flt.prune
+            if self._timings is not None:
+                from dirpoll.metrics import timed_filters
+                match, prune = timed_filters(match, prune, self._timings)
+            self.snapshot = self.backend.reconfigure(
+                bases, match, prune, walk_policy(paths, self.recursive, self.engine),
+                self.snapshot, refilter, relist)
+            if relist and not self._partial:
+                kept = {b for b in old_bases if b in bases}
+                match0, prune0 = old_flt.match, old_flt.prune
+                if self._transition is not None:
+                    # widened again before that scan: what every configuration saw
+                    match1, prune1, kept1 = self._transition
+                    match0, prune0 = match_both(match0, match1), prune_either(prune0, prune1)
+                    kept &= kept1
+                self._transition = (match0, prune0, kept)
+        self._dirty = True
+        self._due = min(self._due, time.monotonic() + self.backend.timeout())
+        added = [b for b in bases if b not in old_bases]
+        removed = [b for b in old_bases if b not in bases]
+        log.info(f"Reconfigured in {(time.perf_counter() - t0) * 1000:.1f} ms: "
+                 f"{len(added)} directories added, {len(removed)} removed"
+                 + (", patterns widened (re-listing)" if relist
+                    else ", patterns re-filtered in memory" if refilter else ""))
+
+    # --- blocking and async iteration -----------------------------------
+    def poll(self, timeout=None):
+        """
+        Wait until a scan is due (or the backend has events, or stop() is
+        called), at most `timeout` seconds; return the events found.
+        """
+        if self.snapshot is None:
+            return self.open()
+        if self._stopped:
+            return []
+        wait = self.timeout()
+        if timeout is not None:
+            wait = min(wait, timeout)
+        ready, _, _ = select.select(self.fds(), [], [], wait)
+        return self.step(ready)
+
+    def events(self):
+        """
+        Generator of Events, until stop() or close().
+        """
+        yield from self.open()
+        while not self._stopped and not self._closed:
+            yield from self.poll()
+        yield from self.flush()
+
+    __iter__ = events
+
+    def aevents(self, executor=None, close=False):
+        """
+        Async generator of Events (see dirpoll.aio): the loop waits, the
+        scans run in `executor` (default: the loop's); with close=True
+        the watcher is closed, saving its state file, when it ends.
+        """
+        from dirpoll.aio import events
+        return events(self, executor, close)
+
+    def __aiter__(self):
+        # `async for event in Watcher(...)` owns the watcher, like aio.watch()
+        return self.aevents(close=True)
+
+    def stop(self):
+        """
+        End events()/aevents() and wake up a blocked poll(); thread-safe.
+        """
+        self._stopped = True
+        if self._wake is not None:
+            try:
+                os.write(self._wake[1], b'\0')
+            except OSError:
+                pass
+
+    # --- state and teardown ---------------------------------------------
+    def save(self):
+        """
+        Write the current snapshot to the state file. Failures are logged;
+        returns True on success.
+        """
+        if not self.state_file or self.snapshot is None:
+            return False
+        if not getattr(self.backend, 'complete', True):
+            return False   # first partial pass still running
+        if self._settings is None:
+            self.load_state()
+        try:
+            persist.save(self.state_file, self.snapshot, self._settings, self.backend.dir_meta())
+        except OSError as exc:
+            log.warning(f"State: cannot save {self.state_file}: {exc}")
+            return False
+        self._dirty = False
+        self._next_save = time.monotonic() + self.save_every
+        return True
+
+    def schedule(self):
+        """
+        Per-subtree schedule of the adaptive backend, else None.
+        """
+        stats = getattr(self.backend, 'stats', None)
+        return stats() if stats is not None else None
+
+    def close(self, save=True):
+        """
+        Stop, save the state file (unless save=False) and release the
+        backend.
+        """
+        if self._closed:
+            return
+        self.stop()
+        self._closed = True
+        if self.backend is None:
+            return
+        try:
+            if save:
+                self.save()
+        finally:
+            self.backend.close()
+            if self._hasher is not None:
+                self._hasher.close()
+            if self._server is not None:
+                self._server.close()
+                self._server = None
+            if self._control is not None:
+                self._control.close()
+                self._control = None
+            for fd in self._wake:
+                os.close(fd)
+            self._wake = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
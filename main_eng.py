@@ -12,6 +12,9 @@ Features:
   • logging to console and/or file
   • detects file and folder creation, deletion, modification
   • press ESC to stop monitoring and return to menu
+  • headless mode with command line flags or a config file (--help),
+    stopped by SIGTERM, SIGHUP reloads the config file's directories and
+    patterns; --once prints the changes since a saved snapshot
 
 No external dependencies are required.
 """
@@ -21,67 +24,39 @@ import sys
 import time
 import select
 import logging
-import fnmatch
-import termios
-import tty
 from pathlib import Path
 
+from dirpoll import cli
+from dirpoll.diff import compare
+from dirpoll.journal import JournalSink
+from dirpoll.output import EventPipeline, LogSink, JsonLinesSink, format_event
+from dirpoll.watcher import DEFAULT_ENGINE, Watcher, scan, filter_match
+
+
 def scan_dirs(bases, recursive, include_hidden, include_pats, exclude_pats):
     """
-    Walk through each base directory and return a snapshot dict:
-      { "base|relative_path": last_modification_time }
-    Applies glob filters and handles hidden entries per settings.
-    """
-    snapshot = {}
-    for base in bases:
-        base = base.resolve()
-        if recursive:
-            for root, dirs, files in os.walk(base):
-                # filter out hidden entries if needed
-                if not include_hidden:
-                    dirs[:]  = [d for d in dirs  if not d.startswith('.')]
-                    files[:] = [f for f in files if not f.startswith('.')]
-                # record directories
-                for d in dirs:
-                    full = Path(root) / d
-                    rel = full.relative_to(base).as_posix() + '/'
-                    if _filter_match(rel, include_pats, exclude_pats):
-                        snapshot[f"{base}|{rel}"] = full.stat().st_mtime
-                # record files
-                for f in files:
-                    full = Path(root) / f
-                    rel = full.relative_to(base).as_posix()
-                    if _filter_match(rel, include_pats, exclude_pats):
-                        snapshot[f"{base}|{rel}"] = full.stat().st_mtime
-        else:
-            for child in base.iterdir():
-                name = child.name
-                # skip hidden if not included
-                if not include_hidden and name.startswith('.'):
-                    continue
-                rel = name + ('/' if child.is_dir() else '')
-                if _filter_match(rel, include_pats, exclude_pats):
-                    snapshot[f"{base}|{rel}"] = child.stat().st_mtime
-    return snapshot
+    Walk through each base directory and return a compact Snapshot
+    (dirpoll.snapshot) of every entry's modification time.
+    Applies glob filters and handles hidden entries per settings
+    (see dirpoll.watcher.scan).
+    """
+    return scan(bases, recursive, include_hidden, include_pats, exclude_pats)
+
 
 def _filter_match(name, includes, excludes):
     """
     Return True if `name` passes include/exclude glob patterns.
     """
-    if includes and not any(fnmatch.fnmatch(name, pat) for pat in includes):
-        return False
-    if excludes and any(fnmatch.fnmatch(name, pat) for pat in excludes):
-        return False
-    return True
+    return filter_match(name, includes, excludes)
+
 
 def compare_snapshots(old, new):
     """
-    Compare two snapshots, return sets of added, removed, modified keys.
+    Compare two snapshots, return sets of added, removed, modified
+    (base, relative_path) pairs.
     """
-    added   = set(new) - set(old)
-    removed = set(old) - set(new)
-    modified= {k for k in (set(old) & set(new)) if old[k] != new[k]}
-    return added, removed, modified
+    return compare(old, new)
+
 
 def setup_logging(logfile):
     """
@@ -94,23 +69,28 @@ def setup_logging(logfile):
     logging.basicConfig(level=logging.INFO, format=fmt, handlers=handlers)
     logging.info("Logging initialized")
 
+
 def _enable_raw_mode():
     """
     Enable cbreak mode on stdin to read single characters (for ESC).
     Returns original termios attributes.
     """
+    import termios, tty   # interactive only: not needed (or available) headless
     fd = sys.stdin.fileno()
     old = termios.tcgetattr(fd)
     tty.setcbreak(fd)
     return old
 
+
 def _restore_mode(old):
     """
     Restore original termios attributes.
     """
+    import termios
     fd = sys.stdin.fileno()
     termios.tcsetattr(fd, termios.TCSADRAIN, old)
 
+
 def menu():
     """
     Display textual menu for configuration.
@@ -122,6 +102,7 @@ def menu():
     include_hidden = False
     include_pats, exclude_pats = [], []
     logfile = None
+    engine = dict(DEFAULT_ENGINE)
 
     while True:
         print("\n" + "="*60)
@@ -136,9 +117,10 @@ def menu():
         print("7) Advanced filters (include/exclude)")
         print(f"8) Log file path:          {logfile or 'stdout'}")
         print("9) Start monitoring")
+        print("o) Scan engine options")
         print("0) Exit")
         print("-"*60)
-        choice = input("Select [0-9]: ").strip()
+        choice = input("Select [0-9,o]: ").strip().lower()
 
         if choice == '1':
             p = input("   Enter directory to add: ").strip()
@@ -188,12 +170,16 @@ def menu():
             if not dirs:
                 print("   ! At least one directory must be added")
                 continue
-            return dirs, interval, recursive, include_hidden, include_pats, exclude_pats, logfile
+            return (dirs, interval, recursive, include_hidden, include_pats, exclude_pats,
+                    logfile, engine)
+        elif choice == 'o':
+            _submenu_engine(engine)
         elif choice == '0':
             sys.exit(0)
         else:
             print("   ! Invalid choice")
 
+
 def _submenu_filters(includes, excludes):
     """
     Sub-menu to manage include/exclude glob patterns.
@@ -239,59 +225,334 @@ def _submenu_filters(includes, excludes):
         else:
             print("    ! Invalid choice")
 
+
+def _submenu_engine(engine):
+    """
+    Sub-menu to tune the scan engine (settings kept in the `engine` dict).
+    """
+    while True:
+        restat = engine['restat_files']
+        print("\n  > SCAN ENGINE OPTIONS")
+        print(f"  a) Incremental scan (dir-mtime pruning): {'YES' if engine['incremental'] else 'NO'}")
+        print(f"  b) Files re-stated per tick:            {restat if restat is not None else 'all'}")
+        print(f"  c) Parallel scan workers:               {engine['workers']}")
+        print(f"  d) Backend (auto/polling/inotify):      {engine['backend']}")
+        print(f"  e) State file (saved snapshot):         {engine['state_file'] or 'none'}")
+        print(f"  f) Output queue full (block/drop/coalesce): {engine['backpressure']}")
+        print(f"  g) JSON Lines event file:               {engine['jsonl_file'] or 'none'}")
+        print(f"  h) Adaptive per-subtree intervals:      {'YES' if engine['adaptive'] else 'NO'}")
+        print(f"  i) Adaptive bounds (min/max):           "
+              f"{engine['min_interval']:.1f}s / {engine['max_interval']:.1f}s")
+        print(f"  j) Content hashing of modified files:   {'YES' if engine['hashing'] else 'NO'}")
+        print(f"  k) Hashing I/O budget per tick:         {engine['hash_budget_mb']} MB")
+        print(f"  l) Rename/move detection:               {'YES' if engine['renames'] else 'NO'}")
+        print(f"  m) Per-tick metrics (scan timings):     {'YES' if engine['metrics'] else 'NO'}")
+        print(f"  n) Metrics HTTP port (Prometheus):      {engine['metrics_port'] or 'none'}")
+        print(f"  o) Debounce (quiet s / stable ticks):   "
+              f"{engine['debounce']:.1f}s / {engine['stable_ticks']}")
+        print(f"  p) Partial scan (entries/ms per tick):  "
+              f"{engine['max_entries'] or '-'} / {engine['max_ms'] or '-'}")
+        print(f"  q) Worker processes (sharded):          {engine['processes']}")
+        print(f"  r) Event journal directory:             {engine['journal_dir'] or 'none'}")
+        print(f"  s) Follow symlinked directories:        {'YES' if engine['follow_symlinks'] else 'NO'}")
+        print(f"  t) Stay on one filesystem:              {'YES' if engine['same_fs'] else 'NO'}")
+        print(f"  u) Parallel threads per device:         {engine['device_workers'] or 'no limit'}")
+        print(f"  v) Control socket (live changes):       {engine['control_socket'] or 'none'}")
+        print("  x) Return to main menu")
+        sel = input("  Select [a-v,x]: ").strip().lower()
+        if sel == 'a':
+            engine['incremental'] = not engine['incremental']
+        elif sel == 'b':
+            v = input("    Files per tick (empty=all): ").strip()
+            if not v:
+                engine['restat_files'] = None
+            elif v.isdigit():
+                engine['restat_files'] = int(v)
+            else:
+                print("    ! Invalid number")
+        elif sel == 'c':
+            v = input("    Worker threads (1=sequential): ").strip()
+            if v.isdigit() and int(v) >= 1:
+                engine['workers'] = int(v)
+            else:
+                print("    ! Invalid number")
+        elif sel == 'd':
+            order = ['auto', 'polling', 'inotify']
+            engine['backend'] = order[(order.index(engine['backend']) + 1) % len(order)]
+        elif sel == 'e':
+            v = input("    State file path (empty=none): ").strip()
+            engine['state_file'] = os.path.expanduser(v) if v else None
+        elif sel == 'f':
+            order = ['block', 'drop', 'coalesce']
+            engine['backpressure'] = order[(order.index(engine['backpressure']) + 1) % len(order)]
+        elif sel == 'g':
+            v = input("    JSON Lines file path (empty=none): ").strip()
+            engine['jsonl_file'] = os.path.expanduser(v) if v else None
+        elif sel == 'h':
+            engine['adaptive'] = not engine['adaptive']
+        elif sel == 'i':
+            try:
+                lo = float(input("    Minimum interval (s): "))
+                hi = float(input("    Maximum interval (s): "))
+                if lo <= 0 or hi < lo:
+                    raise ValueError
+                engine['min_interval'], engine['max_interval'] = lo, hi
+            except ValueError:
+                print("    ! Invalid interval")
+        elif sel == 'j':
+            engine['hashing'] = not engine['hashing']
+        elif sel == 'k':
+            v = input("    MB read per tick: ").strip()
+            if v.isdigit() and int(v) >= 1:
+                engine['hash_budget_mb'] = int(v)
+            else:
+                print("    ! Invalid number")
+        elif sel == 'l':
+            engine['renames'] = not engine['renames']
+        elif sel == 'm':
+            engine['metrics'] = not engine['metrics']
+        elif sel == 'n':
+            v = input("    Port (empty=none; 127.0.0.1 only): ").strip()
+            if not v:
+                engine['metrics_port'] = None
+            elif v.isdigit() and 0 < int(v) < 65536:
+                engine['metrics_port'] = int(v)
+                engine['metrics'] = True
+            else:
+                print("    ! Invalid port")
+        elif sel == 'o':
+            try:
+                quiet = float(input("    Quiet period (s, 0=none): "))
+                ticks = int(input("    Stable ticks before reporting (0=none): "))
+                if quiet < 0 or ticks < 0:
+                    raise ValueError
+                engine['debounce'], engine['stable_ticks'] = quiet, ticks
+            except ValueError:
+                print("    ! Invalid value")
+        elif sel == 'p':
+            entries = input("    Entries per tick (empty=no limit): ").strip()
+            ms = input("    Milliseconds per tick (empty=no limit): ").strip()
+            if (entries and not entries.isdigit()) or (ms and not ms.isdigit()):
+                print("    ! Invalid number")
+            else:
+                engine['max_entries'] = int(entries) if entries and int(entries) else None
+                engine['max_ms'] = int(ms) if ms and int(ms) else None
+        elif sel == 'q':
+            v = input("    Processes (1=no sharding): ").strip()
+            if v.isdigit() and int(v) >= 1:
+                engine['processes'] = int(v)
+            else:
+                print("    ! Invalid number")
+        elif sel == 'r':
+            v = input("    Journal directory (empty=none): ").strip()
+            engine['journal_dir'] = os.path.expanduser(v) if v else None
+        elif sel == 's':
+            engine['follow_symlinks'] = not engine['follow_symlinks']
+        elif sel == 't':
+            engine['same_fs'] = not engine['same_fs']
+        elif sel == 'u':
+            v = input("    Threads per device (empty=no limit): ").strip()
+            if not v:
+                engine['device_workers'] = None
+            elif v.isdigit() and int(v) >= 1:
+                engine['device_workers'] = int(v)
+            else:
+                print("    ! Invalid number")
+        elif sel == 'v':
+            v = input("    Unix socket path (empty=none): ").strip()
+            engine['control_socket'] = os.path.expanduser(v) if v else None
+        elif sel == 'x':
+            break
+        else:
+            print("    ! Invalid choice")
+
+
+def _queue_events(events, batch):
+    """
+    Hand a tick's Events (dirpoll.watcher) to the output pipeline.
+    """
+    if batch:
+        events.submit([e.as_tuple() + (e.time,) for e in batch])
+
+
+def _open_output(engine):
+    """
+    Build the event pipeline: log lines plus the optional JSON Lines file
+    and event journal.
+    """
+    engine = engine or {}
+    sinks = [LogSink(format_event)]
+    if engine.get('jsonl_file'):
+        try:
+            sinks.append(JsonLinesSink(engine['jsonl_file']))
+        except OSError as exc:
+            logging.warning(f"JSON Lines output disabled: {exc}")
+    if engine.get('journal_dir'):
+        try:
+            sinks.append(JournalSink(engine['journal_dir'],
+                                     engine.get('journal_segment_mb', 64) << 20,
+                                     engine.get('journal_keep')))
+        except OSError as exc:
+            logging.warning(f"Event journal disabled: {exc}")
+    return EventPipeline(sinks, policy=engine.get('backpressure', 'block'))
+
+
+def _log_schedule(watcher):
+    """
+    Log the per-subtree schedule of the adaptive backend.
+    """
+    for st in watcher.schedule() or ():
+        logging.info(f"[{st['base']}] {st['subtree']}: every {st['interval']:.2f}s, "
+                     f"{st['changes']}/{st['scans']} scans with changes, "
+                     f"avg {st['avg_cost'] * 1000:.1f} ms")
+
+
+def _reload_config(watcher, config):
+    """
+    Apply the directories and patterns of the config file to the running
+    watcher (SIGHUP).
+    """
+    if not config:
+        logging.warning("SIGHUP ignored: no config file (-c) to reload")
+        return
+    try:
+        new = cli.reload_config(config)
+    except cli.ConfigError as exc:
+        logging.warning(f"Reload failed, configuration unchanged: {exc}")
+        return
+    logging.info(f"Reloading {config}")
+    watcher.reconfigure(new.get('dirs'), new.get('include'), new.get('exclude'))
+    logging.info(f"Directories: {', '.join(str(p) for p in watcher.paths)}")
+    logging.info(f"Include patterns: {watcher.include or '---'}")
+    logging.info(f"Exclude patterns: {watcher.exclude or '---'}")
+
+
 def monitor_loop(paths, interval, recursive, include_hidden,
-                 include_pats, exclude_pats, logfile):
+                 include_pats, exclude_pats, logfile, engine=None, interactive=True,
+                 config=None):
     """
     Main monitoring loop. Press ESC to interrupt and return to menu.
+    With interactive=False stdin is left alone and SIGTERM/SIGINT stop
+    the loop instead, while SIGHUP reloads `config` (the config file).
     """
     setup_logging(logfile)
-    logging.info("==== Monitoring started (press ESC to return) ====")
+    if interactive:
+        logging.info("==== Monitoring started (press ESC to return) ====")
+    else:
+        logging.info("==== Monitoring started (SIGTERM to stop) ====")
     logging.info(f"Directories: {', '.join(str(p) for p in paths)}")
     logging.info(f"Interval: {interval}s | Recursive: {recursive} | Include hidden: {include_hidden}")
     logging.info(f"Include patterns: {include_pats or '---'}")
     logging.info(f"Exclude patterns: {exclude_pats or '---'}")
+    if engine:
+        logging.info(f"Engine: {engine}")
 
-    old_attrs = _enable_raw_mode()
-    old_snapshot = scan_dirs(paths, recursive, include_hidden, include_pats, exclude_pats)
+    watcher = Watcher(paths, interval, recursive, include_hidden,
+                      include_pats, exclude_pats, engine)
+    # saved snapshot from the previous run, if any
+    if watcher.load_state():
+        logging.info(f"State: loaded {watcher.state_loaded} entries from {watcher.state_file} "
+                     f"(saved {time.ctime(watcher.state_saved['saved_at'])})")
+    elif watcher.state_error is not None:
+        logging.info(f"State: starting without {watcher.state_file} ({watcher.state_error})")
+    watcher.start()
+    backend = watcher.backend
+    logging.info(f"Backend: {backend.name}" + (f" ({backend.reason})" if backend.reason else ""))
+    if interactive and hasattr(backend, 'stats'):
+        logging.info("Press 's' to show the per-subtree schedule.")
+    events = _open_output(engine)
+    if interactive:
+        old_attrs, watch = _enable_raw_mode(), [sys.stdin]
+    else:
+        stop_fd, restore_signals = cli.stop_signals(cli.STOP_SIGNALS + cli.RELOAD_SIGNALS)
+        watch = [stop_fd]
     try:
+        offline = watcher.open()
+        if watcher.state_saved is not None:
+            logging.info(f"Changes while offline: {len(offline)}")
+            _queue_events(events, offline)
         while True:
-            # wait for interval or keypress
-            ready, _, _ = select.select([sys.stdin], [], [], interval)
-            if ready:
+            # wait for interval, backend events or keypress
+            ready, _, _ = select.select(watch + watcher.fds(), [], [], watcher.timeout())
+            if not interactive and stop_fd in ready:
+                if cli.received(stop_fd) - set(cli.RELOAD_SIGNALS):
+                    logging.info("Signal received: stopping.")
+                    break
+                _reload_config(watcher, config)
+            if interactive and sys.stdin in ready:
                 ch = sys.stdin.read(1)
                 if ch == '\x1b':  # ESC
                     logging.info("ESC pressed: returning to menu.")
                     break
+                if ch == 's':
+                    _log_schedule(watcher)
 
-            new_snapshot = scan_dirs(paths, recursive, include_hidden, include_pats, exclude_pats)
-            added, removed, modified = compare_snapshots(old_snapshot, new_snapshot)
+            watcher.step(ready, lambda batch: _queue_events(events, batch))
 
-            for key in sorted(added):
-                base, rel = key.split("|", 1)
-                typ = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] +Added   {typ}: {rel.rstrip('/')}")
-            for key in sorted(removed):
-                base, rel = key.split("|", 1)
-                typ = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] -Removed {typ}: {rel.rstrip('/')}")
-            for key in sorted(modified):
-                base, rel = key.split("|", 1)
-                typ = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] *Modified{typ}: {rel.rstrip('/')}")
+    finally:
+        if interactive:
+            _restore_mode(old_attrs)
+        else:
+            restore_signals()
+        _queue_events(events, watcher.flush())   # events still held by the debounce
+        watcher.close()
+        events.close()
+        if watcher.metrics is not None:
+            logging.info(watcher.metrics.summary())
+        logging.info("==== Monitoring stopped ====")
 
-            old_snapshot = new_snapshot
 
+def run_once(paths, recursive, include_hidden, include_pats, exclude_pats, engine,
+             update_state=False):
+    """
+    Print the changes between the saved state file and the directories
+    now, one line per event, then exit. Returns the exit status: 0 if
+    nothing changed, 1 if something did, 2 if the state file is unusable.
+    With update_state a missing state file is created (status 0).
+    """
+    # the saved directory mtimes let an incremental scan re-list only
+    # what changed; no watches, threads, schedule, partial passes or
+    # worker processes for a single scan
+    watcher = Watcher(paths, 0, recursive, include_hidden, include_pats, exclude_pats,
+                      dict(engine, backend='polling', adaptive=False, hashing=False,
+                           max_entries=None, max_ms=None, processes=1))
+    try:
+        if not watcher.load_state() and not (update_state
+                                             and not os.path.exists(watcher.state_file)):
+            print(f"{watcher.state_file}: {watcher.state_error}", file=sys.stderr)
+            return 2
+        # (without a state file: the first run saves the baseline)
+        changes = watcher.open()
+        if changes:
+            print('\n'.join(format_event(*e.as_tuple()) for e in changes))
+        if update_state:
+            watcher.save()
     finally:
-        _restore_mode(old_attrs)
-        logging.info("==== Monitoring stopped ====")
+        watcher.close(save=False)
+    return 1 if changes else 0
 
-def main():
+
+def main(argv=None):
     """
-    Loop: show menu, then start monitoring until ESC.
+    Loop: show menu, then start monitoring until ESC. With arguments,
+    run headless instead (see dirpoll.cli).
     """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        opts = cli.parse_args(argv)
+        if opts['once']:
+            return run_once(opts['dirs'], opts['recursive'], opts['include_hidden'],
+                            opts['include'], opts['exclude'], opts['engine'],
+                            opts['update_state'])
+        monitor_loop(opts['dirs'], opts['interval'], opts['recursive'],
+                     opts['include_hidden'], opts['include'], opts['exclude'],
+                     opts['log_file'], opts['engine'], interactive=False,
+                     config=opts['config'])
+        return 0
     while True:
         params = menu()
         monitor_loop(*params)
 
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -14,6 +14,10 @@ con:
   • logging su console e/o file  
   • rilevazione di creazione, cancellazione e modifica  
   • ESC per interrompere il monitor e tornare al menu
+  • modalità non interattiva con opzioni da riga di comando o file di
+    configurazione (--help), arrestata da SIGTERM, SIGHUP ricarica le
+    directory e i pattern del file di configurazione; --once stampa le
+    modifiche rispetto a uno snapshot salvato
 
 Nessuna dipendenza esterna: funziona con Python 3.6+ e solo librerie standard.
 """
@@ -23,69 +27,40 @@ import sys
 import time
 import select
 import logging
-import fnmatch
-import termios
-import tty
 from pathlib import Path
 
+from dirpoll import cli
+from dirpoll.diff import compare, ADDED, REMOVED, MODIFIED, RENAMED
+from dirpoll.journal import JournalSink
+from dirpoll.output import EventPipeline, LogSink, JsonLinesSink, format_event
+from dirpoll.watcher import DEFAULT_ENGINE, Watcher, scan, filter_match
+
+
 def scansiona_directory(bases, ricorsivo, includi_nascosti,
                          include_pats, exclude_pats):
     """
-    Per ogni directory in 'bases', costruisce uno snapshot:
-      { "base|percorso_relativo": timestamp_modifica }
-    Applica pattern glob di include/exclude e rispetta l'opzione nascosti.
-    """
-    snapshot = {}
-    for base in bases:
-        base = base.resolve()
-        if ricorsivo:
-            for root, dirs, files in os.walk(base):
-                if not includi_nascosti:
-                    dirs[:]  = [d for d in dirs  if not d.startswith('.')]
-                    files[:] = [f for f in files if not f.startswith('.')]
-                # directory
-                for d in dirs:
-                    full = Path(root) / d
-                    rel = full.relative_to(base).as_posix() + '/'
-                    if _filtra(rel, include_pats, exclude_pats):
-                        snapshot[f"{base}|{rel}"] = full.stat().st_mtime
-                # file
-                for f in files:
-                    full = Path(root) / f
-                    rel = full.relative_to(base).as_posix()
-                    if _filtra(rel, include_pats, exclude_pats):
-                        snapshot[f"{base}|{rel}"] = full.stat().st_mtime
-        else:
-            for child in base.iterdir():
-                name = child.name
-                if not includi_nascosti and name.startswith('.'):
-                    continue
-                rel = name + ('/' if child.is_dir() else '')
-                if _filtra(rel, include_pats, exclude_pats):
-                    snapshot[f"{base}|{rel}"] = child.stat().st_mtime
-    return snapshot
+    Per ogni directory in 'bases', costruisce uno Snapshot compatto
+    (dirpoll.snapshot) con il timestamp di modifica di ogni elemento.
+    Applica pattern glob di include/exclude e rispetta l'opzione nascosti
+    (vedi dirpoll.watcher.scan).
+    """
+    return scan(bases, ricorsivo, includi_nascosti, include_pats, exclude_pats)
+
 
 def _filtra(name, includes, excludes):
     """
     Controlla se 'name' passa i filtri include/exclude (glob).
     """
-    if includes and not any(fnmatch.fnmatch(name, p) for p in includes):
-        return False
-    if excludes and any(fnmatch.fnmatch(name, p) for p in excludes):
-        return False
-    return True
+    return filter_match(name, includes, excludes)
+
 
 def confronta_snapshot(vecchio, nuovo):
     """
-    Confronta due snapshot e ritorna tuple di:
-      (aggiunti, rimossi, modificati)
+    Confronta due snapshot e ritorna insiemi di coppie
+    (base, percorso_relativo): (aggiunti, rimossi, modificati)
     """
-    old_keys = set(vecchio)
-    new_keys = set(nuovo)
-    aggiunti   = new_keys - old_keys
-    rimossi    = old_keys - new_keys
-    modificati = {k for k in old_keys & new_keys if vecchio[k] != nuovo[k]}
-    return aggiunti, rimossi, modificati
+    return compare(vecchio, nuovo)
+
 
 def imposta_logging(file_log):
     """
@@ -97,23 +72,28 @@ def imposta_logging(file_log):
     fmt = "%(asctime)s %(levelname)-8s %(message)s"
     logging.basicConfig(level=logging.INFO, format=fmt, handlers=handlers)
 
+
 def _abilita_modalità_raw():
     """
     Abilita cbreak su stdin per leggere ESC senza invio.
     Restituisce le vecchie impostazioni termios.
     """
+    import termios, tty   # solo interattivo: non serve (né esiste) senza terminale
     fd = sys.stdin.fileno()
     old = termios.tcgetattr(fd)
     tty.setcbreak(fd)
     return old
 
+
 def _ripristina_modalità(old):
     """
     Ripristina le impostazioni termios originali.
     """
+    import termios
     fd = sys.stdin.fileno()
     termios.tcsetattr(fd, termios.TCSADRAIN, old)
 
+
 def menu():
     """
     Mostra il menu di configurazione. Ritorna i parametri per il monitor.
@@ -124,6 +104,7 @@ def menu():
     includi_nascosti = False
     include_pats, exclude_pats = [], []
     file_log = None
+    motore = dict(DEFAULT_ENGINE)
 
     while True:
         print("\n" + "="*60)
@@ -138,9 +119,10 @@ def menu():
         print("7) Filtri avanzati (include/exclude)")
         print(f"8) File di log:             {file_log or 'stdout'}")
         print("9) Avvia monitoraggio")
+        print("o) Opzioni motore di scansione")
         print("0) Esci")
         print("-"*60)
-        scelta = input("Seleziona [0-9]: ").strip()
+        scelta = input("Seleziona [0-9,o]: ").strip().lower()
 
         if scelta == '1':
             p = input("   Inserisci directory da aggiungere: ").strip()
@@ -190,12 +172,16 @@ def menu():
             if not dirs:
                 print("   ! Aggiungi almeno una directory")
                 continue
-            return dirs, intervallo, ricorsivo, includi_nascosti, include_pats, exclude_pats, file_log
+            return (dirs, intervallo, ricorsivo, includi_nascosti, include_pats, exclude_pats,
+                    file_log, motore)
+        elif scelta == 'o':
+            submenu_motore(motore)
         elif scelta == '0':
             sys.exit(0)
         else:
             print("   ! Scelta non valida")
 
+
 def submenu_filtri(includes, excludes):
     """
     Sottomenu per gestire pattern glob di include/exclude.
@@ -239,60 +225,348 @@ def submenu_filtri(includes, excludes):
         else:
             print("    ! Scelta non valida")
 
+
+def submenu_motore(motore):
+    """
+    Sottomenu per le opzioni del motore di scansione (dict `motore`).
+    """
+    while True:
+        restat = motore['restat_files']
+        print("\n  > OPZIONI MOTORE DI SCANSIONE")
+        print(f"  a) Scansione incrementale (mtime directory): {'SÌ' if motore['incremental'] else 'NO'}")
+        print(f"  b) File ricontrollati per ciclo:             {restat if restat is not None else 'tutti'}")
+        print(f"  c) Thread di scansione parallela:            {motore['workers']}")
+        print(f"  d) Backend (auto/polling/inotify):           {motore['backend']}")
+        print(f"  e) File di stato (snapshot salvato):         {motore['state_file'] or 'nessuno'}")
+        print(f"  f) Coda di output piena (block/drop/coalesce): {motore['backpressure']}")
+        print(f"  g) File eventi JSON Lines:                   {motore['jsonl_file'] or 'nessuno'}")
+        print(f"  h) Intervalli adattivi per sottoalbero:      {'SÌ' if motore['adaptive'] else 'NO'}")
+        print(f"  i) Limiti adattivi (min/max):                "
+              f"{motore['min_interval']:.1f}s / {motore['max_interval']:.1f}s")
+        print(f"  j) Hash del contenuto dei file modificati:   {'SÌ' if motore['hashing'] else 'NO'}")
+        print(f"  k) Budget di I/O per l'hash per ciclo:       {motore['hash_budget_mb']} MB")
+        print(f"  l) Rilevamento di rinomine/spostamenti:      {'SÌ' if motore['renames'] else 'NO'}")
+        print(f"  m) Metriche per ciclo (tempi di scansione):  {'SÌ' if motore['metrics'] else 'NO'}")
+        print(f"  n) Porta HTTP delle metriche (Prometheus):   {motore['metrics_port'] or 'nessuna'}")
+        print(f"  o) Debounce (quiete / cicli stabili):        "
+              f"{motore['debounce']:.1f}s / {motore['stable_ticks']}")
+        print(f"  p) Scansione parziale (voci/ms per ciclo):   "
+              f"{motore['max_entries'] or '-'} / {motore['max_ms'] or '-'}")
+        print(f"  q) Processi di scansione (shard):            {motore['processes']}")
+        print(f"  r) Directory del giornale eventi:            {motore['journal_dir'] or 'nessuna'}")
+        print(f"  s) Segui le directory collegate (symlink):   {'SÌ' if motore['follow_symlinks'] else 'NO'}")
+        print(f"  t) Resta su un solo filesystem:              {'SÌ' if motore['same_fs'] else 'NO'}")
+        print(f"  u) Thread paralleli per dispositivo:         {motore['device_workers'] or 'nessun limite'}")
+        print(f"  v) Socket di controllo (modifiche a caldo):  {motore['control_socket'] or 'nessuno'}")
+        print("  x) Torna al menu principale")
+        sel = input("  Seleziona [a-v,x]: ").strip().lower()
+        if sel == 'a':
+            motore['incremental'] = not motore['incremental']
+        elif sel == 'b':
+            v = input("    File per ciclo (vuoto=tutti): ").strip()
+            if not v:
+                motore['restat_files'] = None
+            elif v.isdigit():
+                motore['restat_files'] = int(v)
+            else:
+                print("    ! Numero non valido")
+        elif sel == 'c':
+            v = input("    Numero di thread (1=sequenziale): ").strip()
+            if v.isdigit() and int(v) >= 1:
+                motore['workers'] = int(v)
+            else:
+                print("    ! Numero non valido")
+        elif sel == 'd':
+            ordine = ['auto', 'polling', 'inotify']
+            motore['backend'] = ordine[(ordine.index(motore['backend']) + 1) % len(ordine)]
+        elif sel == 'e':
+            v = input("    Percorso del file di stato (vuoto=nessuno): ").strip()
+            motore['state_file'] = os.path.expanduser(v) if v else None
+        elif sel == 'f':
+            ordine = ['block', 'drop', 'coalesce']
+            motore['backpressure'] = ordine[(ordine.index(motore['backpressure']) + 1) % len(ordine)]
+        elif sel == 'g':
+            v = input("    Percorso del file JSON Lines (vuoto=nessuno): ").strip()
+            motore['jsonl_file'] = os.path.expanduser(v) if v else None
+        elif sel == 'h':
+            motore['adaptive'] = not motore['adaptive']
+        elif sel == 'i':
+            try:
+                lo = float(input("    Intervallo minimo (s): "))
+                hi = float(input("    Intervallo massimo (s): "))
+                if lo <= 0 or hi < lo:
+                    raise ValueError
+                motore['min_interval'], motore['max_interval'] = lo, hi
+            except ValueError:
+                print("    ! Intervallo non valido")
+        elif sel == 'j':
+            motore['hashing'] = not motore['hashing']
+        elif sel == 'k':
+            v = input("    MB letti per ciclo: ").strip()
+            if v.isdigit() and int(v) >= 1:
+                motore['hash_budget_mb'] = int(v)
+            else:
+                print("    ! Numero non valido")
+        elif sel == 'l':
+            motore['renames'] = not motore['renames']
+        elif sel == 'm':
+            motore['metrics'] = not motore['metrics']
+        elif sel == 'n':
+            v = input("    Porta (vuoto=nessuna; solo 127.0.0.1): ").strip()
+            if not v:
+                motore['metrics_port'] = None
+            elif v.isdigit() and 0 < int(v) < 65536:
+                motore['metrics_port'] = int(v)
+                motore['metrics'] = True
+            else:
+                print("    ! Porta non valida")
+        elif sel == 'o':
+            try:
+                quiete = float(input("    Periodo di quiete (s, 0=nessuno): "))
+                cicli = int(input("    Cicli stabili prima di segnalare (0=nessuno): "))
+                if quiete < 0 or cicli < 0:
+                    raise ValueError
+                motore['debounce'], motore['stable_ticks'] = quiete, cicli
+            except ValueError:
+                print("    ! Valore non valido")
+        elif sel == 'p':
+            voci = input("    Voci per ciclo (vuoto=nessun limite): ").strip()
+            ms = input("    Millisecondi per ciclo (vuoto=nessun limite): ").strip()
+            if (voci and not voci.isdigit()) or (ms and not ms.isdigit()):
+                print("    ! Numero non valido")
+            else:
+                motore['max_entries'] = int(voci) if voci and int(voci) else None
+                motore['max_ms'] = int(ms) if ms and int(ms) else None
+        elif sel == 'q':
+            v = input("    Processi (1=nessuno shard): ").strip()
+            if v.isdigit() and int(v) >= 1:
+                motore['processes'] = int(v)
+            else:
+                print("    ! Numero non valido")
+        elif sel == 'r':
+            v = input("    Directory del giornale (vuoto=nessuna): ").strip()
+            motore['journal_dir'] = os.path.expanduser(v) if v else None
+        elif sel == 's':
+            motore['follow_symlinks'] = not motore['follow_symlinks']
+        elif sel == 't':
+            motore['same_fs'] = not motore['same_fs']
+        elif sel == 'u':
+            v = input("    Thread per dispositivo (vuoto=nessun limite): ").strip()
+            if not v:
+                motore['device_workers'] = None
+            elif v.isdigit() and int(v) >= 1:
+                motore['device_workers'] = int(v)
+            else:
+                print("    ! Numero non valido")
+        elif sel == 'v':
+            v = input("    Percorso del socket Unix (vuoto=nessuno): ").strip()
+            motore['control_socket'] = os.path.expanduser(v) if v else None
+        elif sel == 'x':
+            break
+        else:
+            print("    ! Scelta non valida")
+
+
+_ETICHETTE = {ADDED: "+Aggiunto   ", REMOVED: "-Rimosso   ", MODIFIED: "*Modificato ",
+              RENAMED: "~Rinominato "}
+
+
+def _formatta_evento(tipo_evento, base, rel, origine=None):
+    """
+    Messaggio di log di un evento (formattato dal thread di output).
+    `origine` è la coppia (base, percorso_relativo) di provenienza di una
+    voce rinominata.
+    """
+    return format_event(tipo_evento, base, rel, origine, _ETICHETTE)
+
+
+def _accoda_eventi(eventi, lotto):
+    """
+    Passa alla pipeline di output gli Event (dirpoll.watcher) di un ciclo.
+    """
+    if lotto:
+        eventi.submit([e.as_tuple() + (e.time,) for e in lotto])
+
+
+def _apri_output(motore):
+    """
+    Crea la pipeline degli eventi: log più file JSON Lines e giornale
+    degli eventi opzionali.
+    """
+    motore = motore or {}
+    sinks = [LogSink(_formatta_evento)]
+    if motore.get('jsonl_file'):
+        try:
+            sinks.append(JsonLinesSink(motore['jsonl_file']))
+        except OSError as exc:
+            logging.warning(f"Output JSON Lines disattivato: {exc}")
+    if motore.get('journal_dir'):
+        try:
+            sinks.append(JournalSink(motore['journal_dir'],
+                                     motore.get('journal_segment_mb', 64) << 20,
+                                     motore.get('journal_keep')))
+        except OSError as exc:
+            logging.warning(f"Giornale degli eventi disattivato: {exc}")
+    return EventPipeline(sinks, policy=motore.get('backpressure', 'block'))
+
+
+def _registra_pianificazione(watcher):
+    """
+    Registra nel log la pianificazione per sottoalbero del backend adattivo.
+    """
+    for st in watcher.schedule() or ():
+        logging.info(f"[{st['base']}] {st['subtree']}: ogni {st['interval']:.2f}s, "
+                     f"{st['changes']}/{st['scans']} scansioni con modifiche, "
+                     f"media {st['avg_cost'] * 1000:.1f} ms")
+
+
+def _ricarica_config(watcher, config):
+    """
+    Applica al watcher in esecuzione le directory e i pattern del file
+    di configurazione (SIGHUP).
+    """
+    if not config:
+        logging.warning("SIGHUP ignorato: nessun file di configurazione (-c) da ricaricare")
+        return
+    try:
+        nuova = cli.reload_config(config)
+    except cli.ConfigError as exc:
+        logging.warning(f"Ricaricamento fallito, configurazione invariata: {exc}")
+        return
+    logging.info(f"Ricaricamento di {config}")
+    watcher.reconfigure(nuova.get('dirs'), nuova.get('include'), nuova.get('exclude'))
+    logging.info(f"Directory: {', '.join(str(p) for p in watcher.paths)}")
+    logging.info(f"Include patterns: {watcher.include or '---'}")
+    logging.info(f"Exclude patterns: {watcher.exclude or '---'}")
+
+
 def ciclo_monitoring(paths, intervallo, ricorsivo, includi_nascosti,
-                     include_pats, exclude_pats, file_log):
+                     include_pats, exclude_pats, file_log, motore=None, interattivo=True,
+                     config=None):
     """
     Loop di monitoraggio. Premere ESC per interrompere e tornare al menu.
+    Con interattivo=False stdin non viene toccato e il loop si ferma con
+    SIGTERM/SIGINT, mentre SIGHUP ricarica `config` (il file di
+    configurazione).
     """
     imposta_logging(file_log)
-    logging.info("==== Monitor avviato (premere ESC per tornare) ====")
+    if interattivo:
+        logging.info("==== Monitor avviato (premere ESC per tornare) ====")
+    else:
+        logging.info("==== Monitor avviato (SIGTERM per fermare) ====")
     logging.info(f"Directory: {', '.join(str(p) for p in paths)}")
     logging.info(f"Intervallo: {intervallo}s | Ricorsivo: {ricorsivo} | Nascosti: {includi_nascosti}")
     logging.info(f"Include patterns: {include_pats or '---'}")
     logging.info(f"Exclude patterns: {exclude_pats or '---'}")
+    if motore:
+        logging.info(f"Motore: {motore}")
 
-    old_attrs = _abilita_modalità_raw()
-    snapshot_vecchio = scansiona_directory(paths, ricorsivo, includi_nascosti,
-                                           include_pats, exclude_pats)
+    watcher = Watcher(paths, intervallo, ricorsivo, includi_nascosti,
+                      include_pats, exclude_pats, motore)
+    # snapshot salvato dall'esecuzione precedente, se presente
+    if watcher.load_state():
+        logging.info(f"Stato: caricate {watcher.state_loaded} voci da {watcher.state_file} "
+                     f"(salvato {time.ctime(watcher.state_saved['saved_at'])})")
+    elif watcher.state_error is not None:
+        logging.info(f"Stato: avvio senza {watcher.state_file} ({watcher.state_error})")
+    watcher.start()
+    backend = watcher.backend
+    logging.info(f"Backend: {backend.name}" + (f" ({backend.reason})" if backend.reason else ""))
+    if interattivo and hasattr(backend, 'stats'):
+        logging.info("Premere 's' per mostrare la pianificazione per sottoalbero.")
+    eventi = _apri_output(motore)
+    if interattivo:
+        old_attrs, attesa = _abilita_modalità_raw(), [sys.stdin]
+    else:
+        fd_stop, ripristina_segnali = cli.stop_signals(cli.STOP_SIGNALS + cli.RELOAD_SIGNALS)
+        attesa = [fd_stop]
     try:
+        offline = watcher.open()
+        if watcher.state_saved is not None:
+            logging.info(f"Modifiche durante l'arresto: {len(offline)}")
+            _accoda_eventi(eventi, offline)
         while True:
-            pronto, _, _ = select.select([sys.stdin], [], [], intervallo)
-            if pronto:
+            pronto, _, _ = select.select(attesa + watcher.fds(), [], [], watcher.timeout())
+            if not interattivo and fd_stop in pronto:
+                if cli.received(fd_stop) - set(cli.RELOAD_SIGNALS):
+                    logging.info("Segnale ricevuto: arresto.")
+                    break
+                _ricarica_config(watcher, config)
+            if interattivo and sys.stdin in pronto:
                 ch = sys.stdin.read(1)
                 if ch == '\x1b':  # ESC
                     logging.info("ESC premuto: ritorno al menu.")
                     break
+                if ch == 's':
+                    _registra_pianificazione(watcher)
 
-            snapshot_nuovo = scansiona_directory(paths, ricorsivo, includi_nascosti,
-                                                 include_pats, exclude_pats)
-            aggiunti, rimossi, modificati = confronta_snapshot(snapshot_vecchio, snapshot_nuovo)
-
-            for k in sorted(aggiunti):
-                base, rel = k.split("|", 1)
-                tipo = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] +Aggiunto   {tipo}: {rel.rstrip('/')}")
-            for k in sorted(rimossi):
-                base, rel = k.split("|", 1)
-                tipo = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] -Rimosso   {tipo}: {rel.rstrip('/')}")
-            for k in sorted(modificati):
-                base, rel = k.split("|", 1)
-                tipo = "DIR" if rel.endswith("/") else "FILE"
-                logging.info(f"[{base}] *Modificato {tipo}: {rel.rstrip('/')}")
-
-            snapshot_vecchio = snapshot_nuovo
+            watcher.step(pronto, lambda lotto: _accoda_eventi(eventi, lotto))
 
     finally:
-        _ripristina_modalità(old_attrs)
+        if interattivo:
+            _ripristina_modalità(old_attrs)
+        else:
+            ripristina_segnali()
+        _accoda_eventi(eventi, watcher.flush())   # eventi ancora trattenuti dal debounce
+        watcher.close()
+        eventi.close()
+        if watcher.metrics is not None:
+            logging.info(watcher.metrics.summary())
         logging.info("==== Monitor arrestato ====")
 
-def main():
+
+def esegui_una_volta(paths, ricorsivo, includi_nascosti, include_pats, exclude_pats,
+                     motore, aggiorna_stato=False):
+    """
+    Stampa le modifiche tra il file di stato salvato e le directory
+    attuali, una riga per evento, ed esce. Restituisce il codice di
+    uscita: 0 se nulla è cambiato, 1 se qualcosa è cambiato, 2 se il file
+    di stato non è utilizzabile. Con aggiorna_stato un file di stato
+    mancante viene creato (codice 0).
+    """
+    # con gli mtime salvati una scansione incrementale rilegge solo ciò
+    # che è cambiato; niente watch, thread, pianificazione, passate parziali
+    # o processi worker per una sola scansione
+    watcher = Watcher(paths, 0, ricorsivo, includi_nascosti, include_pats, exclude_pats,
+                      dict(motore, backend='polling', adaptive=False, hashing=False,
+                           max_entries=None, max_ms=None, processes=1))
+    try:
+        if not watcher.load_state() and not (aggiorna_stato
+                                             and not os.path.exists(watcher.state_file)):
+            print(f"{watcher.state_file}: {watcher.state_error}", file=sys.stderr)
+            return 2
+        # (senza file di stato: la prima esecuzione salva il riferimento)
+        modifiche = watcher.open()
+        if modifiche:
+            print('\n'.join(_formatta_evento(*e.as_tuple()) for e in modifiche))
+        if aggiorna_stato:
+            watcher.save()
+    finally:
+        watcher.close(save=False)
+    return 1 if modifiche else 0
+
+
+def main(argv=None):
     """
     Ciclo principale: mostra menu e avvia il monitor finché non si esce.
+    Con argomenti, esegue senza menu (vedi dirpoll.cli).
     """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        opz = cli.parse_args(argv)
+        if opz['once']:
+            return esegui_una_volta(opz['dirs'], opz['recursive'], opz['include_hidden'],
+                                    opz['include'], opz['exclude'], opz['engine'],
+                                    opz['update_state'])
+        ciclo_monitoring(opz['dirs'], opz['interval'], opz['recursive'],
+                         opz['include_hidden'], opz['include'], opz['exclude'],
+                         opz['log_file'], opz['engine'], interattivo=False,
+                         config=opz['config'])
+        return 0
     while True:
         params = menu()
         ciclo_monitoring(*params)
 
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
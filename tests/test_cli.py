@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Config file validation of the headless command line.
+
+    python3 -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll import cli
+
+
+class ConfigTypesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="dirpoll-test-")
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'cfg.json')
+
+    def load(self, cfg):
+        with open(self.path, 'w', encoding='utf-8') as fh:
+            json.dump(cfg, fh)
+        return cli.load_config(self.path)
+
+    def test_bad_values_name_the_key(self):
+        cases = [
+            ({'dirs': '/srv'}, "dirs must be a list of strings"),
+            ({'interval': '2'}, "interval must be a number"),
+            ({'recursive': 1}, "recursive must be true or false"),
+            ({'engine': {'workers': 2.5}}, "engine.workers must be an integer"),
+            ({'engine': {'state_file': 3}}, "engine.state_file must be a string or null"),
+            ({'engine': {'backend': 'kqueue'}}, "engine.backend must be one of"),
+        ]
+        for cfg, message in cases:
+            with self.subTest(cfg=cfg):
+                with self.assertRaises(cli.ConfigError) as ctx:
+                    self.load(cfg)
+                self.assertIn(message, str(ctx.exception))
+
+    def test_valid_values(self):
+        cfg = {'dirs': [self.tmp], 'interval': 2, 'log_file': None,
+               'engine': {'min_interval': 1, 'max_ms': None, 'backend': 'polling'}}
+        self.assertEqual(self.load(cfg), cfg)
+
+
+if __name__ == '__main__':
+    unittest.main()
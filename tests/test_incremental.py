@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental scanning must report what a full scan reports.
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import select
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dirpoll import scanner
+from dirpoll.diff import MODIFIED
+from dirpoll.incremental import IncrementalScanner
+from dirpoll.watcher import Watcher
+
+
+def _collect(watcher, seconds=2.0):
+    events = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end and not events:
+        ready = select.select(watcher.fds(), [], [], min(watcher.timeout(), 0.1))[0]
+        events += watcher.step(ready)
+    return events
+
+
+class SubdirMetadataTest(unittest.TestCase):
+    """
+    A chmod of a descended subdirectory changes only its ctime.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dirpoll-test-")
+        os.makedirs(os.path.join(self.root, 'a', 'sub'))
+        Path(self.root, 'a', 'sub', 'f').touch()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_index_matches_full_scan(self):
+        inc = IncrementalScanner([self.root], True, False)
+        inc.scan()
+        os.chmod(os.path.join(self.root, 'a', 'sub'), 0o700)
+        snap = inc.scan()
+        full = scanner.scan([self.root], True, False)
+        key = (inc.bases[0], 'a/')
+        chunk, ref = snap.dirs[key], full.dirs[key]
+        i = chunk.names.index('sub')
+        self.assertEqual(chunk.sig(i), ref.sig(ref.names.index('sub')))
+
+    def test_engines_report_modified_dir(self):
+        engines = [{'backend': 'polling'},
+                   {'backend': 'polling', 'incremental': True},
+                   {'backend': 'polling', 'adaptive': True, 'min_interval': 0.05}]
+        for engine in engines:
+            with self.subTest(engine=engine):
+                sub = os.path.join(self.root, 'a', 'sub')
+                os.chmod(sub, 0o755)
+                with Watcher([self.root], 0.05, True, engine=engine) as w:
+                    w.open()
+                    os.chmod(sub, 0o700)
+                    events = _collect(w)
+                self.assertEqual([(e.kind, e.rel) for e in events], [(MODIFIED, 'a/sub/')])
+
+
+if __name__ == '__main__':
+    unittest.main()
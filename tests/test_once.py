@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Headless one-shot diff (--once) of both front-ends.
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dirpoll.watcher import Watcher
+
+SCRIPTS = ('main_eng.py', 'main_ita.py')
+
+
+class OnceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="dirpoll-test-")
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.tree = os.path.join(self.tmp, 'tree')
+        os.makedirs(os.path.join(self.tree, 'sub'))
+        Path(self.tree, 'sub', 'a.txt').touch()
+        self.state = os.path.join(self.tmp, 'state')
+
+    def once(self, script, *args):
+        cmd = [sys.executable, str(ROOT / script), '--once', '-r', self.tree,
+               '--state-file', self.state] + list(args)
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=60)
+
+    def baseline(self):
+        with Watcher([self.tree], 0, True, engine={'state_file': self.state}) as w:
+            w.open()
+        self.assertTrue(os.path.exists(self.state))
+
+    def test_update_state_creates_baseline(self):
+        for script in SCRIPTS:
+            with self.subTest(script=script):
+                if os.path.exists(self.state):
+                    os.remove(self.state)
+                proc = self.once(script)
+                self.assertEqual(proc.returncode, 2)
+                self.assertFalse(os.path.exists(self.state))
+                proc = self.once(script, '--update-state')
+                self.assertEqual(proc.returncode, 0, proc.stderr)
+                self.assertEqual(proc.stdout, '')
+                self.assertTrue(os.path.exists(self.state))
+                Path(self.tree, 'new.txt').touch()
+                proc = self.once(script, '--update-state')
+                os.remove(os.path.join(self.tree, 'new.txt'))
+                self.assertEqual(proc.returncode, 1, proc.stderr)
+                self.assertIn('new.txt', proc.stdout)
+
+    def test_partial_options_still_report(self):
+        for script in SCRIPTS:
+            for option in (['--max-entries', '1'], ['--max-ms', '1']):
+                with self.subTest(script=script, option=option):
+                    self.baseline()
+                    Path(self.tree, 'sub', 'new.txt').touch()
+                    proc = self.once(script, *option)
+                    os.remove(os.path.join(self.tree, 'sub', 'new.txt'))
+                    self.assertEqual(proc.returncode, 1, proc.stderr)
+                    self.assertIn('new.txt', proc.stdout)
+
+    def test_processes_do_not_shard(self):
+        for script in SCRIPTS:
+            with self.subTest(script=script):
+                self.baseline()
+                Path(self.tree, 'sub', 'new.txt').touch()
+                proc = self.once(script, '--processes', '2')
+                os.remove(os.path.join(self.tree, 'sub', 'new.txt'))
+                self.assertEqual(proc.returncode, 1, proc.stderr)
+                self.assertIn('new.txt', proc.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()